@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 模式下的协程接口（由 asgi.py 注册，优先于 Flask 的同名路由）
+流式查询在等待模型输出期间不占用线程，任务状态查询支持长轮询；
+请求参数和返回格式与 Flask 接口一致
+"""
+import json
+import time
+import asyncio
+import logging
+from starlette.routing import Route
+from starlette.responses import JSONResponse, StreamingResponse
+
+from utils.lazy_import import lazy_import
+from utils.sse import get_stream_mode, is_compact, asse_stream, sse_media_type, SSE_HEADERS
+from utils.prompts import get_plan_query_messages, get_stream_query_messages
+from config.settings import ASYNC_SERVER_CONFIG
+from objs.FileManager import get_file_manager
+from objs.ClientRegistry import get_async_http_client
+from objs.RateLimiter import get_rate_limiter
+from apis.api_ra_check import api_ra_check, load_auditor_from_cache, CACHE_DIR, OLLAMA_BASE
+from db import AsyncTaskDAO
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+httpx = lazy_import("httpx")
+
+# 任务结束状态，长轮询遇到时立即返回
+TERMINAL_STATUSES = ('success', 'failed')
+
+
+def _stream(events, stream_mode):
+    return StreamingResponse(asse_stream(events, stream_mode), media_type=sse_media_type(stream_mode),
+                             headers=SSE_HEADERS)
+
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+async def query_plan(request):
+    """查询方案内容（/ra_check/query）"""
+    try:
+        data = await _read_json(request) or {}
+        plan_id = data.get('plan_id')
+        query = data.get('query')
+        top_k = data.get('top_k', 5)
+        stream = data.get('stream', False)
+        stream_mode = get_stream_mode(data.get('stream_mode'))
+
+        if not plan_id or not query:
+            return JSONResponse({'status': 'error', 'message': '缺少必要参数'}, 400)
+
+        # 从缓存中获取auditor
+        if not hasattr(api_ra_check, 'auditor_cache') or plan_id not in api_ra_check.auditor_cache:
+            return JSONResponse({'status': 'error', 'message': '方案未找到，请先上传方案'}, 404)
+
+        auditor = api_ra_check.auditor_cache[plan_id]
+
+        if not stream:
+            results = await auditor.asearch_similar_chunks(query, top_k)
+            return JSONResponse({'status': 'success', 'results': results}, 200)
+
+        async def generate_stream_response():
+            try:
+                yield {'type': 'start', 'message': '开始查询...'}
+
+                similar_chunks = await auditor.asearch_similar_chunks(query, top_k)
+                yield {'type': 'progress', 'message': f'找到 {len(similar_chunks)} 个相关文本块，正在生成回复...'}
+
+                context = "\n\n".join(chunk.get('text', '') for chunk in similar_chunks)
+                messages = get_plan_query_messages(query, context)
+
+                yield {'type': 'generation_start', 'message': '正在生成回复...'}
+
+                full_response = ""
+                async for token in auditor.embedder.agenerate_text_stream(messages, model='qwen2.5:7b'):
+                    full_response += token
+                    yield {'type': 'token', 'content': token}
+
+                complete = {'type': 'complete', 'message': '生成完成', 'context_chunks_count': len(similar_chunks)}
+                if not is_compact(stream_mode):
+                    complete['full_response'] = full_response
+                yield complete
+
+            except Exception as e:
+                logger.error(f"流式查询发生错误: {str(e)}")
+                yield {'type': 'error', 'message': f'查询发生错误: {str(e)}'}
+
+        return _stream(generate_stream_response(), stream_mode)
+
+    except Exception as e:
+        logger.error(f"查询时发生错误: {str(e)}")
+        return JSONResponse({'status': 'error', 'message': f'查询时发生错误: {str(e)}'}, 500)
+
+
+async def stream_query(request):
+    """基于检索增强的流式查询接口（/ra_check/stream_query）"""
+    try:
+        data = await request.json()
+        plan_id = data.get('plan_id')
+        query = data.get('query')
+        top_k = data.get('top_k', 5)
+        model_name = data.get('model', 'qwen2.5:7b')
+        stream_mode = get_stream_mode(data.get('stream_mode'))
+
+        if not plan_id or not query:
+            return JSONResponse({'status': 'error', 'message': '缺少必要参数'}, 400)
+    except Exception as e:
+        return JSONResponse({'status': 'error', 'message': f'请求解析错误: {str(e)}'}, 400)
+
+    async def generate_stream_response():
+        try:
+            yield {'type': 'start', 'message': '开始查询...'}
+
+            # 加载auditor（读取缓存文件，在线程池中执行）
+            yield {'type': 'progress', 'message': '加载文档缓存...'}
+            auditor = await asyncio.to_thread(load_auditor_from_cache, plan_id)
+
+            if not auditor:
+                yield {'type': 'error', 'message': '方案未找到或加载失败'}
+                return
+
+            file_info = await asyncio.to_thread(get_file_manager(CACHE_DIR).get_file_info, plan_id)
+            filename = file_info.get('original_filename', 'unknown') if file_info else 'unknown'
+            yield {'type': 'info', 'message': f'已加载文档: {filename} ({len(auditor.chunks)} 个文本块)'}
+
+            yield {'type': 'progress', 'message': '正在检索相关内容...'}
+            similar_chunks = await auditor.asearch_similar_chunks(query, top_k)
+            yield {'type': 'progress', 'message': f'找到 {len(similar_chunks)} 个相关文本块，正在生成回复...'}
+
+            context = "\n\n".join(chunk.get('text', '') for chunk in similar_chunks)
+            payload = {
+                "model": model_name,
+                "messages": get_stream_query_messages(query, context),
+                "stream": True
+            }
+
+            try:
+                # 流式生成期间占用该模型的调用名额（与同步接口共享）
+                async with get_rate_limiter(OLLAMA_BASE, model_name).async_slot(stream=True):
+                    client = get_async_http_client(OLLAMA_BASE)
+                    async with client.stream("POST", f"{OLLAMA_BASE}/api/chat", json=payload) as response:
+                        response.raise_for_status()
+
+                        yield {'type': 'generation_start', 'message': '正在生成回复...'}
+
+                        full_response = ""
+                        async for line in response.aiter_lines():
+                            if not line:
+                                continue
+                            try:
+                                chunk_data = json.loads(line)
+                            except json.JSONDecodeError:
+                                continue
+                            if 'message' in chunk_data and 'content' in chunk_data['message']:
+                                content = chunk_data['message']['content']
+                                full_response += content
+                                yield {'type': 'token', 'content': content}
+
+                            if chunk_data.get('done', False):
+                                complete = {'type': 'complete', 'message': '生成完成', 'context_chunks_count': len(similar_chunks)}
+                                if not is_compact(stream_mode):
+                                    complete['full_response'] = full_response
+                                yield complete
+                                break
+
+            except httpx.HTTPError as e:
+                yield {'type': 'error', 'message': f'调用模型API失败: {str(e)}'}
+                return
+            except Exception as e:
+                yield {'type': 'error', 'message': f'生成过程中发生错误: {str(e)}'}
+                return
+
+        except Exception as e:
+            logger.error(f"流式查询发生错误: {str(e)}")
+            yield {'type': 'error', 'message': f'查询发生错误: {str(e)}'}
+
+    return _stream(generate_stream_response(), stream_mode)
+
+
+async def get_task_status(request):
+    """
+    查询异步任务状态（结构/内容/引用检查共用）
+    wait=N 时长轮询：任务状态不同于 since（默认为首次查询到的状态）或已结束时返回，最多等待 N 秒
+    """
+    task_id = request.path_params['task_id']
+    try:
+        wait = min(max(float(request.query_params.get('wait') or 0), 0.0), ASYNC_SERVER_CONFIG.max_wait)
+    except ValueError:
+        wait = 0.0
+    since = request.query_params.get('since')
+    deadline = time.monotonic() + wait
+
+    try:
+        while True:
+            task = await asyncio.to_thread(AsyncTaskDAO.get_task_by_id, task_id)
+            if not task:
+                return JSONResponse({'code': 404, 'message': '任务不存在', 'data': None}, 404)
+
+            since = since or task.status
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or task.status != since or task.status in TERMINAL_STATUSES:
+                return JSONResponse({'code': 200, 'message': 'success', 'data': task.to_dict()}, 200)
+
+            await asyncio.sleep(min(ASYNC_SERVER_CONFIG.status_poll, remaining))
+
+    except Exception as e:
+        logger.error(f"查询任务状态失败: {str(e)}")
+        return JSONResponse({'code': 500, 'message': f'查询失败: {str(e)}', 'data': None}, 500)
+
+
+routes = [
+    Route('/ra_check/query', query_plan, methods=['POST']),
+    Route('/ra_check/stream_query', stream_query, methods=['POST']),
+    Route('/async_structure_check/status/{task_id}', get_task_status, methods=['GET']),
+    Route('/async_content_check/status/{task_id}', get_task_status, methods=['GET']),
+    Route('/async_cite_check/status/{task_id}', get_task_status, methods=['GET']),
+]
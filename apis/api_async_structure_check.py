@@ -6,16 +6,20 @@ import os
 import json
 import logging
 import threading
-import requests
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flasgger import swag_from
 from werkzeug.utils import secure_filename
-from docx import Document
+from utils.lazy_import import lazy_import
+from utils.context_packer import pack_context, context_budget, format_with_similarity
 
 # 导入现有的工具类和方法
 from objs.PlanAuditor import PlanAuditor
 from objs.FileManager import FileManager
+from objs.ReauditPlanner import ReauditPlanner
+from objs.CacheGC import pinning
+from objs.CallbackDispatcher import get_callback_dispatcher
+from utils.results import get_callback_mode, compact_result, result_response, read_callback_json
 from utils.prompts import CONSTRUCTION_EXPERT_SYSTEM
 
 # 导入数据库模块
@@ -36,6 +40,9 @@ api_async_structure_check = Blueprint('api_async_structure_check', __name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 首次使用时才导入的模块
+docx = lazy_import("docx")
+
 # 全局配置
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'docx', 'doc', 'txt', 'pdf', 'json', 'jsonl'}
@@ -72,7 +79,7 @@ def allowed_file(filename):
 def extract_text_from_docx(file_path):
     """从docx文件提取文本，增加错误处理"""
     try:
-        doc = Document(file_path)
+        doc = docx.Document(file_path)
         text_content = []
         
         # 提取段落文本
@@ -117,8 +124,8 @@ def extract_text_from_docx(file_path):
         logger.error(f"提取docx文件文本时发生错误: {str(e)}")
         raise ValueError(f"无法提取docx文件内容: {str(e)}")
 
-def send_callback(callback_url, task_id, status, data=None, error_message=None):
-    """发送回调请求并更新数据库状态"""
+def send_callback(callback_url, task_id, status, data=None, error_message=None, callback_mode=None):
+    """更新数据库状态并将回调加入发送队列"""
     try:
         # 1. 先更新数据库状态
         try:
@@ -142,7 +149,13 @@ def send_callback(callback_url, task_id, status, data=None, error_message=None):
         except Exception as db_error:
             logger.error(f"更新数据库状态失败: {str(db_error)}, 任务ID: {task_id}")
         
-        # 2. 准备回调数据
+        # 2. 准备回调数据（summary 模式的成功回调只携带汇总、结果地址和 ETag，明细由接收方分页获取；
+        #    结果未能保存到数据库时仍发送完整结果）
+        if status == "success" and data and get_callback_mode(callback_mode) == "summary":
+            stored = StructureCheckDAO.get_check_result(task_id)
+            if stored:
+                data = compact_result(stored, 'check_results', f'/async_structure_check/result/{task_id}')
+        
         callback_data = {
             "task_id": task_id,
             "status": status,  # "success", "failed", "processing"
@@ -151,24 +164,9 @@ def send_callback(callback_url, task_id, status, data=None, error_message=None):
             "error_message": error_message
         }
         
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        
-        logger.info(f"发送回调到: {callback_url}, 任务ID: {task_id}, 状态: {status}")
-        
-        # 3. 发送POST请求到回调接口
-        response = requests.post(
-            callback_url, 
-            json=callback_data, 
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            logger.info(f"回调发送成功，任务ID: {task_id}")
-        else:
-            logger.warning(f"回调发送失败，状态码: {response.status_code}, 任务ID: {task_id}")
+        # 3. 写入回调发件箱，由后台投递（失败按退避重试，不阻塞当前工作线程）
+        get_callback_dispatcher().enqueue(task_id, callback_url, callback_data)
+        logger.info(f"回调已加入发送队列: {callback_url}, 任务ID: {task_id}, 状态: {status}")
             
     except Exception as e:
         logger.error(f"发送回调时发生错误: {str(e)}, 任务ID: {task_id}")
@@ -184,11 +182,12 @@ def async_structure_check_worker(task_params):
         # 发送处理中状态回调
         send_callback(callback_url_full, task_id, "processing", {"message": "开始执行结构完整性检查"})
         
-        # 执行结构完整性检查
-        result = perform_structure_check_internal(task_params)
+        # 执行结构完整性检查（执行期间固定所用方案的缓存，避免被缓存回收淘汰）
+        with pinning():
+            result = perform_structure_check_internal(task_params)
         
         # 发送成功回调
-        send_callback(callback_url_full, task_id, "success", result)
+        send_callback(callback_url_full, task_id, "success", result, callback_mode=task_params.get('callback_mode'))
         
         logger.info(f"结构检查完成，任务ID: {task_id}")
         
@@ -253,7 +252,8 @@ def perform_structure_check_internal(task_params):
             openai_api_key=openai_api_key,
             openai_api_base=openai_api_base,
             cache_dir=CACHE_DIR,
-            original_filename=document_filename
+            original_filename=document_filename,
+            scheme_id=scheme_id
         )
         
         # 清理可能的缓存冲突，强制重新构建嵌入向量
@@ -291,11 +291,22 @@ def perform_structure_check_internal(task_params):
     except Exception as e:
         raise Exception(f'文档处理失败: {str(e)}')
     
+    # 差异复审：检索证据与基准任务一致的检查项直接复用基准结果
+    planner = None
+    base_task_id = task_params.get('base_task_id')
+    if base_task_id:
+        planner = ReauditPlanner.create(
+            auditor, base_task_id, StructureCheckDAO.get_check_result(base_task_id),
+            results_field='check_results', key_field='item_id', status_field='completeness_status'
+        )
+        if planner is None:
+            logger.warning(f"基准任务 {base_task_id} 的结果或方案缓存不可用，全部检查项重新检查")
+    
     # 根据检查模式进行结构完整性检查
     if check_mode == 'item_by_item':
-        check_results = perform_item_by_item_structure_check(toc_items, auditor, chat_model, top_k)
+        check_results = perform_item_by_item_structure_check(toc_items, auditor, chat_model, top_k, planner)
     else:  # chapter_by_chapter
-        check_results = perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, top_k)
+        check_results = perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, top_k, planner)
     
     # 计算统计信息
     total_items = len(check_results)
@@ -313,9 +324,11 @@ def perform_structure_check_internal(task_params):
             'missing_items': missing_items,
             'partial_items': partial_items,
             'failed_checks': failed_checks,
-            'completeness_rate': round(completeness_rate, 2)
+            'completeness_rate': round(completeness_rate, 2),
+            'reused_items': planner.reused_count if planner else 0
         },
         'check_results': check_results,
+        'base_task_id': base_task_id,
         'check_mode': check_mode,
         'toc_list_filename': toc_list_filename,
         'document_filename': document_filename,
@@ -401,9 +414,11 @@ def async_structure_check():
         # 获取参数
         check_mode = request.form.get('check_mode', 'chapter_by_chapter')
         callback_base_url = request.form.get('callback_base_url', DEFAULT_CALLBACK_BASE_URL)
+        callback_mode = get_callback_mode(request.form.get('callback_mode'))
         embedding_model = request.form.get('embedding_model', 'nomic-embed-text:latest')
         chat_model = request.form.get('chat_model', 'qwen2.5:32b')
         top_k = int(request.form.get('top_k', 5))
+        base_task_id = request.form.get('base_task_id') or None
         openai_api_key = request.form.get('openai_api_key', 'ollama')
         openai_api_base = request.form.get('openai_api_base', 'http://59.77.7.24:11434/v1/')
         
@@ -444,7 +459,9 @@ def async_structure_check():
                 'top_k': top_k,
                 'toc_list_filename': toc_list_filename,
                 'document_filename': document_filename,
-                'callback_base_url': callback_base_url
+                'callback_base_url': callback_base_url,
+                'base_task_id': base_task_id,
+                'callback_mode': callback_mode
             }
             
             task = AsyncTaskDAO.create_task(
@@ -515,6 +532,8 @@ def async_structure_check():
             'embedding_model': embedding_model,
             'chat_model': chat_model,
             'top_k': top_k,
+            'base_task_id': base_task_id,
+            'callback_mode': callback_mode,
             'openai_api_key': openai_api_key,
             'openai_api_base': openai_api_base,
             'timestamp': timestamp
@@ -665,11 +684,7 @@ def get_check_result(task_id):
                 'data': None
             }), 404
         
-        return jsonify({
-            'code': 200,
-            'message': 'success',
-            'data': result
-        }), 200
+        return result_response(result, 'check_results')
         
     except Exception as e:
         logger.error(f"获取检查结果失败: {str(e)}")
@@ -754,8 +769,8 @@ def list_tasks():
         }), 500
 
 # 导入现有的结构检查辅助函数
-def perform_item_by_item_structure_check(toc_items, auditor, chat_model, top_k):
-    """逐条检查模式"""
+def perform_item_by_item_structure_check(toc_items, auditor, chat_model, top_k, planner=None):
+    """逐条检查模式，传入 planner 时证据未变化的项目复用基准任务结果"""
     results = []
     
     for i, item in enumerate(toc_items):
@@ -772,21 +787,30 @@ def perform_item_by_item_structure_check(toc_items, auditor, chat_model, top_k):
             
             # 检索相关文档片段
             try:
-                similar_chunks_results = auditor.search_similar_chunks(search_query, top_k=top_k)
+                if planner:
+                    similar_chunks_results, unchanged = planner.search(search_query, top_k)
+                    reused_result = planner.reuse(
+                        str(i + 1), {'chapter': chapter, 'name': name}
+                    ) if unchanged else None
+                    if reused_result:
+                        results.append(reused_result)
+                        continue
+                else:
+                    similar_chunks_results = auditor.search_similar_chunks(search_query, top_k=top_k)
                 
                 # 过滤相似度低的结果
                 similar_chunks = []
                 for result in similar_chunks_results:
                     if result['similarity'] > 0.1:
-                        similar_chunks.append((result['text'], result['similarity']))
+                        similar_chunks.append(result)
                 
-                # 构建证据文本
+                # 构建证据文本（最多3个相关片段，按 token 预算选取）
                 evidence_text = ""
                 if similar_chunks:
-                    evidence_chunks = []
-                    for chunk, similarity in similar_chunks:
-                        evidence_chunks.append(f"相关度{similarity:.3f}: {chunk}")
-                    evidence_text = '\n'.join(evidence_chunks[:3])  # 最多3个相关片段
+                    evidence_text = pack_context(
+                        similar_chunks[:3], context_budget(chat_model, search_query),
+                        formatter=format_with_similarity
+                    )
                 
                 # 使用AI分析结构完整性
                 if ai_applicable == '是' and evidence_text:
@@ -834,8 +858,8 @@ def perform_item_by_item_structure_check(toc_items, auditor, chat_model, top_k):
     
     return results
 
-def perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, top_k):
-    """逐章节检查模式"""
+def perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, top_k, planner=None):
+    """逐章节检查模式，传入 planner 时证据未变化的章节整章复用基准任务结果"""
     results = []
     
     # 按章节分组
@@ -872,10 +896,27 @@ def perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, t
                 logger.debug(f"FAISS索引维度: {auditor.faiss_index.d if hasattr(auditor.faiss_index, 'd') else 'unknown'}")
                 
                 search_top_k = min(top_k * 3, 20)
+                
+                # 差异复审：章节证据未变化时整章复用基准结果
+                planner_results = None
+                if planner:
+                    planner_results, unchanged = planner.search(chapter_query, search_top_k)
+                    reused_results = planner.reuse_group([
+                        (str(i + 1), {'chapter': item.get('章节', ''), 'name': item.get('名称', '')})
+                        for i, item in chapter_items
+                    ]) if unchanged else None
+                    if reused_results:
+                        logger.info(f"章节 {chapter_prefix} 证据未变化，复用基准任务结果")
+                        results.extend(reused_results)
+                        continue
+                
                 logger.debug(f"调用search_similar_chunks，查询长度: {len(chapter_query)}, top_k={search_top_k}")
                 
                 try:
-                    similar_chunks_results = auditor.search_similar_chunks(chapter_query, top_k=search_top_k)
+                    if planner_results is not None:
+                        similar_chunks_results = planner_results
+                    else:
+                        similar_chunks_results = auditor.search_similar_chunks(chapter_query, top_k=search_top_k)
                 except Exception as search_error:
                     if "assert d == self.d" in str(search_error) or "AssertionError" in str(search_error):
                         logger.error(f"向量维度不匹配错误，强制重新初始化auditor")
@@ -895,7 +936,8 @@ def perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, t
                             openai_api_key=openai_api_key,
                             openai_api_base=openai_api_base,
                             cache_dir=scheme_cache_dir,
-                            original_filename=document_filename
+                            original_filename=document_filename,
+                            scheme_id=auditor.scheme_id
                         )
                         
                         # 重新构建索引
@@ -924,7 +966,7 @@ def perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, t
                         try:
                             if isinstance(result, dict) and 'similarity' in result and 'text' in result:
                                 if result['similarity'] > 0.1:
-                                    similar_chunks.append((result['text'], result['similarity']))
+                                    similar_chunks.append(result)
                             else:
                                 logger.warning(f"章节 {chapter_prefix} 第{idx}个检索结果格式异常: {type(result)} - {result}")
                         except Exception as result_error:
@@ -932,13 +974,14 @@ def perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, t
                 
                 logger.info(f"章节 {chapter_prefix} 过滤后有效结果: {len(similar_chunks)} 个")
                 
-                # 构建章节证据文本
+                # 构建章节证据文本（章节级分析用更多证据，扣除章节目录项后按 token 预算选取）
                 evidence_text = ""
                 if similar_chunks:
-                    evidence_chunks = []
-                    for chunk, similarity in similar_chunks:
-                        evidence_chunks.append(f"相关度{similarity:.3f}: {chunk}")
-                    evidence_text = '\n'.join(evidence_chunks[:10])  # 章节级分析用更多证据
+                    items_text = json.dumps([item for _, item in chapter_items], ensure_ascii=False)
+                    evidence_text = pack_context(
+                        similar_chunks[:10], context_budget(chat_model, items_text),
+                        formatter=format_with_similarity
+                    )
                 
                 logger.info(f"章节 {chapter_prefix} 证据文本长度: {len(evidence_text)}")
                 
@@ -1359,7 +1402,7 @@ def test_callback():
     """
     try:
         # 获取回调数据
-        callback_data = request.get_json()
+        callback_data = read_callback_json()
         
         if not callback_data:
             logger.warning("回调接收失败：未收到有效的JSON数据")
@@ -6,17 +6,21 @@ import os
 import json
 import logging
 import threading
-import requests
 import re
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flasgger import swag_from
 from werkzeug.utils import secure_filename
-from docx import Document
+from utils.lazy_import import lazy_import
+from utils.context_packer import pack_context, context_budget
 
 # 导入现有的工具类和方法
 from objs.PlanAuditor import PlanAuditor
 from objs.FileManager import FileManager
+from objs.ReauditPlanner import ReauditPlanner
+from objs.CacheGC import pinning
+from objs.CallbackDispatcher import get_callback_dispatcher
+from utils.results import get_callback_mode, compact_result, result_response, read_callback_json
 from utils.prompts import CONSTRUCTION_EXPERT_SYSTEM
 
 # 导入数据库模块
@@ -36,6 +40,9 @@ api_cite_check_async = Blueprint('api_cite_check_async', __name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 首次使用时才导入的模块
+docx = lazy_import("docx")
+
 # 全局配置
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'docx', 'doc', 'txt', 'pdf', 'json', 'jsonl'}
@@ -72,7 +79,7 @@ def allowed_file(filename):
 def extract_text_from_docx(file_path):
     """从docx文件提取文本，增加错误处理"""
     try:
-        doc = Document(file_path)
+        doc = docx.Document(file_path)
         text_content = []
         
         # 提取段落文本
@@ -117,8 +124,8 @@ def extract_text_from_docx(file_path):
         logger.error(f"提取docx文件文本时发生错误: {str(e)}")
         raise ValueError(f"无法提取docx文件内容: {str(e)}")
 
-def send_callback(callback_url, task_id, status, data=None, error_message=None):
-    """发送回调请求并更新数据库状态"""
+def send_callback(callback_url, task_id, status, data=None, error_message=None, callback_mode=None):
+    """更新数据库状态并将回调加入发送队列"""
     try:
         # 1. 先更新数据库状态
         try:
@@ -142,7 +149,13 @@ def send_callback(callback_url, task_id, status, data=None, error_message=None):
         except Exception as db_error:
             logger.error(f"更新数据库状态失败: {str(db_error)}, 任务ID: {task_id}")
         
-        # 2. 准备回调数据
+        # 2. 准备回调数据（summary 模式的成功回调只携带汇总、结果地址和 ETag，明细由接收方分页获取；
+        #    结果未能保存到数据库时仍发送完整结果）
+        if status == "success" and data and get_callback_mode(callback_mode) == "summary":
+            stored = CiteCheckDAO.get_check_result(task_id)
+            if stored:
+                data = compact_result(stored, 'citation_results', f'/async_cite_check/result/{task_id}')
+        
         callback_data = {
             "task_id": task_id,
             "status": status,  # "success", "failed", "processing"
@@ -151,24 +164,9 @@ def send_callback(callback_url, task_id, status, data=None, error_message=None):
             "error_message": error_message
         }
         
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        
-        logger.info(f"发送回调到: {callback_url}, 任务ID: {task_id}, 状态: {status}")
-        
-        # 3. 发送POST请求到回调接口
-        response = requests.post(
-            callback_url, 
-            json=callback_data, 
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            logger.info(f"回调发送成功，任务ID: {task_id}")
-        else:
-            logger.warning(f"回调发送失败，状态码: {response.status_code}, 任务ID: {task_id}")
+        # 3. 写入回调发件箱，由后台投递（失败按退避重试，不阻塞当前工作线程）
+        get_callback_dispatcher().enqueue(task_id, callback_url, callback_data)
+        logger.info(f"回调已加入发送队列: {callback_url}, 任务ID: {task_id}, 状态: {status}")
             
     except Exception as e:
         logger.error(f"发送回调时发生错误: {str(e)}, 任务ID: {task_id}")
@@ -184,11 +182,12 @@ def async_cite_check_worker(task_params):
         # 发送处理中状态回调
         send_callback(callback_url_full, task_id, "processing", {"message": "开始执行引用检查"})
         
-        # 执行引用检查
-        result = perform_cite_check_internal(task_params)
+        # 执行引用检查（执行期间固定所用方案的缓存，避免被缓存回收淘汰）
+        with pinning():
+            result = perform_cite_check_internal(task_params)
         
         # 发送成功回调
-        send_callback(callback_url_full, task_id, "success", result)
+        send_callback(callback_url_full, task_id, "success", result, callback_mode=task_params.get('callback_mode'))
         
         logger.info(f"引用检查完成，任务ID: {task_id}")
         
@@ -205,6 +204,7 @@ def perform_cite_check_internal(task_params):
     document_path = task_params['document_path']
     cite_list_filename = task_params['cite_list_filename']
     document_filename = task_params['document_filename']
+    scheme_id = task_params.get('scheme_id')
     embedding_model = task_params['embedding_model']
     chat_model = task_params['chat_model']
     top_k = task_params['top_k']
@@ -256,7 +256,8 @@ def perform_cite_check_internal(task_params):
             openai_api_key=openai_api_key,
             openai_api_base=openai_api_base,
             cache_dir=CACHE_DIR,
-            original_filename=document_filename
+            original_filename=document_filename,
+            scheme_id=scheme_id
         )
         
         # 构建嵌入
@@ -265,6 +266,17 @@ def perform_cite_check_internal(task_params):
     except Exception as e:
         raise Exception(f'初始化审查器失败: {str(e)}')
     
+    # 差异复审：检索证据与基准任务一致的引用条目直接复用基准结果
+    planner = None
+    base_task_id = task_params.get('base_task_id')
+    if base_task_id:
+        planner = ReauditPlanner.create(
+            auditor, base_task_id, CiteCheckDAO.get_check_result(base_task_id),
+            results_field='citation_results', key_field='citation_id', status_field='citation_status'
+        )
+        if planner is None:
+            logger.warning(f"基准任务 {base_task_id} 的结果或方案缓存不可用，全部引用条目重新检查")
+    
     # 逐个检查每个引用条目
     citation_results = []
     
@@ -344,7 +356,14 @@ def perform_cite_check_internal(task_params):
                 continue
             
             # 搜索相关文本片段
-            similar_chunks = auditor.search_similar_chunks(citation_text, top_k=top_k)
+            if planner:
+                similar_chunks, unchanged = planner.search(citation_text, top_k)
+                reused_result = planner.reuse(citation_id, {'citation_text': citation_text}) if unchanged else None
+                if reused_result:
+                    citation_results.append(reused_result)
+                    continue
+            else:
+                similar_chunks = auditor.search_similar_chunks(citation_text, top_k=top_k)
             
             # 组合检索到的文本作为证据
             evidence_texts = []
@@ -358,7 +377,7 @@ def perform_cite_check_internal(task_params):
             # 使用大模型进行引用检查
             if similar_chunks:
                 # 构建上下文内容
-                context = "\n".join([chunk_dict.get("text", "") for chunk_dict in similar_chunks])
+                context = pack_context(similar_chunks, context_budget(chat_model, citation_text))
                 
                 # 构建引用检查prompt（针对标准规范或学术文献）
                 if standard_code or standard_name:
@@ -539,9 +558,11 @@ def perform_cite_check_internal(task_params):
             'missing_citations': missing_citations,
             'incorrectly_cited': incorrectly_cited,
             'failed_checks': failed_checks,
-            'citation_rate': round(properly_cited / total_citations * 100, 2) if total_citations > 0 else 0
+            'citation_rate': round(properly_cited / total_citations * 100, 2) if total_citations > 0 else 0,
+            'reused_items': planner.reused_count if planner else 0
         },
         'citation_results': citation_results,
+        'base_task_id': base_task_id,
         'document_filename': document_filename,
         'cite_list_filename': cite_list_filename,
         'plan_id': plan_id,
@@ -634,9 +655,11 @@ def async_cite_check():
         
         # 获取配置参数
         callback_base_url = request.form.get('callback_base_url', DEFAULT_CALLBACK_BASE_URL)
+        callback_mode = get_callback_mode(request.form.get('callback_mode'))
         embedding_model = request.form.get('embedding_model', 'nomic-embed-text:latest')
         chat_model = request.form.get('chat_model', 'qwen2.5:32b')
         top_k = int(request.form.get('top_k', 5))
+        base_task_id = request.form.get('base_task_id') or None
         openai_api_key = request.form.get('openai_api_key', 'ollama')
         openai_api_base = request.form.get('openai_api_base', 'http://59.77.7.24:11434/v1/')
         
@@ -660,7 +683,9 @@ def async_cite_check():
                 'embedding_model': embedding_model,
                 'chat_model': chat_model,
                 'top_k': top_k,
-                'callback_base_url': callback_base_url
+                'callback_base_url': callback_base_url,
+                'base_task_id': base_task_id,
+                'callback_mode': callback_mode
             }
             
             task = AsyncTaskDAO.create_task(
@@ -730,6 +755,8 @@ def async_cite_check():
             'embedding_model': embedding_model,
             'chat_model': chat_model,
             'top_k': top_k,
+            'base_task_id': base_task_id,
+            'callback_mode': callback_mode,
             'openai_api_key': openai_api_key,
             'openai_api_base': openai_api_base,
             'timestamp': timestamp_folder
@@ -809,11 +836,7 @@ def get_check_result(task_id):
                 'data': None
             }), 404
         
-        return jsonify({
-            'code': 200,
-            'message': 'success',
-            'data': result
-        }), 200
+        return result_response(result, 'citation_results')
         
     except Exception as e:
         logger.error(f"获取检查结果失败: {str(e)}")
@@ -829,7 +852,7 @@ def test_callback():
     """本地测试回调接口"""
     try:
         # 获取回调数据
-        callback_data = request.get_json()
+        callback_data = read_callback_json()
         
         if not callback_data:
             logger.warning("回调接收失败：未收到有效的JSON数据")
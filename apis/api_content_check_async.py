@@ -6,17 +6,22 @@ import os
 import json
 import logging
 import threading
-import requests
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from flasgger import swag_from
 from werkzeug.utils import secure_filename
-from docx import Document
+from utils.lazy_import import lazy_import
+from utils.context_packer import pack_context, context_budget
+from config.settings import PROMPT_CONFIG
 
 # 导入现有的工具类和方法
 from objs.PlanAuditor import PlanAuditor
 from objs.FileManager import FileManager
-from utils.prompts import CONSTRUCTION_EXPERT_SYSTEM, get_batch_check_prompt, parse_llm_judgment, parse_confidence_score
+from objs.ReauditPlanner import ReauditPlanner
+from objs.CacheGC import pinning
+from objs.CallbackDispatcher import get_callback_dispatcher
+from utils.results import get_callback_mode, compact_result, result_response, read_callback_json
+from utils.prompts import get_batch_check_messages, parse_llm_judgment, parse_confidence_score
 
 # 导入数据库模块
 from db import AsyncTaskDAO, DocumentDAO, ContentCheckDAO
@@ -35,6 +40,9 @@ api_content_check_async = Blueprint('api_content_check_async', __name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 首次使用时才导入的模块
+docx = lazy_import("docx")
+
 # 全局配置
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'docx', 'doc', 'txt', 'pdf', 'json', 'jsonl'}
@@ -71,7 +79,7 @@ def allowed_file(filename):
 def extract_text_from_docx(file_path):
     """从docx文件提取文本，增加错误处理"""
     try:
-        doc = Document(file_path)
+        doc = docx.Document(file_path)
         text_content = []
         
         # 提取段落文本
@@ -116,8 +124,8 @@ def extract_text_from_docx(file_path):
         logger.error(f"提取docx文件文本时发生错误: {str(e)}")
         raise ValueError(f"无法提取docx文件内容: {str(e)}")
 
-def send_callback(callback_url, task_id, status, data=None, error_message=None):
-    """发送回调请求并更新数据库状态"""
+def send_callback(callback_url, task_id, status, data=None, error_message=None, callback_mode=None):
+    """更新数据库状态并将回调加入发送队列"""
     try:
         # 1. 先更新数据库状态
         try:
@@ -141,7 +149,13 @@ def send_callback(callback_url, task_id, status, data=None, error_message=None):
         except Exception as db_error:
             logger.error(f"更新数据库状态失败: {str(db_error)}, 任务ID: {task_id}")
         
-        # 2. 准备回调数据
+        # 2. 准备回调数据（summary 模式的成功回调只携带汇总、结果地址和 ETag，明细由接收方分页获取；
+        #    结果未能保存到数据库时仍发送完整结果）
+        if status == "success" and data and get_callback_mode(callback_mode) == "summary":
+            stored = ContentCheckDAO.get_check_result(task_id)
+            if stored:
+                data = compact_result(stored, 'check_results', f'/async_content_check/result/{task_id}')
+        
         callback_data = {
             "task_id": task_id,
             "status": status,  # "success", "failed", "processing"
@@ -150,24 +164,9 @@ def send_callback(callback_url, task_id, status, data=None, error_message=None):
             "error_message": error_message
         }
         
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        
-        logger.info(f"发送回调到: {callback_url}, 任务ID: {task_id}, 状态: {status}")
-        
-        # 3. 发送POST请求到回调接口
-        response = requests.post(
-            callback_url, 
-            json=callback_data, 
-            headers=headers,
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            logger.info(f"回调发送成功，任务ID: {task_id}")
-        else:
-            logger.warning(f"回调发送失败，状态码: {response.status_code}, 任务ID: {task_id}")
+        # 3. 写入回调发件箱，由后台投递（失败按退避重试，不阻塞当前工作线程）
+        get_callback_dispatcher().enqueue(task_id, callback_url, callback_data)
+        logger.info(f"回调已加入发送队列: {callback_url}, 任务ID: {task_id}, 状态: {status}")
             
     except Exception as e:
         logger.error(f"发送回调时发生错误: {str(e)}, 任务ID: {task_id}")
@@ -183,11 +182,12 @@ def async_content_check_worker(task_params):
         # 发送处理中状态回调
         send_callback(callback_url_full, task_id, "processing", {"message": "开始执行内容检查"})
         
-        # 执行内容检查
-        result = perform_content_check_internal(task_params)
+        # 执行内容检查（执行期间固定所用方案的缓存，避免被缓存回收淘汰）
+        with pinning():
+            result = perform_content_check_internal(task_params)
         
         # 发送成功回调
-        send_callback(callback_url_full, task_id, "success", result)
+        send_callback(callback_url_full, task_id, "success", result, callback_mode=task_params.get('callback_mode'))
         
         logger.info(f"内容检查完成，任务ID: {task_id}")
         
@@ -204,6 +204,7 @@ def perform_content_check_internal(task_params):
     document_path = task_params['document_path']
     checklist_filename = task_params['checklist_filename']
     document_filename = task_params['document_filename']
+    scheme_id = task_params.get('scheme_id')
     embedding_model = task_params['embedding_model']
     chat_model = task_params['chat_model']
     top_k = task_params['top_k']
@@ -255,7 +256,8 @@ def perform_content_check_internal(task_params):
             openai_api_key=openai_api_key,
             openai_api_base=openai_api_base,
             cache_dir=CACHE_DIR,
-            original_filename=document_filename
+            original_filename=document_filename,
+            scheme_id=scheme_id
         )
         
         # 构建嵌入
@@ -264,6 +266,17 @@ def perform_content_check_internal(task_params):
     except Exception as e:
         raise Exception(f'初始化审查器失败: {str(e)}')
     
+    # 差异复审：检索证据与基准任务一致的检查项直接复用基准结果
+    planner = None
+    base_task_id = task_params.get('base_task_id')
+    if base_task_id:
+        planner = ReauditPlanner.create(
+            auditor, base_task_id, ContentCheckDAO.get_check_result(base_task_id),
+            results_field='check_results', key_field='item_number', status_field='judgment'
+        )
+        if planner is None:
+            logger.warning(f"基准任务 {base_task_id} 的结果或方案缓存不可用，全部检查项重新检查")
+    
     # 逐个检查每个检查项
     check_results = []
     
@@ -289,7 +302,14 @@ def perform_content_check_internal(task_params):
                 continue
             
             # 搜索相关文本片段
-            similar_chunks = auditor.search_similar_chunks(check_scenario, top_k=top_k)
+            if planner:
+                similar_chunks, unchanged = planner.search(check_scenario, top_k)
+                reused_result = planner.reuse(item_number, {'check_scenario': check_scenario}) if unchanged else None
+                if reused_result:
+                    check_results.append(reused_result)
+                    continue
+            else:
+                similar_chunks = auditor.search_similar_chunks(check_scenario, top_k=top_k)
             
             # 组合检索到的文本作为证据
             evidence_texts = []
@@ -303,19 +323,13 @@ def perform_content_check_internal(task_params):
             # 使用大模型进行智能判断
             if similar_chunks:
                 # 构建上下文内容
-                context = "\n".join([chunk_dict.get("text", "") for chunk_dict in similar_chunks])
+                # 按模型的 token 预算选取证据，去掉重复文本块
+                # prefix 布局下方案概要作为固定前缀，也占用提示词预算
+                plan_digest = auditor.plan_digest() if PROMPT_CONFIG.layout == "prefix" else ""
+                context = pack_context(similar_chunks, context_budget(chat_model, check_scenario, plan_digest))
                 
                 # 构建判断prompt
-                messages = [
-                    {
-                        "role": "system",
-                        "content": CONSTRUCTION_EXPERT_SYSTEM
-                    },
-                    {
-                        "role": "user",
-                        "content": get_batch_check_prompt(check_scenario, category, context)
-                    }
-                ]
+                messages = get_batch_check_messages(check_scenario, category, context, plan_digest)
                 
                 # 调用大模型进行判断
                 try:
@@ -333,10 +347,10 @@ def perform_content_check_internal(task_params):
                     
                 except Exception as e:
                     logger.error(f"大模型调用失败: {str(e)}")
-                    # 降级到简单判断
-                    judgment = "合规"  # 默认合规
-                    probability = 0.5
-                    check_result = f"大模型调用失败，降级判断: {str(e)}"
+                    # 模型调用失败不能当作判断结果，记为检查失败
+                    judgment = "检查失败"
+                    probability = 0.0
+                    check_result = f"大模型调用失败，无法完成检查: {str(e)}"
                     
             else:
                 # 没有找到相关内容
@@ -379,9 +393,11 @@ def perform_content_check_internal(task_params):
             'compliant_items': compliant_items,
             'non_compliant_items': non_compliant_items,
             'failed_items': failed_items,
-            'compliance_rate': round(compliant_items / total_items * 100, 2) if total_items > 0 else 0
+            'compliance_rate': round(compliant_items / total_items * 100, 2) if total_items > 0 else 0,
+            'reused_items': planner.reused_count if planner else 0
         },
         'check_results': check_results,
+        'base_task_id': base_task_id,
         'document_filename': document_filename,
         'checklist_filename': checklist_filename,
         'plan_id': plan_id,
@@ -474,9 +490,11 @@ def async_content_check():
         
         # 获取配置参数
         callback_base_url = request.form.get('callback_base_url', DEFAULT_CALLBACK_BASE_URL)
+        callback_mode = get_callback_mode(request.form.get('callback_mode'))
         embedding_model = request.form.get('embedding_model', 'nomic-embed-text:latest')
         chat_model = request.form.get('chat_model', 'qwen2.5:32b')
         top_k = int(request.form.get('top_k', 5))
+        base_task_id = request.form.get('base_task_id') or None
         openai_api_key = request.form.get('openai_api_key', 'ollama')
         openai_api_base = request.form.get('openai_api_base', 'http://59.77.7.24:11434/v1/')
         
@@ -500,7 +518,9 @@ def async_content_check():
                 'embedding_model': embedding_model,
                 'chat_model': chat_model,
                 'top_k': top_k,
-                'callback_base_url': callback_base_url
+                'callback_base_url': callback_base_url,
+                'base_task_id': base_task_id,
+                'callback_mode': callback_mode
             }
             
             task = AsyncTaskDAO.create_task(
@@ -570,6 +590,8 @@ def async_content_check():
             'embedding_model': embedding_model,
             'chat_model': chat_model,
             'top_k': top_k,
+            'base_task_id': base_task_id,
+            'callback_mode': callback_mode,
             'openai_api_key': openai_api_key,
             'openai_api_base': openai_api_base,
             'timestamp': timestamp_folder
@@ -649,11 +671,7 @@ def get_check_result(task_id):
                 'data': None
             }), 404
         
-        return jsonify({
-            'code': 200,
-            'message': 'success',
-            'data': result
-        }), 200
+        return result_response(result, 'check_results')
         
     except Exception as e:
         logger.error(f"获取检查结果失败: {str(e)}")
@@ -669,7 +687,7 @@ def test_callback():
     """本地测试回调接口"""
     try:
         # 获取回调数据
-        callback_data = request.get_json()
+        callback_data = read_callback_json()
         
         if not callback_data:
             logger.warning("回调接收失败：未收到有效的JSON数据")
@@ -6,20 +6,33 @@ import os
 import json
 import logging
 from datetime import datetime, timedelta
-from flask import Blueprint, request, jsonify, Response
+from functools import partial
+from flask import Blueprint, request, jsonify
 from flasgger import swag_from
 from werkzeug.utils import secure_filename
-from docx import Document
+from utils.lazy_import import lazy_import
+from utils.context_packer import pack_context, context_budget, format_with_similarity
+from utils.sse import get_stream_mode, is_compact, sse_response, get_parallel_items, interleave_events
+from config.settings import PROMPT_CONFIG
 from objs.PlanAuditor import PlanAuditor
-from objs.FileManager import FileManager
+from objs.ChunkStore import ChunkStore
+from objs.FileManager import get_file_manager
 from objs.EmbeddingRetriever import EmbeddingRetriever
+from objs.ClientRegistry import get_http_session, http_timeout
+from objs.RateLimiter import get_rate_limiter, rate_limiter_stats
+from objs.ModelCall import ModelCallError
+from objs.BackendPool import backend_pool_stats
+from objs.CorpusIndex import get_corpus_index
+from objs.CacheGC import get_cache_gc
+from objs.CallbackDispatcher import get_callback_dispatcher
 from utils.prompts import (
-    CONSTRUCTION_EXPERT_SYSTEM, 
-    get_batch_check_prompt,
+    get_batch_check_messages,
     get_category_check_prompt,
     get_citation_check_prompt,
     get_structure_check_prompt,
     get_query_prompt,
+    get_plan_query_messages,
+    get_stream_query_messages,
     parse_llm_judgment,
     parse_confidence_score,
     generate_single_check_prompt,
@@ -40,9 +53,12 @@ from utils.swagger_configs.ra_check_swagger import (
     delete_file_swagger,
     list_upload_folders_swagger,
     cleanup_uploads_swagger,
+    cache_gc_swagger,
     batch_check_swagger,
     cite_check_swagger,
-    structure_check_swagger
+    structure_check_swagger,
+    corpus_search_swagger,
+    corpus_index_sync_swagger
 )
 
 # 创建蓝图
@@ -52,10 +68,16 @@ api_ra_check = Blueprint('api_ra_check', __name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 首次使用时才导入的模块
+docx = lazy_import("docx")
+requests = lazy_import("requests")
+
 # 全局配置
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'docx', 'doc', 'txt', 'pdf'}
 CACHE_DIR = 'cache'
+# 流式问答直接调用的 Ollama 服务
+OLLAMA_BASE = 'http://localhost:11434'
 
 # 确保目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -115,7 +137,7 @@ def allowed_file(filename):
 def extract_text_from_docx(file_path):
     """从docx文件提取文本，增加错误处理"""
     try:
-        doc = Document(file_path)
+        doc = docx.Document(file_path)
         text_content = []
         
         # 提取段落文本
@@ -166,7 +188,7 @@ def extract_text_from_docx(file_path):
         logger.error(f"提取docx文件文本时发生错误: {str(e)}")
         # 如果完全失败，尝试只提取段落
         try:
-            doc = Document(file_path)
+            doc = docx.Document(file_path)
             text_content = []
             for paragraph in doc.paragraphs:
                 if paragraph.text and paragraph.text.strip():
@@ -267,6 +289,7 @@ def query_plan():
         query = data.get('query')
         top_k = data.get('top_k', 5)
         stream = data.get('stream', False)
+        stream_mode = get_stream_mode(data.get('stream_mode'))
         
         if not plan_id or not query:
             return jsonify({'status': 'error', 'message': '缺少必要参数'}), 400
@@ -282,11 +305,11 @@ def query_plan():
             def generate_stream_response():
                 try:
                     # 发送开始信号
-                    yield f"data: {json.dumps({'type': 'start', 'message': '开始查询...'})}\n\n"
+                    yield {'type': 'start', 'message': '开始查询...'}
                     
                     # 搜索相似文本块
                     similar_chunks = auditor.search_similar_chunks(query, top_k)
-                    yield f"data: {json.dumps({'type': 'progress', 'message': f'找到 {len(similar_chunks)} 个相关文本块，正在生成回复...'})}\n\n"
+                    yield {'type': 'progress', 'message': f'找到 {len(similar_chunks)} 个相关文本块，正在生成回复...'}
                     
                     # 构建检索上下文
                     context_texts = []
@@ -295,36 +318,27 @@ def query_plan():
                     context = "\n\n".join(context_texts)
                     
                     # 构建prompt
-                    messages = [
-                        {"role": "system", "content": "你是一个专业的施工方案审核助手。请基于提供的施工方案内容，回答用户的问题。请严格基于提供的施工方案内容进行回答，如果方案中没有相关信息，请明确说明。"},
-                        {"role": "user", "content": f"施工方案内容：\n{context}\n\n用户问题：{query}\n\n请基于上述施工方案内容回答用户问题："}
-                    ]
+                    messages = get_plan_query_messages(query, context)
                     
                     # 流式生成回复
-                    yield f"data: {json.dumps({'type': 'generation_start', 'message': '正在生成回复...'})}\n\n"
+                    yield {'type': 'generation_start', 'message': '正在生成回复...'}
                     
                     full_response = ""
                     for token in auditor.embedder.generate_text_stream(messages, model='qwen2.5:7b'):
                         full_response += token
-                        yield f"data: {json.dumps({'type': 'token', 'content': token})}\n\n"
+                        yield {'type': 'token', 'content': token}
                     
-                    # 发送完成信号
-                    yield f"data: {json.dumps({'type': 'complete', 'message': '生成完成', 'full_response': full_response, 'context_chunks_count': len(similar_chunks)})}\n\n"
+                    # 发送完成信号（coalesced 模式下不再重复已流式输出的全文）
+                    complete = {'type': 'complete', 'message': '生成完成', 'context_chunks_count': len(similar_chunks)}
+                    if not is_compact(stream_mode):
+                        complete['full_response'] = full_response
+                    yield complete
                     
                 except Exception as e:
                     logger.error(f"流式查询发生错误: {str(e)}")
-                    yield f"data: {json.dumps({'type': 'error', 'message': f'查询发生错误: {str(e)}'})}\n\n"
+                    yield {'type': 'error', 'message': f'查询发生错误: {str(e)}'}
             
-            return Response(
-                generate_stream_response(),
-                mimetype='text/plain',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'Connection': 'keep-alive',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                }
-            )
+            return sse_response(generate_stream_response(), stream_mode)
         else:
             # 非流式输出
             results = auditor.response_user_query(query, top_k)
@@ -348,6 +362,7 @@ def check_category():
         scenario = data.get('scenario')
         top_k = data.get('top_k', 5)
         stream = data.get('stream', False)
+        stream_mode = get_stream_mode(data.get('stream_mode'))
         
         if not plan_id or not category or not scenario:
             return jsonify({'status': 'error', 'message': '缺少必要参数'}), 400
@@ -362,11 +377,11 @@ def check_category():
             # 流式输出
             def generate_stream_response():
                 try:
-                    yield f"data: {json.dumps({'type': 'start', 'message': f'开始{category}分类检查...'})}\n\n"
+                    yield {'type': 'start', 'message': f'开始{category}分类检查...'}
                     
                     # 搜索相关文本块
                     similar_chunks = auditor.search_similar_chunks(scenario, top_k)
-                    yield f"data: {json.dumps({'type': 'progress', 'message': f'找到 {len(similar_chunks)} 个相关文本块，正在分析...'})}\n\n"
+                    yield {'type': 'progress', 'message': f'找到 {len(similar_chunks)} 个相关文本块，正在分析...'}
                     
                     # 构建检索上下文
                     context_texts = []
@@ -381,34 +396,28 @@ def check_category():
                     ]
                     
                     # 流式生成分析结果
-                    yield f"data: {json.dumps({'type': 'generation_start', 'message': '正在生成分析结果...'})}\n\n"
+                    yield {'type': 'generation_start', 'message': '正在生成分析结果...'}
                     
                     full_response = ""
                     for token in auditor.embedder.generate_text_stream(messages, model='qwen2.5:7b'):
                         full_response += token
-                        yield f"data: {json.dumps({'type': 'token', 'content': token})}\n\n"
+                        yield {'type': 'token', 'content': token}
                     
                     # 组装检查结果
                     plan_content = [chunk.get('text', '') for chunk in similar_chunks]
                     check_items = [{'similarity': chunk.get('similarity', 0), 'text': chunk.get('text', '')} for chunk in similar_chunks]
                     
-                    # 发送完成信号
-                    yield f"data: {json.dumps({'type': 'complete', 'message': '分析完成', 'analysis_result': full_response, 'plan_content': plan_content, 'check_items': check_items})}\n\n"
+                    # 发送完成信号（coalesced 模式下分析结果已流式输出，plan_content 与 check_items 中的文本重复，均不再发送）
+                    complete = {'type': 'complete', 'message': '分析完成', 'check_items': check_items}
+                    if not is_compact(stream_mode):
+                        complete.update(analysis_result=full_response, plan_content=plan_content)
+                    yield complete
                     
                 except Exception as e:
                     logger.error(f"流式分类检查发生错误: {str(e)}")
-                    yield f"data: {json.dumps({'type': 'error', 'message': f'检查发生错误: {str(e)}'})}\n\n"
+                    yield {'type': 'error', 'message': f'检查发生错误: {str(e)}'}
             
-            return Response(
-                generate_stream_response(),
-                mimetype='text/plain',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'Connection': 'keep-alive',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                }
-            )
+            return sse_response(generate_stream_response(), stream_mode)
         else:
             # 非流式输出
             results = auditor.check_category_scenario(category, scenario, top_k)
@@ -431,6 +440,7 @@ def full_audit():
         plan_id = data.get('plan_id')
         check_categories = data.get('check_categories', [])
         stream = data.get('stream', False)
+        stream_mode = get_stream_mode(data.get('stream_mode'))
         
         if not plan_id:
             return jsonify({'status': 'error', 'message': '缺少方案ID'}), 400
@@ -454,18 +464,19 @@ def full_audit():
             # 流式输出
             def generate_stream_response():
                 try:
-                    yield f"data: {json.dumps({'type': 'start', 'message': f'开始完整审核，共{len(filtered_items)}个检查项...'})}\n\n"
+                    yield {'type': 'start', 'message': f'开始完整审核，共{len(filtered_items)}个检查项...'}
                     
                     audit_results = {}
                     compliant_count = 0
                     non_compliant_count = 0
+                    failed_count = 0
                     
                     # 对每个检查项进行审核
                     for i, item in enumerate(filtered_items, 1):
                         category = item.get('分类', '未知类别')
                         scenario = item.get('专项施工方案严重缺陷情形', '')
                         
-                        yield f"data: {json.dumps({'type': 'progress', 'message': f'正在检查第{i}/{len(filtered_items)}项: {category} - {scenario}'})}\n\n"
+                        yield {'type': 'progress', 'message': f'正在检查第{i}/{len(filtered_items)}项: {category} - {scenario}'}
                         
                         # 搜索相关文本块
                         similar_chunks = auditor.search_similar_chunks(scenario, top_k=3)
@@ -483,9 +494,24 @@ def full_audit():
                         
                         # 流式生成分析
                         analysis_result = ""
-                        for token in auditor.embedder.generate_text_stream(messages, model='qwen2.5:7b'):
-                            analysis_result += token
-                            yield f"data: {json.dumps({'type': 'token', 'content': token, 'item_index': i, 'category': category})}\n\n"
+                        try:
+                            for token in auditor.embedder.generate_text_stream(messages, model='qwen2.5:7b'):
+                                analysis_result += token
+                                yield {'type': 'token', 'content': token, 'item_index': i, 'category': category}
+                        except ModelCallError as e:
+                            # 模型调用失败的项不计入合规/不合规
+                            logger.error(f"检查第 {i} 项时大模型调用失败: {str(e)}")
+                            failed_count += 1
+                            audit_results[f"{category}_{item.get('序号', '')}"] = {
+                                'category': category,
+                                'scenario': scenario,
+                                'plan_content': [chunk.get('text', '') for chunk in similar_chunks],
+                                'check_items': similar_chunks,
+                                'is_compliant': None,
+                                'error': str(e)
+                            }
+                            yield {'type': 'item_error', 'item_index': i, 'category': category, 'error': str(e)}
+                            continue
                         
                         # 简单的合规性判断
                         is_compliant = len(similar_chunks) > 0 and "合规" in analysis_result
@@ -504,31 +530,30 @@ def full_audit():
                             'analysis_result': analysis_result
                         }
                         
-                        yield f"data: {json.dumps({'type': 'item_complete', 'item_index': i, 'category': category, 'is_compliant': is_compliant})}\n\n"
+                        item_event = {'type': 'item_complete', 'item_index': i, 'category': category, 'is_compliant': is_compliant}
+                        if is_compact(stream_mode):
+                            # 每项的检索证据随该项发送一次，结束帧只发送汇总
+                            item_event.update(scenario=scenario, check_items=similar_chunks)
+                        yield item_event
                     
                     # 发送完成信号
                     summary = {
                         'total_checks': len(filtered_items),
                         'compliant_count': compliant_count,
-                        'non_compliant_count': non_compliant_count
+                        'non_compliant_count': non_compliant_count,
+                        'failed_count': failed_count
                     }
                     
-                    yield f"data: {json.dumps({'type': 'complete', 'message': '完整审核完成', 'audit_results': audit_results, 'summary': summary})}\n\n"
+                    complete = {'type': 'complete', 'message': '完整审核完成', 'summary': summary}
+                    if not is_compact(stream_mode):
+                        complete['audit_results'] = audit_results
+                    yield complete
                     
                 except Exception as e:
                     logger.error(f"流式完整审核发生错误: {str(e)}")
-                    yield f"data: {json.dumps({'type': 'error', 'message': f'审核发生错误: {str(e)}'})}\n\n"
+                    yield {'type': 'error', 'message': f'审核发生错误: {str(e)}'}
             
-            return Response(
-                generate_stream_response(),
-                mimetype='text/plain',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'Connection': 'keep-alive',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                }
-            )
+            return sse_response(generate_stream_response(), stream_mode)
         else:
             # 非流式输出
             audit_results = {}
@@ -579,7 +604,7 @@ def get_status():
     """查看系统状态"""
     try:
         # 获取文件管理器
-        file_manager = FileManager(CACHE_DIR)
+        file_manager = get_file_manager(CACHE_DIR)
         
         # 获取所有文件映射
         all_files = file_manager.get_all_files()
@@ -634,6 +659,9 @@ def get_status():
             'loaded_plans': loaded_plans,
             'all_cached_files': all_files,
             'upload_structure': upload_structure,
+            'rate_limiters': rate_limiter_stats(),
+            'backend_pools': backend_pool_stats(),
+            'callbacks': get_callback_dispatcher().status(),
             'system_info': {
                 'cache_dir': CACHE_DIR,
                 'upload_folder': UPLOAD_FOLDER,
@@ -652,7 +680,7 @@ def get_status():
 def list_files():
     """列出所有已上传的文件"""
     try:
-        file_manager = FileManager(CACHE_DIR)
+        file_manager = get_file_manager(CACHE_DIR)
         all_files = file_manager.get_all_files()
         
         return jsonify({
@@ -670,7 +698,7 @@ def list_files():
 def delete_file(file_hash):
     """删除指定的文件和相关缓存"""
     try:
-        file_manager = FileManager(CACHE_DIR)
+        file_manager = get_file_manager(CACHE_DIR)
         
         # 删除文件映射和缓存
         success = file_manager.delete_file_mapping(file_hash)
@@ -779,6 +807,29 @@ def cleanup_uploads():
         logger.error(f"清理上传文件夹时发生错误: {str(e)}")
         return jsonify({'status': 'error', 'message': f'清理上传文件夹时发生错误: {str(e)}'}), 500
 
+@api_ra_check.route('/ra_check/cache/gc', methods=['POST'])
+@swag_from(cache_gc_swagger)
+def run_cache_gc():
+    """立即执行一次缓存回收"""
+    try:
+        data = request.get_json(silent=True) or {}
+        dry_run = bool(data.get('dry_run', False))
+        
+        report = get_cache_gc(CACHE_DIR).run_once(dry_run=dry_run)
+        
+        # 已淘汰方案的内存缓存一并移除
+        if not dry_run and hasattr(api_ra_check, 'auditor_cache'):
+            for item in report['evicted']:
+                api_ra_check.auditor_cache.pop(item['plan_id'], None)
+            for plan_id in report['dangling_mappings']:
+                api_ra_check.auditor_cache.pop(plan_id, None)
+        
+        return jsonify({'status': 'success', **report}), 200
+        
+    except Exception as e:
+        logger.error(f"缓存回收时发生错误: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'缓存回收时发生错误: {str(e)}'}), 500
+
 def load_auditor_from_cache(plan_id):
     """从缓存中加载auditor"""
     try:
@@ -787,7 +838,7 @@ def load_auditor_from_cache(plan_id):
             return api_ra_check.auditor_cache[plan_id]
         
         # 从文件缓存加载
-        file_manager = FileManager(CACHE_DIR)
+        file_manager = get_file_manager(CACHE_DIR)
         file_info = file_manager.get_file_info(plan_id)
         
         if not file_info:
@@ -810,17 +861,13 @@ def load_auditor_from_cache(plan_id):
         # 从缓存加载嵌入
         cache_files = file_info.get("cache_files", {})
         chunk_file = cache_files.get("chunks")
-        emb_file = cache_files.get("embeddings")
         faiss_file = cache_files.get("faiss_index")
         
-        if chunk_file and emb_file and faiss_file:
-            auditor.load_embeddings(chunk_file, emb_file, faiss_file)
+        if chunk_file and faiss_file:
+            auditor.load_embeddings(chunk_file, faiss_file)
             
-            # 读取plan_content
-            if os.path.exists(chunk_file):
-                with open(chunk_file, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    auditor.plan_content = content
+            # 由缓存的文本块拼回plan_content
+            auditor.plan_content = auditor.joined_chunks_text()
         
         # 缓存到内存
         if not hasattr(api_ra_check, 'auditor_cache'):
@@ -833,6 +880,28 @@ def load_auditor_from_cache(plan_id):
         logger.error(f"从缓存加载auditor失败: {e}")
         return None
 
+def warm_up_recent_plans(limit=5):
+    """预加载最近使用（按方案文件夹访问时间）的方案到内存缓存，返回加载成功的 plan_id 列表"""
+    if limit <= 0:
+        return []
+    
+    def last_access(info):
+        folder = info.get('doc_folder')
+        try:
+            return os.path.getmtime(folder) if folder else 0
+        except OSError:
+            return 0
+    
+    infos = [info for info in get_file_manager(CACHE_DIR).get_all_files() if info.get('file_hash')]
+    infos.sort(key=last_access, reverse=True)
+    
+    loaded = []
+    for info in infos[:limit]:
+        if load_auditor_from_cache(info['file_hash']) is not None:
+            loaded.append(info['file_hash'])
+    logger.info(f"预加载最近使用的方案 {len(loaded)} 个")
+    return loaded
+
 @api_ra_check.route('/ra_check/simple_search', methods=['POST'])
 @swag_from(simple_search_swagger)
 def simple_search():
@@ -867,7 +936,7 @@ def simple_search():
             results.append(result)
         
         # 获取文档信息
-        file_manager = FileManager(CACHE_DIR)
+        file_manager = get_file_manager(CACHE_DIR)
         file_info = file_manager.get_file_info(plan_id)
         filename = file_info.get('original_filename', 'unknown') if file_info else 'unknown'
         
@@ -883,6 +952,92 @@ def simple_search():
         logger.error(f"简单检索发生错误: {str(e)}")
         return jsonify({'status': 'error', 'message': f'检索发生错误: {str(e)}'}), 500
 
+@api_ra_check.route('/ra_check/corpus_search', methods=['POST'])
+@swag_from(corpus_search_swagger)
+def corpus_search():
+    """跨方案检索接口，在全局索引中检索所有已缓存方案"""
+    try:
+        data = request.get_json() or {}
+        query = data.get('query')
+        top_k = data.get('top_k', 10)
+        plan_ids = data.get('plan_ids') or None
+        scheme_ids = data.get('scheme_ids') or None
+        embedding_model = data.get('embedding_model', 'nomic-embed-text:latest')
+        openai_api_key = data.get('openai_api_key', 'ollama')
+        openai_api_base = data.get('openai_api_base', f"{OLLAMA_BASE.rstrip('/')}/v1/")
+        
+        if not query:
+            return jsonify({'status': 'error', 'message': '缺少必要参数'}), 400
+        
+        # 查询向量
+        embedder = EmbeddingRetriever(
+            embedding_model=embedding_model,
+            openai_api_key=openai_api_key,
+            openai_api_base=openai_api_base
+        )
+        query_vec = embedder.encode([query])
+        
+        hits = get_corpus_index(CACHE_DIR).search(
+            query_vec, embedding_model, top_k=top_k,
+            plan_ids=plan_ids, scheme_ids=scheme_ids
+        )
+        
+        # 按方案读取文本块，同一方案只读一次
+        file_manager = get_file_manager(CACHE_DIR)
+        chunks_by_plan = {}
+        results = []
+        for hit in hits:
+            plan_id = hit['plan_id']
+            if plan_id not in chunks_by_plan:
+                file_info = file_manager.get_file_info(plan_id) or {}
+                chunk_file = file_info.get('cache_files', {}).get('chunks')
+                chunks_by_plan[plan_id] = PlanAuditor.read_chunks(chunk_file) \
+                    if PlanAuditor.chunks_exist(chunk_file) else []
+            chunks = chunks_by_plan[plan_id]
+            text = chunks[hit['chunk_idx']] if hit['chunk_idx'] < len(chunks) else ''
+            results.append({
+                'plan_id': plan_id,
+                'chunk_idx': hit['chunk_idx'],
+                'scheme_id': hit['scheme_id'],
+                'document': hit['original_filename'] or 'unknown',
+                'similarity': hit['similarity'],
+                'text': text
+            })
+        for chunks in chunks_by_plan.values():
+            if isinstance(chunks, ChunkStore):
+                chunks.close()
+        
+        return jsonify({
+            'status': 'success',
+            'query': query,
+            'results': results,
+            'total_results': len(results)
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"跨方案检索发生错误: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'检索发生错误: {str(e)}'}), 500
+
+@api_ra_check.route('/ra_check/corpus_index/sync', methods=['POST'])
+@swag_from(corpus_index_sync_swagger)
+def sync_corpus_index():
+    """将全局索引与文件映射对齐"""
+    try:
+        file_manager = get_file_manager(CACHE_DIR)
+        corpus_index = get_corpus_index(CACHE_DIR)
+        result = corpus_index.sync(file_manager.get_all_files())
+        
+        return jsonify({
+            'status': 'success',
+            'added': result['added'],
+            'removed': result['removed'],
+            'index_stats': corpus_index.stats()
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"同步全局索引时发生错误: {str(e)}")
+        return jsonify({'status': 'error', 'message': f'同步全局索引时发生错误: {str(e)}'}), 500
+
 @api_ra_check.route('/ra_check/stream_query', methods=['POST'])
 @swag_from(stream_query_swagger)
 def stream_query():
@@ -894,6 +1049,7 @@ def stream_query():
         query = data.get('query')
         top_k = data.get('top_k', 5)
         model_name = data.get('model', 'qwen2.5:7b')  # 默认模型
+        stream_mode = get_stream_mode(data.get('stream_mode'))
         
         if not plan_id or not query:
             return jsonify({'status': 'error', 'message': '缺少必要参数'}), 400
@@ -903,32 +1059,32 @@ def stream_query():
     def generate_stream_response():
         try:
             # 发送开始信号
-            yield f"data: {json.dumps({'type': 'start', 'message': '开始查询...'})}\n\n"
+            yield {'type': 'start', 'message': '开始查询...'}
             
             # 加载auditor
-            yield f"data: {json.dumps({'type': 'progress', 'message': '加载文档缓存...'})}\n\n"
+            yield {'type': 'progress', 'message': '加载文档缓存...'}
             auditor = load_auditor_from_cache(plan_id)
             
             if not auditor:
-                yield f"data: {json.dumps({'type': 'error', 'message': '方案未找到或加载失败'})}\n\n"
+                yield {'type': 'error', 'message': '方案未找到或加载失败'}
                 return
             
             # 获取文档信息
-            file_manager = FileManager(CACHE_DIR)
+            file_manager = get_file_manager(CACHE_DIR)
             file_info = file_manager.get_file_info(plan_id)
             
             filename = file_info.get('original_filename', 'unknown') if file_info else 'unknown'
             chunks_count = len(auditor.chunks)
             info_message = f'已加载文档: {filename} ({chunks_count} 个文本块)'
-            yield f"data: {json.dumps({'type': 'info', 'message': info_message})}\n\n"
+            yield {'type': 'info', 'message': info_message}
             
             # 执行检索
-            yield f"data: {json.dumps({'type': 'progress', 'message': f'正在检索相关内容...'})}\n\n"
+            yield {'type': 'progress', 'message': f'正在检索相关内容...'}
             
             # 搜索相似文本块
             similar_chunks = auditor.search_similar_chunks(query, top_k)
             
-            yield f"data: {json.dumps({'type': 'progress', 'message': f'找到 {len(similar_chunks)} 个相关文本块，正在生成回复...'})}\n\n"
+            yield {'type': 'progress', 'message': f'找到 {len(similar_chunks)} 个相关文本块，正在生成回复...'}
             
             # 构建检索上下文
             context_texts = []
@@ -938,91 +1094,72 @@ def stream_query():
             context = "\n\n".join(context_texts)
             
             # 构建prompt
-            system_prompt = """你是一个专业的施工方案审核助手。请基于提供的施工方案内容，回答用户的问题。
-
-注意事项：
-1. 请严格基于提供的施工方案内容进行回答
-2. 如果方案中没有相关信息，请明确说明
-3. 回答要专业、准确、具体
-4. 可以适当引用方案中的具体条文或数据"""
-
-            user_prompt = f"""施工方案内容：
-{context}
+            messages = get_stream_query_messages(query, context)
 
-用户问题：{query}
-
-请基于上述施工方案内容回答用户问题："""
-
-            # 调用ollama API进行流式生成
-            import requests
-            
-            ollama_url = "http://localhost:11434/api/chat"
+            # 调用ollama API进行流式生成（共享连接池的会话）
+            ollama_base = OLLAMA_BASE
+            ollama_url = f"{ollama_base}/api/chat"
             payload = {
                 "model": model_name,
-                "messages": [
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
+                "messages": messages,
                 "stream": True
             }
             
             try:
-                response = requests.post(ollama_url, json=payload, stream=True, timeout=60)
-                response.raise_for_status()
+                # 流式生成期间占用该模型的调用名额
+                with get_rate_limiter(ollama_base, model_name).slot(stream=True):
+                    response = get_http_session(ollama_base).post(
+                        ollama_url, json=payload, stream=True, timeout=http_timeout()
+                    )
+                    response.raise_for_status()
                 
-                # 开始生成回复信号
-                yield f"data: {json.dumps({'type': 'generation_start', 'message': '正在生成回复...'})}\n\n"
+                    # 开始生成回复信号
+                    yield {'type': 'generation_start', 'message': '正在生成回复...'}
                 
-                # 流式处理响应
-                full_response = ""
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            chunk_data = json.loads(line)
-                            if 'message' in chunk_data and 'content' in chunk_data['message']:
-                                content = chunk_data['message']['content']
-                                full_response += content
+                    # 流式处理响应
+                    full_response = ""
+                    for line in response.iter_lines():
+                        if line:
+                            try:
+                                chunk_data = json.loads(line)
+                                if 'message' in chunk_data and 'content' in chunk_data['message']:
+                                    content = chunk_data['message']['content']
+                                    full_response += content
                                 
-                                # 流式输出每个token
-                                yield f"data: {json.dumps({'type': 'token', 'content': content})}\n\n"
+                                    # 流式输出每个token
+                                    yield {'type': 'token', 'content': content}
                             
-                            # 检查是否完成
-                            if chunk_data.get('done', False):
-                                # 发送完成信号
-                                yield f"data: {json.dumps({'type': 'complete', 'message': '生成完成', 'full_response': full_response, 'context_chunks_count': len(similar_chunks)})}\n\n"
-                                break
+                                # 检查是否完成
+                                if chunk_data.get('done', False):
+                                    # 发送完成信号（coalesced 模式下不再重复已流式输出的全文）
+                                    complete = {'type': 'complete', 'message': '生成完成', 'context_chunks_count': len(similar_chunks)}
+                                    if not is_compact(stream_mode):
+                                        complete['full_response'] = full_response
+                                    yield complete
+                                    break
                                 
-                        except json.JSONDecodeError:
-                            continue
+                            except json.JSONDecodeError:
+                                continue
                             
             except requests.exceptions.RequestException as e:
-                yield f"data: {json.dumps({'type': 'error', 'message': f'调用模型API失败: {str(e)}'})}\n\n"
+                yield {'type': 'error', 'message': f'调用模型API失败: {str(e)}'}
                 return
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'message': f'生成过程中发生错误: {str(e)}'})}\n\n"
+                yield {'type': 'error', 'message': f'生成过程中发生错误: {str(e)}'}
                 return
             
         except Exception as e:
             logger.error(f"流式查询发生错误: {str(e)}")
-            yield f"data: {json.dumps({'type': 'error', 'message': f'查询发生错误: {str(e)}'})}\n\n"
+            yield {'type': 'error', 'message': f'查询发生错误: {str(e)}'}
     
-    return Response(
-        generate_stream_response(),
-        mimetype='text/plain',
-        headers={
-            'Cache-Control': 'no-cache',
-            'Connection': 'keep-alive',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Headers': 'Content-Type'
-        }
-    )
+    return sse_response(generate_stream_response(), stream_mode)
 
 @api_ra_check.route('/ra_check/available_embeddings', methods=['GET'])
 @swag_from(available_embeddings_swagger)
 def get_available_embeddings():
     """获取可用的嵌入文件列表"""
     try:
-        file_manager = FileManager(CACHE_DIR)
+        file_manager = get_file_manager(CACHE_DIR)
         all_files = file_manager.get_all_files()
         
         available_embeddings = []
@@ -1151,6 +1288,8 @@ def batch_check():
         top_k = int(request.form.get('top_k', 5))
         chat_model = request.form.get('chat_model', 'qwen2.5:32b')  # 提前提取chat_model参数
         stream = request.form.get('stream', 'false').lower() == 'true'
+        stream_mode = get_stream_mode(request.form.get('stream_mode'))
+        parallel = get_parallel_items(request.form.get('parallel'))
         
         # 创建临时检查项文件（JSONL格式）
         temp_checklist_path = os.path.join(upload_subfolder, 'temp_checklist.jsonl')
@@ -1183,11 +1322,18 @@ def batch_check():
             # 流式输出
             def generate_stream_response():
                 try:
-                    yield f"data: {json.dumps({'type': 'start', 'message': f'开始批量检查，共{len(checklist_items)}个检查项...'})}\n\n"
+                    # 逐项检查时开始帧与原有格式相同
+                    start = {'type': 'start', 'message': f'开始批量检查，共{len(checklist_items)}个检查项...'}
+                    if parallel > 1:
+                        start['message'] += f'（{parallel}项并行）'
+                        start['parallel'] = parallel
+                    yield start
                     
-                    check_results = []
+                    # 序号 -> 检查结果，并行时各项完成顺序不定，汇总时按序号排列
+                    check_results = {}
                     
-                    for i, check_item in enumerate(checklist_items, 1):
+                    def check_item_stream(i, check_item):
+                        """检查单个检查项，产出该项的事件（均带 item_index）"""
                         try:
                             logger.info(f"正在检查第 {i}/{len(checklist_items)} 项: {check_item}")
                             
@@ -1206,9 +1352,9 @@ def batch_check():
                                     'probability': 0.0,
                                     'error': '检查项缺少"专项施工方案严重缺陷情形"字段'
                                 }
-                                check_results.append(result)
-                                yield f"data: {json.dumps({'type': 'item_complete', 'item_index': i, 'result': result})}\n\n"
-                                continue
+                                check_results[i] = result
+                                yield {'type': 'item_complete', 'item_index': i, 'result': result}
+                                return
                             
                             # 搜索相关文本片段
                             similar_chunks = auditor.search_similar_chunks(check_scenario, top_k=top_k)
@@ -1225,27 +1371,20 @@ def batch_check():
                             # 使用大模型进行智能判断
                             if similar_chunks:
                                 # 构建上下文内容
-                                context = "\n".join([chunk_dict.get("text", "") for chunk_dict in similar_chunks])
+                                # prefix 布局下方案概要作为固定前缀，也占用提示词预算
+                                plan_digest = auditor.plan_digest() if PROMPT_CONFIG.layout == "prefix" else ""
+                                context = pack_context(similar_chunks, context_budget(chat_model, check_scenario, plan_digest))
                                 
-                                                                # 构建判断prompt
-                                messages = [
-                                    {
-                                        "role": "system",
-                                        "content": CONSTRUCTION_EXPERT_SYSTEM
-                                    },
-                                    {
-                                        "role": "user",
-                                        "content": get_batch_check_prompt(check_scenario, category, context)
-                                    }
-                                ]
+                                # 构建判断prompt
+                                messages = get_batch_check_messages(check_scenario, category, context, plan_digest)
                                 
                                 # 流式生成分析
-                                yield f"data: {json.dumps({'type': 'generation_start', 'message': f'正在分析第{i}项...', 'item_index': i})}\n\n"
+                                yield {'type': 'generation_start', 'message': f'正在分析第{i}项...', 'item_index': i}
                                 
                                 llm_response = ""
                                 for token in auditor.embedder.generate_text_stream(messages, model=chat_model):
                                     llm_response += token
-                                    yield f"data: {json.dumps({'type': 'token', 'content': token, 'item_index': i, 'category': category})}\n\n"
+                                    yield {'type': 'token', 'content': token, 'item_index': i, 'category': category}
                                 
                                 # 解析大模型回复
                                 judgment = parse_llm_judgment(llm_response)
@@ -1269,9 +1408,12 @@ def batch_check():
                                 'detailed_result': check_result,
                                 'chunk_count': len(similar_chunks)
                             }
-                            check_results.append(result)
+                            check_results[i] = result
                             
-                            yield f"data: {json.dumps({'type': 'item_complete', 'item_index': i, 'result': result})}\n\n"
+                            if is_compact(stream_mode) and similar_chunks:
+                                # 分析全文已流式输出
+                                result = {k: v for k, v in result.items() if k != 'detailed_result'}
+                            yield {'type': 'item_complete', 'item_index': i, 'result': result}
                             
                         except Exception as e:
                             logger.error(f"检查第 {i} 项时发生错误: {str(e)}")
@@ -1284,8 +1426,19 @@ def batch_check():
                                 'probability': 0.0,
                                 'error': str(e)
                             }
-                            check_results.append(result)
-                            yield f"data: {json.dumps({'type': 'item_error', 'item_index': i, 'result': result})}\n\n"
+                            check_results[i] = result
+                            yield {'type': 'item_error', 'item_index': i, 'result': result}
+                    
+                    item_streams = [partial(check_item_stream, i, check_item)
+                                    for i, check_item in enumerate(checklist_items, 1)]
+                    if parallel > 1:
+                        # 多项同时检查，各项的 token 按 item_index 交错输出
+                        yield from interleave_events(item_streams, parallel)
+                    else:
+                        for item_stream in item_streams:
+                            yield from item_stream()
+                    
+                    check_results = [check_results[i] for i in sorted(check_results)]
                     
                     # 计算总体统计
                     total_items = len(check_results)
@@ -1308,22 +1461,16 @@ def batch_check():
                         'check_results': check_results
                     }
                     
-                    yield f"data: {json.dumps({'type': 'complete', 'message': '批量检查完成', 'data': data})}\n\n"
+                    if is_compact(stream_mode):
+                        # 各项结果已随 item_complete 发送
+                        data = {k: v for k, v in data.items() if k != 'check_results'}
+                    yield {'type': 'complete', 'message': '批量检查完成', 'data': data}
                     
                 except Exception as e:
                     logger.error(f"流式批量检查发生错误: {str(e)}")
-                    yield f"data: {json.dumps({'type': 'error', 'message': f'检查发生错误: {str(e)}'})}\n\n"
+                    yield {'type': 'error', 'message': f'检查发生错误: {str(e)}'}
             
-            return Response(
-                generate_stream_response(),
-                mimetype='text/plain',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'Connection': 'keep-alive',
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Headers': 'Content-Type'
-                }
-            )
+            return sse_response(generate_stream_response(), stream_mode)
         else:
             # 非流式输出
             # 逐个检查每个检查项
@@ -1365,19 +1512,12 @@ def batch_check():
                     # 使用大模型进行智能判断
                     if similar_chunks:
                         # 构建上下文内容
-                        context = "\n".join([chunk_dict.get("text", "") for chunk_dict in similar_chunks])
+                        # prefix 布局下方案概要作为固定前缀，也占用提示词预算
+                        plan_digest = auditor.plan_digest() if PROMPT_CONFIG.layout == "prefix" else ""
+                        context = pack_context(similar_chunks, context_budget(chat_model, check_scenario, plan_digest))
                         
                         # 构建判断prompt
-                        messages = [
-                            {
-                                "role": "system",
-                                "content": CONSTRUCTION_EXPERT_SYSTEM
-                            },
-                            {
-                                "role": "user",
-                                "content": get_batch_check_prompt(check_scenario, category, context)
-                            }
-                        ]
+                        messages = get_batch_check_messages(check_scenario, category, context, plan_digest)
                         
                         # 调用大模型进行判断
                         try:
@@ -1396,10 +1536,10 @@ def batch_check():
                             
                         except Exception as e:
                             logger.error(f"大模型调用失败: {str(e)}")
-                            # 降级到简单判断
-                            judgment = "合规"  # 默认合规
-                            probability = 0.5
-                            check_result = f"大模型调用失败，降级判断: {str(e)}"
+                            # 模型调用失败不能当作判断结果，记为检查失败
+                            judgment = "检查失败"
+                            probability = 0.0
+                            check_result = f"大模型调用失败，无法完成检查: {str(e)}"
                             detailed_analysis = "大模型调用失败"
                             
                     else:
@@ -1677,7 +1817,9 @@ def cite_check():
                 # 使用大模型进行引用检查
                 if similar_chunks:
                     # 构建上下文内容
-                    context = "\n".join([chunk_dict.get("text", "") for chunk_dict in similar_chunks])
+                    context = pack_context(
+                        similar_chunks, context_budget(request.form.get('chat_model', 'qwen2.5:32b'), citation_text)
+                    )
                     
                     # 构建引用检查prompt（针对标准规范或学术文献）
                     if standard_code or standard_name:
@@ -2080,15 +2222,15 @@ def perform_item_by_item_structure_check(toc_items, auditor, chat_model, top_k):
                 similar_chunks = []
                 for result in similar_chunks_results:
                     if result['similarity'] > 0.1:
-                        similar_chunks.append((result['text'], result['similarity']))
+                        similar_chunks.append(result)
                 
-                # 构建证据文本
+                # 构建证据文本（最多3个相关片段，按 token 预算选取）
                 evidence_text = ""
                 if similar_chunks:
-                    evidence_chunks = []
-                    for chunk, similarity in similar_chunks:
-                        evidence_chunks.append(f"相关度{similarity:.3f}: {chunk}")
-                    evidence_text = '\n'.join(evidence_chunks[:3])  # 最多3个相关片段
+                    evidence_text = pack_context(
+                        similar_chunks[:3], context_budget(chat_model, search_query),
+                        formatter=format_with_similarity
+                    )
                 
                 # 使用AI分析结构完整性
                 if ai_applicable == '是' and evidence_text:
@@ -2168,15 +2310,16 @@ def perform_chapter_by_chapter_structure_check(toc_items, auditor, chat_model, t
                 similar_chunks = []
                 for result in similar_chunks_results:
                     if result['similarity'] > 0.1:
-                        similar_chunks.append((result['text'], result['similarity']))
+                        similar_chunks.append(result)
                 
-                # 构建章节证据文本
+                # 构建章节证据文本（章节级分析用更多证据，扣除章节目录项后按 token 预算选取）
                 evidence_text = ""
                 if similar_chunks:
-                    evidence_chunks = []
-                    for chunk, similarity in similar_chunks:
-                        evidence_chunks.append(f"相关度{similarity:.3f}: {chunk}")
-                    evidence_text = '\n'.join(evidence_chunks[:10])  # 章节级分析用更多证据
+                    items_text = json.dumps([item for _, item in chapter_items], ensure_ascii=False)
+                    evidence_text = pack_context(
+                        similar_chunks[:10], context_budget(chat_model, items_text),
+                        formatter=format_with_similarity
+                    )
                 
                 # 使用AI进行章节级批量分析
                 chapter_analysis = analyze_chapter_structure_completeness_batch(
@@ -5,7 +5,18 @@ import logging
 import atexit
 
 # 导入数据库模块
-from db import init_database, health_check, close_connection_pool, db_manager
+from db import init_database, health_check, close_connection_pool, db_manager, \
+    test_connection, warm_up_connection_pool
+from objs.FileManager import get_file_manager
+from objs.CacheGC import get_cache_gc
+from objs.CallbackDispatcher import get_callback_dispatcher
+from objs.CorpusIndex import flush_corpus_indexes
+from objs.ClientRegistry import close_all_clients
+from objs.PlanAuditor import read_check_list
+from objs.Warmup import Warmup
+from config.settings import WARMUP_CONFIG
+import glob
+import os
 
 app = Flask(__name__)
 
@@ -85,7 +96,7 @@ swagger_template = {
 swagger = Swagger(app, config=swagger_config, template=swagger_template)
 
 # 导入API蓝图
-from apis.api_ra_check import api_ra_check
+from apis.api_ra_check import api_ra_check, CACHE_DIR, warm_up_recent_plans
 from apis.api_async_structure_check import api_async_structure_check
 from apis.api_content_check_async import api_content_check_async
 from apis.api_cite_check_async import api_cite_check_async
@@ -99,6 +110,46 @@ app.register_blueprint(api_cite_check_async, url_prefix="/")
 # 初始化CORS
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
 
+# 启动预热（init_app 中启动）
+warmup = Warmup()
+
+# 存活与就绪检查
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    存活检查：进程能响应请求即返回 200
+    ---
+    tags:
+      - 系统管理
+    responses:
+      200:
+        description: 服务存活
+    """
+    return jsonify({"status": "alive"}), 200
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    就绪检查：启动预热完成且数据库可连接时返回 200，否则返回 503
+    ---
+    tags:
+      - 系统管理
+    responses:
+      200:
+        description: 服务就绪
+      503:
+        description: 预热未完成或依赖不可用
+    """
+    status = warmup.status()
+    # 预热未完成时不再探测数据库，避免探测超时拖慢检查
+    database_ok = test_connection() if status["ready"] else None
+    ready = bool(status["ready"] and database_ok)
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "database_connection": database_ok,
+        "warmup": status
+    }), 200 if ready else 503
+
 # 数据库管理API
 @app.route('/api/database/health', methods=['GET'])
 def database_health():
@@ -219,21 +270,65 @@ def database_cleanup():
             "error": str(e)
         }), 500
 
+def init_database_or_raise():
+    """初始化数据库（建表、测试连接），失败时抛出异常"""
+    if not init_database():
+        raise Exception("数据库初始化失败")
+    logger.info("数据库初始化成功")
+    return True
+
+def import_heavy_modules():
+    """预先导入首次请求会用到的重型模块（启动时延迟导入）"""
+    import importlib
+    loaded = []
+    for name in ("faiss", "openai", "docx", "requests"):
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except ImportError as e:
+            logger.warning(f"预导入模块 {name} 失败: {str(e)}")
+    return loaded
+
+def warm_up_database():
+    """预先建立数据库连接，一个都建立不了时视为失败"""
+    idle = warm_up_connection_pool(WARMUP_CONFIG.db_connections)
+    if idle <= 0:
+        raise Exception("无法建立数据库连接")
+    return {"idle_connections": idle}
+
+def start_callback_dispatcher():
+    """启动回调投递线程"""
+    dispatcher = get_callback_dispatcher()
+    dispatcher.start()
+    return {"running": dispatcher.status()["running"]}
+
 # 应用初始化函数
 def init_app():
     """初始化应用"""
     logger.info("开始初始化应用...")
     
-    # 初始化数据库
+    # 导入旧文件映射、迁移旧格式缓存（只在启动时执行一次）
     try:
-        if init_database():
-            logger.info("数据库初始化成功")
-        else:
-            logger.error("数据库初始化失败")
-            raise Exception("数据库初始化失败")
+        get_file_manager(CACHE_DIR).migrate()
+        logger.info("缓存文件映射检查完成")
     except Exception as e:
-        logger.error(f"数据库初始化异常: {str(e)}")
-        raise
+        logger.error(f"缓存文件映射迁移失败: {str(e)}")
+    
+    # 启动后台缓存回收
+    get_cache_gc(CACHE_DIR).start()
+    
+    # 后台初始化和预热：数据库（连接远程 MySQL 较慢，不阻塞启动）、重型模块、检查项文件、最近使用的方案
+    warmup.add_step("database", init_database_or_raise, required=True)
+    warmup.add_step("database_pool", warm_up_database, required=True)
+    # 回调发件箱表由 database 步骤创建，之后再启动投递（投递上次退出时未完成的回调）
+    warmup.add_step("callbacks", start_callback_dispatcher)
+    warmup.add_step("modules", import_heavy_modules)
+    warmup.add_step("checklists", lambda: {
+        os.path.basename(path): len(read_check_list(path))
+        for path in glob.glob(os.path.join(WARMUP_CONFIG.checklist_dir, '*.jsonl'))
+    })
+    warmup.add_step("recent_plans", lambda: warm_up_recent_plans(WARMUP_CONFIG.recent_plans))
+    warmup.start()
     
     logger.info("应用初始化完成")
 
@@ -242,6 +337,10 @@ def cleanup_app():
     """应用清理"""
     logger.info("开始清理应用资源...")
     try:
+        get_cache_gc(CACHE_DIR).stop()
+        get_callback_dispatcher().stop()
+        flush_corpus_indexes()
+        close_all_clients()
         close_connection_pool()
         logger.info("数据库连接池已关闭")
     except Exception as e:
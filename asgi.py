@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 入口
+流式查询（/ra_check/query、/ra_check/stream_query）和任务状态查询由协程处理，
+每个打开的流不再占用一个线程；其余接口仍由 Flask 应用处理（在 ASGI_WSGI_WORKERS 个线程中运行）
+
+启动：
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    python asgi.py
+"""
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Mount
+from a2wsgi import WSGIMiddleware
+
+from app import app as flask_app, init_app, logger
+from apis.api_asgi import routes
+from objs.ClientRegistry import aclose_async_clients
+from config.settings import ASYNC_SERVER_CONFIG
+
+
+@asynccontextmanager
+async def lifespan(_):
+    init_app()
+    yield
+    # 同步资源（数据库连接池、同步客户端等）由 app.cleanup_app 在进程退出时清理
+    await aclose_async_clients()
+
+
+app = Starlette(
+    routes=routes + [Mount('/', app=WSGIMiddleware(flask_app, workers=ASYNC_SERVER_CONFIG.wsgi_workers))],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    logger.info("启动ASGI应用...")
+    uvicorn.run(app, host=ASYNC_SERVER_CONFIG.host, port=ASYNC_SERVER_CONFIG.port)
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+应用运行参数配置
+各项均可通过环境变量覆盖
+"""
+import os
+import json
+import logging
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ChunkConfig:
+    """文本分块配置"""
+    max_tokens: int = 300          # 单个文本块的最大 token 数
+    overlap_tokens: int = 50       # 同一章节内相邻文本块的重叠 token 数
+    min_tokens: int = 60           # 小于该值的文本块遇到标题时不单独成块，与下一节合并
+
+
+def get_chunk_config_from_env() -> ChunkConfig:
+    """从环境变量获取分块配置"""
+    return ChunkConfig(
+        max_tokens=int(os.getenv('CHUNK_MAX_TOKENS', 300)),
+        overlap_tokens=int(os.getenv('CHUNK_OVERLAP_TOKENS', 50)),
+        min_tokens=int(os.getenv('CHUNK_MIN_TOKENS', 60))
+    )
+
+
+CHUNK_CONFIG = get_chunk_config_from_env()
+
+
+@dataclass
+class IndexConfig:
+    """向量索引配置"""
+    vector_storage: str = "float32"    # 向量存储模式：float32（精确）/ float16 / int8（标量量化）
+    corpus_save_delay: float = 2.0     # 全局索引增删方案后延迟保存的秒数，期间的修改合并为一次写入
+
+
+def get_index_config_from_env() -> IndexConfig:
+    """从环境变量获取向量索引配置"""
+    return IndexConfig(
+        vector_storage=os.getenv('VECTOR_STORAGE', 'float32'),
+        corpus_save_delay=float(os.getenv('CORPUS_INDEX_SAVE_DELAY', 2))
+    )
+
+
+INDEX_CONFIG = get_index_config_from_env()
+
+
+@dataclass
+class CacheConfig:
+    """方案缓存配置"""
+    file_index_backend: str = "sqlite"    # 文件映射存储：sqlite（cache/file_index.db）/ json（file_mapping.json）
+    max_bytes: int = 0                    # 缓存目录容量上限（字节），超出时按最近访问时间淘汰方案缓存，0 表示不限
+    gc_interval: int = 600                # 后台回收间隔（秒），0 表示不启动后台回收
+    gc_grace_seconds: int = 3600          # 最近访问或创建不足该时长的缓存不回收
+    gc_delete_rate_mb: float = 32.0       # 回收时每秒最多删除的数据量（MB），避免集中删除占满磁盘 IO
+
+
+def get_cache_config_from_env() -> CacheConfig:
+    """从环境变量获取缓存配置"""
+    return CacheConfig(
+        file_index_backend=os.getenv('FILE_INDEX_BACKEND', 'sqlite').strip().lower(),
+        max_bytes=int(os.getenv('CACHE_MAX_BYTES', 0)),
+        gc_interval=int(os.getenv('CACHE_GC_INTERVAL', 600)),
+        gc_grace_seconds=int(os.getenv('CACHE_GC_GRACE', 3600)),
+        gc_delete_rate_mb=float(os.getenv('CACHE_GC_DELETE_RATE_MB', 32))
+    )
+
+
+CACHE_CONFIG = get_cache_config_from_env()
+
+
+@dataclass
+class WarmupConfig:
+    """启动预热配置"""
+    recent_plans: int = 5                  # 预加载最近使用的方案数，0 表示不预加载
+    db_connections: int = 5                # 预先建立的数据库连接数
+    checklist_dir: str = "data/checklist"  # 预读取该目录下的检查项文件
+
+
+def get_warmup_config_from_env() -> WarmupConfig:
+    """从环境变量获取预热配置"""
+    return WarmupConfig(
+        recent_plans=int(os.getenv('WARMUP_RECENT_PLANS', 5)),
+        db_connections=int(os.getenv('WARMUP_DB_CONNECTIONS', 5)),
+        checklist_dir=os.getenv('WARMUP_CHECKLIST_DIR', 'data/checklist')
+    )
+
+
+WARMUP_CONFIG = get_warmup_config_from_env()
+
+
+@dataclass
+class LLMClientConfig:
+    """模型服务 HTTP 客户端配置（同一服务地址共享连接池）"""
+    max_connections: int = 50             # 每个客户端的最大连接数
+    max_keepalive_connections: int = 20   # 保持空闲的长连接数
+    keepalive_expiry: float = 60.0        # 空闲长连接保留时长（秒）
+    connect_timeout: float = 5.0          # 建立连接超时（秒）
+    read_timeout: float = 600.0           # 读取超时（秒）：非流式调用需覆盖整段生成耗时，流式为相邻两段输出的最长间隔
+    http2: bool = True                    # 安装 h2 时启用 HTTP/2
+
+
+def get_llm_client_config_from_env() -> LLMClientConfig:
+    """从环境变量获取模型服务客户端配置"""
+    return LLMClientConfig(
+        max_connections=int(os.getenv('LLM_MAX_CONNECTIONS', 50)),
+        max_keepalive_connections=int(os.getenv('LLM_MAX_KEEPALIVE', 20)),
+        keepalive_expiry=float(os.getenv('LLM_KEEPALIVE_EXPIRY', 60)),
+        connect_timeout=float(os.getenv('LLM_CONNECT_TIMEOUT', 5)),
+        read_timeout=float(os.getenv('LLM_READ_TIMEOUT', 600)),
+        http2=os.getenv('LLM_HTTP2', 'true').strip().lower() in ('1', 'true', 'yes')
+    )
+
+
+LLM_CLIENT_CONFIG = get_llm_client_config_from_env()
+
+
+@dataclass
+class RateLimitConfig:
+    """模型服务限流配置（按服务地址和模型分别限流）"""
+    max_concurrency: int = 0         # 最大并发请求数（流式输出占用名额直到结束），0 表示不限
+    min_concurrency: int = 1         # 过载时并发上限最低降到该值
+    rate: float = 0.0                # 每秒最多发起的请求数，0 表示不限
+    burst: int = 4                   # 令牌桶容量（允许的突发请求数）
+    latency_target: float = 60.0     # 单次调用超过该时长（秒）视为过载，0 表示不按延迟调整
+    acquire_timeout: float = 300.0   # 等待调用名额的最长时间（秒），0 表示一直等待
+
+
+def get_rate_limit_config_from_env() -> RateLimitConfig:
+    """从环境变量获取模型服务限流配置"""
+    return RateLimitConfig(
+        max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 0)),
+        min_concurrency=int(os.getenv('LLM_MIN_CONCURRENCY', 1)),
+        rate=float(os.getenv('LLM_RATE_LIMIT', 0)),
+        burst=int(os.getenv('LLM_RATE_BURST', 4)),
+        latency_target=float(os.getenv('LLM_LATENCY_TARGET', 60)),
+        acquire_timeout=float(os.getenv('LLM_ACQUIRE_TIMEOUT', 300))
+    )
+
+
+RATE_LIMIT_CONFIG = get_rate_limit_config_from_env()
+
+
+@dataclass
+class ModelCallConfig:
+    """模型调用重试与对冲配置"""
+    max_retries: int = 2             # 429/5xx、超时等可重试失败的最大重试次数
+    backoff_base: float = 1.0        # 退避基数（秒），第 n 次重试最多等待 base * 2^n
+    backoff_max: float = 20.0        # 单次退避最长等待（秒）
+    hedge_api_base: str = ""         # 备用服务地址（提供相同模型），为空表示不发对冲请求
+    hedge_percentile: float = 0.95   # 主服务超过该延迟分位数仍未返回时发出对冲请求
+    hedge_min_samples: int = 20      # 延迟样本少于该数时不对冲
+    hedge_min_delay: float = 2.0     # 对冲触发延迟下限（秒）
+    hedge_workers: int = 8           # 对冲请求线程数（同时在途的对冲调用上限，已满时不对冲）
+
+
+def get_model_call_config_from_env() -> ModelCallConfig:
+    """从环境变量获取模型调用重试与对冲配置"""
+    return ModelCallConfig(
+        max_retries=int(os.getenv('LLM_MAX_RETRIES', 2)),
+        backoff_base=float(os.getenv('LLM_BACKOFF_BASE', 1)),
+        backoff_max=float(os.getenv('LLM_BACKOFF_MAX', 20)),
+        hedge_api_base=os.getenv('LLM_HEDGE_API_BASE', '').strip(),
+        hedge_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', 0.95)),
+        hedge_min_samples=int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20)),
+        hedge_min_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY', 2)),
+        hedge_workers=int(os.getenv('LLM_HEDGE_WORKERS', 8))
+    )
+
+
+MODEL_CALL_CONFIG = get_model_call_config_from_env()
+
+
+@dataclass
+class BackendPoolConfig:
+    """模型服务节点池配置（同一服务地址负载均衡到多个节点）"""
+    pools: str = ""                   # 节点池 JSON，见 objs/BackendPool.load_pools，为空表示不启用
+    eject_after: int = 3              # 节点连续失败该次数后暂时摘除
+    eject_seconds: float = 30.0       # 首次摘除时长（秒），再次摘除时翻倍
+    eject_max_seconds: float = 300.0  # 最长摘除时长（秒）
+
+
+def get_backend_pool_config_from_env() -> BackendPoolConfig:
+    """从环境变量获取节点池配置，LLM_BACKEND_POOLS_FILE 指定时从文件读取 JSON"""
+    pools = os.getenv('LLM_BACKEND_POOLS', '')
+    pools_file = os.getenv('LLM_BACKEND_POOLS_FILE', '')
+    if pools_file and os.path.exists(pools_file):
+        with open(pools_file, 'r', encoding='utf-8') as f:
+            pools = f.read()
+    return BackendPoolConfig(
+        pools=pools.strip(),
+        eject_after=int(os.getenv('LLM_EJECT_AFTER', 3)),
+        eject_seconds=float(os.getenv('LLM_EJECT_SECONDS', 30)),
+        eject_max_seconds=float(os.getenv('LLM_EJECT_MAX_SECONDS', 300))
+    )
+
+
+BACKEND_POOL_CONFIG = get_backend_pool_config_from_env()
+
+
+def _parse_model_budgets(raw: str) -> dict:
+    """解析 {"模型名": token数} 形式的 JSON，格式错误时忽略"""
+    if not raw:
+        return {}
+    try:
+        return {str(k): int(v) for k, v in json.loads(raw).items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        logging.getLogger(__name__).warning(f"CONTEXT_MODEL_BUDGETS 格式错误，忽略: {e}")
+        return {}
+
+
+@dataclass
+class ContextConfig:
+    """检查提示词的证据打包配置"""
+    prompt_budget: int = 3000           # 单次检查提示词的 token 预算（未单独配置的模型）
+    model_budgets: dict = field(default_factory=dict)  # 按模型配置的预算，如 {"qwen2.5:14b": 6000}
+    template_tokens: int = 400          # 为提示词模板（系统提示、说明、回答格式）预留的 token 数
+    min_evidence_tokens: int = 300      # 证据至少保留的 token 数
+    mmr_lambda: float = 0.7             # MMR 中相关性的权重，越小越偏向内容多样
+    dup_threshold: float = 0.8          # 与已选文本块的字符二元组重合度超过该值时视为重复
+
+
+def get_context_config_from_env() -> ContextConfig:
+    """从环境变量获取证据打包配置"""
+    return ContextConfig(
+        prompt_budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', 3000)),
+        model_budgets=_parse_model_budgets(os.getenv('CONTEXT_MODEL_BUDGETS', '')),
+        template_tokens=int(os.getenv('CONTEXT_TEMPLATE_TOKENS', 400)),
+        min_evidence_tokens=int(os.getenv('CONTEXT_MIN_EVIDENCE_TOKENS', 300)),
+        mmr_lambda=float(os.getenv('CONTEXT_MMR_LAMBDA', 0.7)),
+        dup_threshold=float(os.getenv('CONTEXT_DUP_THRESHOLD', 0.8))
+    )
+
+
+CONTEXT_CONFIG = get_context_config_from_env()
+
+
+@dataclass
+class PromptConfig:
+    """检查提示词布局配置"""
+    layout: str = "classic"      # classic：原有布局；prefix：系统提示 + 方案概要作为固定前缀，检查项放在最后
+    digest_tokens: int = 800     # prefix 布局中方案概要的 token 数
+
+
+def get_prompt_config_from_env() -> PromptConfig:
+    """从环境变量获取提示词布局配置"""
+    layout = os.getenv('PROMPT_LAYOUT', 'classic').strip().lower()
+    return PromptConfig(
+        layout=layout if layout in ("classic", "prefix") else "classic",
+        digest_tokens=int(os.getenv('PROMPT_DIGEST_TOKENS', 800))
+    )
+
+
+PROMPT_CONFIG = get_prompt_config_from_env()
+
+
+@dataclass
+class SSEConfig:
+    """流式接口输出配置"""
+    mode: str = "token"           # token：每个 token 一帧（原有格式）；coalesced：合并 token 后发送，结束帧只含未发送过的内容
+    coalesce_ms: float = 50.0     # 合并 token 的最长间隔（毫秒），0 表示不合并
+    coalesce_bytes: int = 1024    # 合并内容超过该字节数时立即发送
+    parallel_items: int = 1       # batch_check 流式输出时同时检查的项数（1 为逐项检查）
+    max_parallel_items: int = 8   # 请求中 parallel 参数的上限
+
+
+def get_sse_config_from_env() -> SSEConfig:
+    """从环境变量获取流式输出配置"""
+    mode = os.getenv('SSE_STREAM_MODE', 'token').strip().lower()
+    return SSEConfig(
+        mode=mode if mode in ("coalesced", "token") else "token",
+        coalesce_ms=float(os.getenv('SSE_COALESCE_MS', 50)),
+        coalesce_bytes=int(os.getenv('SSE_COALESCE_BYTES', 1024)),
+        parallel_items=int(os.getenv('SSE_PARALLEL_ITEMS', 1)),
+        max_parallel_items=int(os.getenv('SSE_MAX_PARALLEL_ITEMS', 8))
+    )
+
+
+SSE_CONFIG = get_sse_config_from_env()
+
+
+@dataclass
+class AsyncServerConfig:
+    """ASGI 服务（asgi.py）配置"""
+    host: str = "0.0.0.0"
+    port: int = 5000
+    wsgi_workers: int = 32        # 运行其余 Flask 接口的线程数
+    poll_interval: float = 0.05   # 协程等待限流名额的轮询间隔（秒）
+    status_poll: float = 1.0      # 任务状态长轮询查询数据库的间隔（秒）
+    max_wait: float = 60.0        # 任务状态长轮询的最长等待（秒）
+
+
+def get_async_server_config_from_env() -> AsyncServerConfig:
+    """从环境变量获取 ASGI 服务配置"""
+    return AsyncServerConfig(
+        host=os.getenv('ASGI_HOST', '0.0.0.0'),
+        port=int(os.getenv('ASGI_PORT', 5000)),
+        wsgi_workers=int(os.getenv('ASGI_WSGI_WORKERS', 32)),
+        poll_interval=float(os.getenv('ASGI_POLL_INTERVAL', 0.05)),
+        status_poll=float(os.getenv('ASGI_STATUS_POLL', 1.0)),
+        max_wait=float(os.getenv('ASGI_MAX_WAIT', 60))
+    )
+
+
+ASYNC_SERVER_CONFIG = get_async_server_config_from_env()
+
+
+@dataclass
+class CallbackConfig:
+    """任务回调投递配置（回调发件箱）"""
+    workers: int = 8              # 投递线程数
+    per_destination: int = 2      # 同一回调目的地（host:port）的最大并发投递数
+    max_attempts: int = 8         # 最多尝试次数，用尽后记为死信
+    backoff_base: float = 2.0     # 重试退避基数（秒）
+    backoff_max: float = 600.0    # 单次退避最长等待（秒）
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    poll_interval: float = 5.0    # 无新回调时扫描发件箱的间隔（秒）
+    batch_size: int = 50          # 每次领取的回调数
+    lease_seconds: int = 120      # 领取后未完成的回调超过该秒数可被重新领取（投递进程退出）
+    mode: str = "full"            # full：成功回调携带完整结果；summary：只携带汇总、结果地址和 ETag
+    result_base_url: str = ""     # 本服务对外地址，summary 回调的 result_url 以此为前缀（为空时只给出路径）
+    gzip_min_bytes: int = 0       # 回调请求体超过该字节数时 gzip 压缩，0 表示不压缩（需回调接口支持 Content-Encoding）
+    result_page_size: int = 50    # 结果接口分页时的默认每页项数
+    max_result_page_size: int = 500
+
+
+def get_callback_config_from_env() -> CallbackConfig:
+    """从环境变量获取回调投递配置"""
+    mode = os.getenv('CALLBACK_MODE', 'full').strip().lower()
+    return CallbackConfig(
+        workers=int(os.getenv('CALLBACK_WORKERS', 8)),
+        per_destination=int(os.getenv('CALLBACK_PER_DESTINATION', 2)),
+        max_attempts=int(os.getenv('CALLBACK_MAX_ATTEMPTS', 8)),
+        backoff_base=float(os.getenv('CALLBACK_BACKOFF_BASE', 2)),
+        backoff_max=float(os.getenv('CALLBACK_BACKOFF_MAX', 600)),
+        connect_timeout=float(os.getenv('CALLBACK_CONNECT_TIMEOUT', 5)),
+        read_timeout=float(os.getenv('CALLBACK_READ_TIMEOUT', 30)),
+        poll_interval=float(os.getenv('CALLBACK_POLL_INTERVAL', 5)),
+        batch_size=int(os.getenv('CALLBACK_BATCH_SIZE', 50)),
+        lease_seconds=int(os.getenv('CALLBACK_LEASE_SECONDS', 120)),
+        mode=mode if mode in ("full", "summary") else "full",
+        result_base_url=os.getenv('CALLBACK_RESULT_BASE_URL', '').rstrip('/'),
+        gzip_min_bytes=int(os.getenv('CALLBACK_GZIP_MIN_BYTES', 0)),
+        result_page_size=int(os.getenv('RESULT_PAGE_SIZE', 50)),
+        max_result_page_size=int(os.getenv('RESULT_MAX_PAGE_SIZE', 500))
+    )
+
+
+CALLBACK_CONFIG = get_callback_config_from_env()
@@ -13,8 +13,10 @@ from .connection import (
     get_connection, 
     return_connection, 
     get_db_connection,
+    transaction,
     test_connection,
     initialize_database,
+    warm_up_connection_pool,
     close_connection_pool
 )
 
@@ -31,6 +33,7 @@ from .models import (
     ContentCheckItem,
     CiteCheckResult,
     CiteCheckItem,
+    CallbackOutbox,
     create_all_tables,
     drop_all_tables
 )
@@ -42,7 +45,8 @@ from .dao import (
     DocumentDAO,
     ReportDAO,
     ContentCheckDAO,
-    CiteCheckDAO
+    CiteCheckDAO,
+    CallbackOutboxDAO
 )
 
 # 数据库管理器
@@ -61,18 +65,18 @@ __all__ = [
     'DB_CONFIG', 'DatabaseConfig',
     
     # 连接
-    'get_connection', 'return_connection', 'get_db_connection',
-    'test_connection', 'initialize_database', 'close_connection_pool',
+    'get_connection', 'return_connection', 'get_db_connection', 'transaction',
+    'test_connection', 'initialize_database', 'warm_up_connection_pool', 'close_connection_pool',
     
     # 模型
     'BaseModel', 'AsyncTask', 'StructureCheckResult', 
     'StructureCheckItem', 'DocumentReference',
-    'ContentCheckResult', 'ContentCheckItem', 'CiteCheckResult', 'CiteCheckItem',
+    'ContentCheckResult', 'ContentCheckItem', 'CiteCheckResult', 'CiteCheckItem', 'CallbackOutbox',
     'create_all_tables', 'drop_all_tables',
     
     # DAO
     'AsyncTaskDAO', 'StructureCheckDAO', 'DocumentDAO', 'ReportDAO',
-    'ContentCheckDAO', 'CiteCheckDAO',
+    'ContentCheckDAO', 'CiteCheckDAO', 'CallbackOutboxDAO',
     
     # 管理器
     'DatabaseManager', 'db_manager', 'init_database', 
@@ -7,7 +7,8 @@ import logging
 from datetime import datetime
 from typing import Dict, List, Optional, Any, Union
 from dataclasses import dataclass, field, fields
-from db.connection import get_db_connection
+from db.config import DB_CONFIG
+from db.connection import get_db_connection, transaction
 
 logger = logging.getLogger(__name__)
 
@@ -73,86 +74,116 @@ class BaseModel:
         return cls(**processed_data)
     
     def save(self) -> bool:
-        """保存模型到数据库"""
+        """
+        保存模型到数据库（一条语句）：
+        有主键值时 INSERT ... ON DUPLICATE KEY UPDATE，记录存在则更新非空字段；没有主键值时插入新记录
+        """
         try:
             data = self.to_dict()
             
-            # 检查是否存在主键值
-            primary_key_value = data.get(self.primary_key)
-            
             with get_db_connection() as conn:
                 if not conn:
                     logger.error("无法获取数据库连接")
                     return False
                 
                 with conn.cursor() as cursor:
-                    if primary_key_value and self.exists(primary_key_value):
-                        # 更新记录
-                        return self._update(cursor, data)
-                    else:
-                        # 插入新记录
-                        return self._insert(cursor, data)
+                    return self._upsert(cursor, data)
         except Exception as e:
             logger.error(f"保存模型失败: {str(e)}")
             return False
     
-    def _insert(self, cursor, data: Dict[str, Any]) -> bool:
-        """插入新记录"""
+    def _upsert(self, cursor, data: Dict[str, Any]) -> bool:
+        """
+        插入或更新记录（None 值不写入，与原先的插入/更新行为一致）。
+        带主键值时按主键更新：ON DUPLICATE KEY 在任一唯一键冲突时都会触发（如 AsyncTask.task_id），
+        因此每列只在冲突行的主键与本记录一致时才更新，与其他行的唯一键冲突不会改写那一行。
+        使用 VALUES() 而非 8.0.19 起的行别名写法，以兼容 MySQL 5.7 和 MariaDB。
+        """
         try:
-            # 移除None值和主键（如果是自增的）
-            insert_data = {k: v for k, v in data.items() if v is not None}
-            if self.primary_key in insert_data and insert_data[self.primary_key] is None:
-                del insert_data[self.primary_key]
+            save_data = {k: v for k, v in data.items() if v is not None}
             
-            if not insert_data:
+            if not save_data:
                 logger.warning("没有数据需要插入")
                 return False
             
-            columns = list(insert_data.keys())
+            columns = list(save_data.keys())
             placeholders = ', '.join(['%s'] * len(columns))
             column_names = ', '.join(columns)
             
             sql = f"INSERT INTO {self.table_name} ({column_names}) VALUES ({placeholders})"
-            values = list(insert_data.values())
             
-            cursor.execute(sql, values)
+            primary_key_value = save_data.get(self.primary_key)
+            if primary_key_value:
+                update_columns = [k for k in columns if k != self.primary_key] or [self.primary_key]
+                pk = self.primary_key
+                sql += " ON DUPLICATE KEY UPDATE " + ', '.join(
+                    f"{k} = IF({pk} = VALUES({pk}), VALUES({k}), {k})" for k in update_columns
+                )
+            
+            cursor.execute(sql, list(save_data.values()))
             
             # 如果是自增主键，设置新的ID
-            if cursor.lastrowid and hasattr(self, self.primary_key):
+            if not primary_key_value and cursor.lastrowid and hasattr(self, self.primary_key):
                 setattr(self, self.primary_key, cursor.lastrowid)
             
-            logger.debug(f"插入记录成功: {self.table_name}")
+            logger.debug(f"保存记录成功: {self.table_name}")
             return True
             
         except Exception as e:
-            logger.error(f"插入记录失败: {str(e)}")
+            logger.error(f"保存记录失败: {str(e)}")
             return False
     
-    def _update(self, cursor, data: Dict[str, Any]) -> bool:
-        """更新记录"""
+    @classmethod
+    def insert_rows(cls, cursor, items: List['BaseModel'], batch_size: int = None) -> int:
+        """
+        在给定游标上批量插入（不含自增主键）：每条 INSERT 带多行 VALUES，
+        行数不超过 batch_size（默认 DB_BULK_INSERT_ROWS），估算字节数不超过 DB_BULK_INSERT_BYTES，返回插入行数
+        """
+        if not items:
+            return 0
+        
+        batch_size = max(1, batch_size or DB_CONFIG.bulk_insert_rows)
+        columns = [k for k in cls.get_fields() if k != cls.primary_key]
+        row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        sql_prefix = f"INSERT INTO {cls.table_name} ({', '.join(columns)}) VALUES "
+        
+        def flush(rows):
+            values = [value for row in rows for value in row]
+            cursor.execute(sql_prefix + ', '.join([row_placeholder] * len(rows)), values)
+        
+        batch, batch_bytes = [], 0
+        for item in items:
+            data = item.to_dict()
+            row = [data.get(k) for k in columns]
+            row_bytes = sum(len(v.encode('utf-8')) if isinstance(v, str) else 8 for v in row)
+            if batch and (len(batch) >= batch_size or batch_bytes + row_bytes > DB_CONFIG.bulk_insert_bytes):
+                flush(batch)
+                batch, batch_bytes = [], 0
+            batch.append(row)
+            batch_bytes += row_bytes
+        flush(batch)
+        
+        logger.debug(f"批量插入记录成功: {cls.table_name}, 行数: {len(items)}")
+        return len(items)
+    
+    @classmethod
+    def batch_insert(cls, items: List['BaseModel'], batch_size: int = None) -> bool:
+        """批量插入记录（同一事务）"""
+        if not items:
+            return True
+        
         try:
-            primary_key_value = data.get(self.primary_key)
-            if not primary_key_value:
-                logger.error("更新记录时缺少主键值")
-                return False
-            
-            # 移除主键和None值
-            update_data = {k: v for k, v in data.items() if k != self.primary_key and v is not None}
-            
-            if not update_data:
-                logger.warning("没有数据需要更新")
-                return True
-            
-            set_clause = ', '.join([f"{k} = %s" for k in update_data.keys()])
-            sql = f"UPDATE {self.table_name} SET {set_clause} WHERE {self.primary_key} = %s"
-            values = list(update_data.values()) + [primary_key_value]
-            
-            cursor.execute(sql, values)
-            logger.debug(f"更新记录成功: {self.table_name}, ID: {primary_key_value}")
+            with transaction() as conn:
+                if not conn:
+                    return False
+                
+                with conn.cursor() as cursor:
+                    cls.insert_rows(cursor, items, batch_size)
+            logger.info(f"批量插入{len(items)}条记录成功: {cls.table_name}")
             return True
             
         except Exception as e:
-            logger.error(f"更新记录失败: {str(e)}")
+            logger.error(f"批量插入记录失败: {str(e)}")
             return False
     
     @classmethod
@@ -17,6 +17,9 @@ class DatabaseConfig:
     charset: str = "utf8mb4"
     max_connections: int = 20
     autocommit: bool = True
+    # 批量插入时每条 INSERT 语句的最大行数和（估算的）最大字节数，避免超过 max_allowed_packet
+    bulk_insert_rows: int = int(os.getenv('DB_BULK_INSERT_ROWS', 500))
+    bulk_insert_bytes: int = int(os.getenv('DB_BULK_INSERT_BYTES', 1024 * 1024))
     
     @property
     def connection_url(self) -> str:
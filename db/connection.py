@@ -118,6 +118,23 @@ class DatabaseConnectionPool:
                     except:
                         pass
     
+    def warm_up(self, size: int = None) -> int:
+        """预先建立连接直到空闲连接数达到 size（默认为连接池大小），返回当前空闲连接数"""
+        if not self._initialized:
+            self.initialize()
+        target = min(size or self.pool_size, self.pool_size)
+        while True:
+            with self._lock:
+                if len(self._pool) + len(self._used_connections) >= self.pool_size or len(self._pool) >= target:
+                    return len(self._pool)
+            # 建立连接较慢，不持有锁
+            conn = self._create_connection()
+            if conn is None:
+                with self._lock:
+                    return len(self._pool)
+            with self._lock:
+                self._pool.append(conn)
+    
     def _is_connection_valid(self, connection: Connection) -> bool:
         """检查连接是否有效"""
         try:
@@ -178,6 +195,22 @@ def get_db_connection() -> Generator[Optional[Connection], None, None]:
         if connection:
             return_connection(connection)
 
+@contextmanager
+def transaction() -> Generator[Optional[Connection], None, None]:
+    """事务上下文管理器：正常退出时提交，发生异常时回滚"""
+    with get_db_connection() as connection:
+        if not connection:
+            yield None
+            return
+        
+        connection.begin()
+        try:
+            yield connection
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
 def test_connection() -> bool:
     """测试数据库连接"""
     try:
@@ -192,6 +225,10 @@ def test_connection() -> bool:
         logger.error(f"数据库连接测试失败: {str(e)}")
         return False
 
+def warm_up_connection_pool(size: int = None) -> int:
+    """预热连接池，返回空闲连接数"""
+    return _connection_pool.warm_up(size)
+
 def close_connection_pool():
     """关闭连接池"""
     _connection_pool.close_all()
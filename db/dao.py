@@ -2,14 +2,29 @@
 """
 数据访问对象 (Data Access Object)
 """
+import json
 import logging
 from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any, Tuple
-from db.connection import get_db_connection
-from db.models import AsyncTask, StructureCheckResult, StructureCheckItem, DocumentReference, ContentCheckResult, ContentCheckItem, CiteCheckResult, CiteCheckItem
+from typing import List, Optional, Dict, Tuple
+from urllib.parse import urlparse
+from db.connection import get_db_connection, transaction
+from db.base_model import BaseModel
+from db.models import AsyncTask, StructureCheckResult, StructureCheckItem, DocumentReference, ContentCheckResult, ContentCheckItem, CiteCheckResult, CiteCheckItem, CallbackOutbox
 
 logger = logging.getLogger(__name__)
 
+def _save_result_with_items(result: BaseModel, item_class, items: List[BaseModel]) -> bool:
+    """在同一事务中保存检查结果主记录和检查项（检查项按批多行插入），任一失败时整体回滚"""
+    with transaction() as conn:
+        if not conn:
+            return False
+        
+        with conn.cursor() as cursor:
+            if not result._upsert(cursor, result.to_dict()):
+                raise RuntimeError(f"保存{result.table_name}记录失败")
+            item_class.insert_rows(cursor, items)
+    return True
+
 class AsyncTaskDAO:
     """异步任务数据访问对象"""
     
@@ -45,14 +60,39 @@ class AsyncTaskDAO:
     @staticmethod
     def update_task_status(task_id: str, status: str, error_message: str = None, 
                           result_data: Dict = None) -> bool:
-        """更新任务状态"""
+        """更新任务状态（一条 UPDATE 语句，不先查询任务）"""
         try:
-            task = AsyncTask.find_by_task_id(task_id)
-            if not task:
+            now = datetime.now()
+            assignments = ["status = %s", "updated_time = %s"]
+            params = [status, now]
+            
+            if error_message:
+                assignments.append("error_message = %s")
+                params.append(error_message)
+            
+            if result_data:
+                assignments.append("result_data = %s")
+                params.append(json.dumps(result_data, ensure_ascii=False))
+            
+            if status in ['success', 'failed']:
+                assignments.append("completed_time = %s")
+                params.append(now)
+            
+            with get_db_connection() as conn:
+                if not conn:
+                    return False
+                
+                with conn.cursor() as cursor:
+                    sql = f"UPDATE async_tasks SET {', '.join(assignments)} WHERE task_id = %s"
+                    cursor.execute(sql, params + [task_id])
+                    if cursor.rowcount > 0:
+                        return True
+            
+            # 影响行数为 0：任务不存在，或同一秒内重复写入相同的值
+            if AsyncTask.count("task_id = %s", (task_id,)) == 0:
                 logger.error(f"任务不存在: {task_id}")
                 return False
-            
-            return task.update_status(status, error_message, result_data)
+            return True
             
         except Exception as e:
             logger.error(f"更新任务状态异常: {str(e)}")
@@ -142,36 +182,31 @@ class StructureCheckDAO:
                 created_time=datetime.now()
             )
             
-            if not result.save():
+            # 检查项目
+            items = []
+            for item_data in check_data.get('check_results', []):
+                item = StructureCheckItem(
+                    task_id=task_id,
+                    item_id=item_data.get('item_id', ''),
+                    chapter=item_data.get('chapter', ''),
+                    name=item_data.get('name', ''),
+                    required=item_data.get('required', ''),
+                    item_type=item_data.get('item_type', ''),
+                    ai_applicable=item_data.get('ai_applicable', ''),
+                    description=item_data.get('description', ''),
+                    completeness_status=item_data.get('completeness_status', ''),
+                    completeness_score=item_data.get('completeness_score', 0.0),
+                    evidence=item_data.get('evidence', ''),
+                    detailed_result=item_data.get('detailed_result', ''),
+                    created_time=datetime.now()
+                )
+                items.append(item)
+            
+            # 主结果和检查项目在同一事务中写入
+            if not _save_result_with_items(result, StructureCheckItem, items):
                 logger.error(f"保存检查结果失败: {task_id}")
                 return False
             
-            # 保存检查项目
-            check_results = check_data.get('check_results', [])
-            if check_results:
-                items = []
-                for item_data in check_results:
-                    item = StructureCheckItem(
-                        task_id=task_id,
-                        item_id=item_data.get('item_id', ''),
-                        chapter=item_data.get('chapter', ''),
-                        name=item_data.get('name', ''),
-                        required=item_data.get('required', ''),
-                        item_type=item_data.get('item_type', ''),
-                        ai_applicable=item_data.get('ai_applicable', ''),
-                        description=item_data.get('description', ''),
-                        completeness_status=item_data.get('completeness_status', ''),
-                        completeness_score=item_data.get('completeness_score', 0.0),
-                        evidence=item_data.get('evidence', ''),
-                        detailed_result=item_data.get('detailed_result', ''),
-                        created_time=datetime.now()
-                    )
-                    items.append(item)
-                
-                if not StructureCheckItem.batch_insert(items):
-                    logger.error(f"保存检查项目失败: {task_id}")
-                    return False
-            
             logger.info(f"保存结构检查结果成功: {task_id}")
             return True
             
@@ -461,14 +496,10 @@ class ContentCheckDAO:
                 compliance_rate=summary.get('compliance_rate', 0.0)
             )
             
-            if not result.save():
-                logger.error(f"保存内容检查结果失败，任务ID: {task_id}")
-                return False
-            
-            # 保存详细检查项
-            check_results = result_data.get('check_results', [])
-            for item_data in check_results:
-                item = ContentCheckItem(
+            # 详细检查项
+            items = []
+            for item_data in result_data.get('check_results', []):
+                items.append(ContentCheckItem(
                     task_id=task_id,
                     item_number=item_data.get('item_number', ''),
                     category=item_data.get('category', ''),
@@ -478,10 +509,12 @@ class ContentCheckDAO:
                     evidence=item_data.get('evidence', ''),
                     detailed_result=item_data.get('detailed_result', ''),
                     chunk_count=item_data.get('chunk_count', 0)
-                )
-                
-                if not item.save():
-                    logger.warning(f"保存内容检查项失败，任务ID: {task_id}, 项目: {item_data.get('item_number')}")
+                ))
+            
+            # 主结果和检查项在同一事务中写入
+            if not _save_result_with_items(result, ContentCheckItem, items):
+                logger.error(f"保存内容检查结果失败，任务ID: {task_id}")
+                return False
             
             logger.info(f"内容检查结果保存成功，任务ID: {task_id}")
             return True
@@ -554,14 +587,10 @@ class CiteCheckDAO:
                 citation_rate=summary.get('citation_rate', 0.0)
             )
             
-            if not result.save():
-                logger.error(f"保存引用检查结果失败，任务ID: {task_id}")
-                return False
-            
-            # 保存详细引用项
-            citation_results = result_data.get('citation_results', [])
-            for item_data in citation_results:
-                item = CiteCheckItem(
+            # 详细引用项
+            items = []
+            for item_data in result_data.get('citation_results', []):
+                items.append(CiteCheckItem(
                     task_id=task_id,
                     citation_id=item_data.get('citation_id', ''),
                     title=item_data.get('title', ''),
@@ -579,10 +608,12 @@ class CiteCheckDAO:
                     evidence=item_data.get('evidence', ''),
                     detailed_result=item_data.get('detailed_result', ''),
                     chunk_count=item_data.get('chunk_count', 0)
-                )
-                
-                if not item.save():
-                    logger.warning(f"保存引用检查项失败，任务ID: {task_id}, 引用ID: {item_data.get('citation_id')}")
+                ))
+            
+            # 主结果和引用项在同一事务中写入
+            if not _save_result_with_items(result, CiteCheckItem, items):
+                logger.error(f"保存引用检查结果失败，任务ID: {task_id}")
+                return False
             
             logger.info(f"引用检查结果保存成功，任务ID: {task_id}")
             return True
@@ -631,3 +662,192 @@ class CiteCheckDAO:
         except Exception as e:
             logger.error(f"获取引用检查统计异常: {str(e)}")
             return {}
+
+class CallbackOutboxDAO:
+    """回调发件箱数据访问对象"""
+    
+    @staticmethod
+    def destination_of(callback_url: str) -> str:
+        """回调地址的目的地（host:port），同一目的地共享并发上限"""
+        parsed = urlparse(callback_url or "")
+        return (parsed.netloc or parsed.path).lower()[:255]
+    
+    @staticmethod
+    def enqueue(task_id: str, callback_url: str, payload: Dict) -> Optional[CallbackOutbox]:
+        """写入一条待发送的回调"""
+        try:
+            record = CallbackOutbox(
+                task_id=task_id,
+                callback_url=callback_url,
+                destination=CallbackOutboxDAO.destination_of(callback_url),
+                payload_data=payload
+            )
+            if record.save():
+                return record
+            logger.error(f"写入回调发件箱失败，任务ID: {task_id}")
+            return None
+        except Exception as e:
+            logger.error(f"写入回调发件箱异常: {str(e)}, 任务ID: {task_id}")
+            return None
+    
+    @staticmethod
+    def claim_due(claim_token: str, limit: int, lease_seconds: int,
+                  exclude_destinations: List[str] = None) -> Optional[List[CallbackOutbox]]:
+        """
+        领取到期的回调：pending 且到达重试时间，或 sending 但租约已过期（投递进程退出）的记录。
+        同一任务只领取最早一条未送达的回调，保证 processing 先于 success/failed 送达；
+        按 id 和状态条件更新，多个进程同时领取时每条只会被一个进程领到。数据库异常时返回 None
+        """
+        try:
+            now = datetime.now()
+            with get_db_connection() as conn:
+                if not conn:
+                    return []
+                
+                with conn.cursor() as cursor:
+                    sql = """
+                    SELECT o.id FROM callback_outbox o
+                    WHERE o.status IN ('pending', 'sending') AND o.next_attempt_time <= %s
+                    AND NOT EXISTS (
+                        SELECT 1 FROM callback_outbox e
+                        WHERE e.task_id = o.task_id AND e.id < o.id AND e.status IN ('pending', 'sending')
+                    )
+                    """
+                    params = [now]
+                    if exclude_destinations:
+                        sql += f" AND o.destination NOT IN ({', '.join(['%s'] * len(exclude_destinations))})"
+                        params.extend(exclude_destinations)
+                    sql += f" ORDER BY o.next_attempt_time LIMIT {int(limit)}"
+                    cursor.execute(sql, params)
+                    ids = [row['id'] for row in cursor.fetchall()]
+                    if not ids:
+                        return []
+                    
+                    placeholders = ', '.join(['%s'] * len(ids))
+                    cursor.execute(f"""
+                    UPDATE callback_outbox
+                    SET status = 'sending', claim_token = %s, next_attempt_time = %s, updated_time = %s
+                    WHERE id IN ({placeholders}) AND status IN ('pending', 'sending') AND next_attempt_time <= %s
+                    """, [claim_token, now + timedelta(seconds=lease_seconds), now, *ids, now])
+                    
+                    cursor.execute(
+                        "SELECT * FROM callback_outbox WHERE claim_token = %s AND status = 'sending' ORDER BY id",
+                        (claim_token,)
+                    )
+                    return [CallbackOutbox.from_dict(row) for row in cursor.fetchall()]
+                    
+        except Exception as e:
+            logger.error(f"领取待发送回调失败: {str(e)}")
+            return None
+    
+    @staticmethod
+    def _finish(record_id: int, claim_token: str, status: str, attempts: int, next_attempt_time: datetime = None,
+                status_code: int = None, error: str = None) -> bool:
+        """记录一次投递结果（只更新本进程领取的记录）"""
+        try:
+            now = datetime.now()
+            with get_db_connection() as conn:
+                if not conn:
+                    return False
+                
+                with conn.cursor() as cursor:
+                    sql = """
+                    UPDATE callback_outbox
+                    SET status = %s, attempts = %s, next_attempt_time = %s, last_status_code = %s,
+                        last_error = %s, claim_token = NULL, updated_time = %s, delivered_time = %s
+                    WHERE id = %s AND claim_token = %s
+                    """
+                    cursor.execute(sql, (
+                        status, attempts, next_attempt_time or now, status_code,
+                        error[:2000] if error else None, now, now if status == 'delivered' else None,
+                        record_id, claim_token
+                    ))
+                    return cursor.rowcount > 0
+                    
+        except Exception as e:
+            logger.error(f"更新回调投递状态失败: {str(e)}, 记录ID: {record_id}")
+            return False
+    
+    @staticmethod
+    def mark_delivered(record: CallbackOutbox, status_code: int) -> bool:
+        return CallbackOutboxDAO._finish(record.id, record.claim_token, 'delivered', record.attempts + 1,
+                                         status_code=status_code)
+    
+    @staticmethod
+    def mark_retry(record: CallbackOutbox, next_attempt_time: datetime, status_code: int = None,
+                   error: str = None) -> bool:
+        return CallbackOutboxDAO._finish(record.id, record.claim_token, 'pending', record.attempts + 1,
+                                         next_attempt_time, status_code, error)
+    
+    @staticmethod
+    def mark_dead(record: CallbackOutbox, status_code: int = None, error: str = None) -> bool:
+        return CallbackOutboxDAO._finish(record.id, record.claim_token, 'dead', record.attempts + 1,
+                                         status_code=status_code, error=error)
+    
+    @staticmethod
+    def release(record: CallbackOutbox) -> bool:
+        """归还领取后未投递的记录（目的地并发已满），不计入尝试次数"""
+        return CallbackOutboxDAO._finish(record.id, record.claim_token, 'pending', record.attempts)
+    
+    @staticmethod
+    def requeue_dead(task_id: str = None) -> int:
+        """把死信重新置为待发送（可按任务ID），返回记录数"""
+        try:
+            now = datetime.now()
+            with get_db_connection() as conn:
+                if not conn:
+                    return 0
+                
+                with conn.cursor() as cursor:
+                    sql = """
+                    UPDATE callback_outbox SET status = 'pending', attempts = 0, next_attempt_time = %s, updated_time = %s
+                    WHERE status = 'dead'
+                    """
+                    params = [now, now]
+                    if task_id:
+                        sql += " AND task_id = %s"
+                        params.append(task_id)
+                    cursor.execute(sql, params)
+                    return cursor.rowcount
+                    
+        except Exception as e:
+            logger.error(f"重新投递死信失败: {str(e)}")
+            return 0
+    
+    @staticmethod
+    def get_status_counts() -> Dict[str, int]:
+        """各状态的回调数量"""
+        try:
+            with get_db_connection() as conn:
+                if not conn:
+                    return {}
+                
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT status, COUNT(*) AS count FROM callback_outbox GROUP BY status")
+                    return {row['status']: row['count'] for row in cursor.fetchall()}
+                    
+        except Exception as e:
+            logger.error(f"统计回调发件箱失败: {str(e)}")
+            return {}
+    
+    @staticmethod
+    def cleanup_delivered(days: int = 7) -> int:
+        """清理已送达的旧回调"""
+        try:
+            cutoff_time = datetime.now() - timedelta(days=days)
+            with get_db_connection() as conn:
+                if not conn:
+                    return 0
+                
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "DELETE FROM callback_outbox WHERE status = 'delivered' AND delivered_time < %s",
+                        (cutoff_time,)
+                    )
+                    deleted_count = cursor.rowcount
+                    logger.info(f"清理了 {deleted_count} 条已送达的回调")
+                    return deleted_count
+                    
+        except Exception as e:
+            logger.error(f"清理已送达回调失败: {str(e)}")
+            return 0
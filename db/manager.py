@@ -6,7 +6,7 @@ import logging
 from typing import Dict, Any
 from db.connection import initialize_database, test_connection, close_connection_pool
 from db.models import create_all_tables, drop_all_tables
-from db.dao import AsyncTaskDAO, StructureCheckDAO, DocumentDAO
+from db.dao import AsyncTaskDAO, StructureCheckDAO, DocumentDAO, CallbackOutboxDAO
 
 logger = logging.getLogger(__name__)
 
@@ -88,7 +88,8 @@ class DatabaseManager:
             result = {
                 'cleaned_tasks': 0,
                 'cleaned_files': 0,
-                'cleaned_records': 0
+                'cleaned_records': 0,
+                'cleaned_callbacks': 0
             }
             
             # 清理旧任务
@@ -100,6 +101,9 @@ class DatabaseManager:
             result['cleaned_files'] = cleaned_files
             result['cleaned_records'] = cleaned_records
             
+            # 清理已送达的回调
+            result['cleaned_callbacks'] = CallbackOutboxDAO.cleanup_delivered(days=days)
+            
             logger.info(f"数据清理完成: {result}")
             return result
             
@@ -247,43 +247,6 @@ class StructureCheckItem(BaseModel):
         """根据任务ID查找所有检查项"""
         return cls.find_all("task_id = %s ORDER BY item_id", (task_id,))
     
-    @classmethod
-    def batch_insert(cls, items: List['StructureCheckItem']) -> bool:
-        """批量插入检查项"""
-        if not items:
-            return True
-        
-        try:
-            with get_db_connection() as conn:
-                if not conn:
-                    return False
-                
-                with conn.cursor() as cursor:
-                    sql = """
-                    INSERT INTO structure_check_items 
-                    (task_id, item_id, chapter, name, required, item_type, ai_applicable, 
-                     description, completeness_status, completeness_score, evidence, 
-                     detailed_result, created_time)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    
-                    values = []
-                    for item in items:
-                        values.append((
-                            item.task_id, item.item_id, item.chapter, item.name,
-                            item.required, item.item_type, item.ai_applicable,
-                            item.description, item.completeness_status, item.completeness_score,
-                            item.evidence, item.detailed_result, item.created_time
-                        ))
-                    
-                    cursor.executemany(sql, values)
-                    logger.info(f"批量插入{len(items)}条检查项记录成功")
-                    return True
-                    
-        except Exception as e:
-            logger.error(f"批量插入检查项失败: {str(e)}")
-            return False
-    
     @classmethod
     def create_table(cls) -> bool:
         """创建structure_check_items表"""
@@ -663,10 +626,83 @@ class CiteCheckItem(BaseModel):
             logger.error(f"创建cite_check_items表失败: {str(e)}")
             return False
 
+@dataclass
+class CallbackOutbox(BaseModel):
+    """回调发件箱：待发送的任务回调，由 CallbackDispatcher 投递"""
+    table_name = "callback_outbox"
+    primary_key = "id"
+    
+    id: Optional[int] = None
+    task_id: str = ""
+    callback_url: str = ""
+    destination: str = ""  # 回调地址的 host:port，按目的地限制并发
+    payload_data: Optional[Dict] = None
+    status: str = "pending"  # pending, sending, delivered, dead
+    attempts: int = 0
+    claim_token: Optional[str] = None
+    last_status_code: Optional[int] = None
+    last_error: Optional[str] = None
+    next_attempt_time: Optional[datetime] = None
+    created_time: Optional[datetime] = None
+    updated_time: Optional[datetime] = None
+    delivered_time: Optional[datetime] = None
+    
+    def __post_init__(self):
+        if self.created_time is None:
+            self.created_time = datetime.now()
+        if self.updated_time is None:
+            self.updated_time = self.created_time
+        if self.next_attempt_time is None:
+            self.next_attempt_time = self.created_time
+    
+    @classmethod
+    def find_by_task_id(cls, task_id: str) -> List['CallbackOutbox']:
+        """根据任务ID查找回调记录"""
+        return cls.find_all("task_id = %s ORDER BY id", (task_id,))
+    
+    @classmethod
+    def create_table(cls) -> bool:
+        """创建callback_outbox表"""
+        try:
+            with get_db_connection() as conn:
+                if not conn:
+                    return False
+                
+                with conn.cursor() as cursor:
+                    sql = """
+                    CREATE TABLE IF NOT EXISTS callback_outbox (
+                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                        task_id VARCHAR(100) NOT NULL,
+                        callback_url VARCHAR(500) NOT NULL,
+                        destination VARCHAR(255) NOT NULL,
+                        payload_data LONGTEXT,
+                        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                        attempts INT NOT NULL DEFAULT 0,
+                        claim_token VARCHAR(64),
+                        last_status_code INT,
+                        last_error TEXT,
+                        next_attempt_time DATETIME NOT NULL,
+                        created_time DATETIME NOT NULL,
+                        updated_time DATETIME NOT NULL,
+                        delivered_time DATETIME,
+                        INDEX idx_status_next (status, next_attempt_time),
+                        INDEX idx_task_id (task_id),
+                        INDEX idx_claim_token (claim_token),
+                        INDEX idx_created_time (created_time)
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                    """
+                    cursor.execute(sql)
+                    logger.info("创建callback_outbox表成功")
+                    return True
+                    
+        except Exception as e:
+            logger.error(f"创建callback_outbox表失败: {str(e)}")
+            return False
+
 def create_all_tables() -> bool:
     """创建所有数据表"""
     models = [AsyncTask, StructureCheckResult, StructureCheckItem, DocumentReference, 
-              ContentCheckResult, ContentCheckItem, CiteCheckResult, CiteCheckItem]
+              ContentCheckResult, ContentCheckItem, CiteCheckResult, CiteCheckItem, CallbackOutbox]
     
     success_count = 0
     for model in models:
@@ -685,7 +721,7 @@ def create_all_tables() -> bool:
 def drop_all_tables() -> bool:
     """删除所有数据表"""
     models = [AsyncTask, StructureCheckResult, StructureCheckItem, DocumentReference,
-              ContentCheckResult, ContentCheckItem, CiteCheckResult, CiteCheckItem]
+              ContentCheckResult, ContentCheckItem, CiteCheckResult, CiteCheckItem, CallbackOutbox]
     
     success_count = 0
     for model in models:
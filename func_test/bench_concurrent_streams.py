@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发流式查询压测：同时打开 N 个 /ra_check/stream_query 流，统计完成数、首帧延迟和总耗时
+
+用法（先启动服务并上传方案）：
+    python app.py                 # WSGI（每个流占用一个线程）
+    python asgi.py                # ASGI（流式查询由协程处理）
+    python func_test/bench_concurrent_streams.py --plan-id <方案ID> --streams 200
+    python func_test/bench_concurrent_streams.py --plan-id <方案ID> --streams 1000 --url http://localhost:5000
+
+服务端设置了 LLM_MAX_CONCURRENCY 时，超出部分在服务端排队；
+对比两种模式时请保持 LLM_MAX_CONCURRENCY 为 0（默认不限）或不小于 --streams，LLM_MAX_CONNECTIONS 不小于 --streams
+"""
+import time
+import asyncio
+import argparse
+
+import httpx
+
+
+async def open_stream(client, url, payload):
+    """返回 (是否收到完成帧, 首帧延迟, 总耗时, 错误)"""
+    start = time.perf_counter()
+    first = None
+    body = b""
+    try:
+        async with client.stream("POST", url, json=payload) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                if first is None:
+                    first = time.perf_counter() - start
+                body += chunk
+    except Exception as e:
+        return False, first, time.perf_counter() - start, repr(e)
+    return b'"complete"' in body, first, time.perf_counter() - start, None
+
+
+async def run(args):
+    url = f"{args.url.rstrip('/')}/ra_check/stream_query"
+    payload = {"plan_id": args.plan_id, "query": args.query, "top_k": args.top_k, "model": args.model}
+    limits = httpx.Limits(max_connections=args.streams, max_keepalive_connections=args.streams)
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*[open_stream(client, url, payload) for _ in range(args.streams)])
+        elapsed = time.perf_counter() - start
+
+    completed = [r for r in results if r[0]]
+    firsts = sorted(r[1] for r in results if r[1] is not None)
+    errors = [r[3] for r in results if r[3]]
+    print(f"并发流 {args.streams}，完成 {len(completed)}，失败 {len(errors)}，总耗时 {elapsed:.2f}s")
+    if firsts:
+        print(f"首帧延迟 p50 {firsts[len(firsts) // 2] * 1000:.0f} ms，"
+              f"p95 {firsts[min(len(firsts) - 1, int(len(firsts) * 0.95))] * 1000:.0f} ms")
+    for error in errors[:5]:
+        print(f"  {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发流式查询压测")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--plan-id", required=True)
+    parser.add_argument("--query", default="脚手架的搭设要求是什么？")
+    parser.add_argument("--model", default="qwen2.5:7b")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--streams", type=int, default=100, help="同时打开的流数")
+    parser.add_argument("--timeout", type=float, default=600)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+提示词布局的首 token 延迟对比：classic（原有布局）与 prefix（系统提示 + 方案概要作为固定前缀）
+
+用法：
+    python func_test/bench_prefix_cache.py                              # 使用内置的模拟服务
+    python func_test/bench_prefix_cache.py --plan 方案.txt --items 14
+    python func_test/bench_prefix_cache.py --api-base http://localhost:8000/v1 --model qwen2.5:7b
+
+内置模拟服务按 OpenAI 流式接口返回，预填充耗时与未命中前缀缓存的 token 数成正比
+（按 --block-chars 个字符一块计算前缀哈希，与 vLLM 的分块前缀缓存类似）。
+指定 --api-base 时对真实服务（vLLM / Ollama 等开启前缀缓存）测量。
+"""
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from objs.TextChunker import TextChunker
+from objs.PlanAuditor import PlanAuditor
+from objs.LexicalIndex import LexicalIndex
+from utils.token_counter import estimate_tokens
+from utils.context_packer import pack_context, context_budget
+from utils.prompts import get_batch_check_messages
+from config.settings import CHUNK_CONFIG, PROMPT_CONFIG
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StandInServer:
+    """模拟带前缀缓存的模型服务"""
+
+    def __init__(self, prefill_ms_per_token=0.5, block_chars=64, capacity_blocks=20000):
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.block_chars = block_chars
+        self.capacity_blocks = capacity_blocks
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+        self.httpd = None
+
+    def prefill_seconds(self, prompt: str) -> float:
+        """返回预填充耗时，并把本次提示词的各块加入缓存"""
+        hashes, digest = [], hashlib.sha1()
+        for i in range(0, len(prompt), self.block_chars):
+            digest.update(prompt[i:i + self.block_chars].encode("utf-8"))
+            hashes.append((digest.hexdigest(), i + self.block_chars))
+        with self.lock:
+            cached_chars = 0
+            for block_hash, end in hashes:
+                if block_hash not in self.blocks:
+                    break
+                self.blocks.move_to_end(block_hash)
+                cached_chars = min(end, len(prompt))
+            for block_hash, _ in hashes:
+                self.blocks[block_hash] = True
+                self.blocks.move_to_end(block_hash)
+            while len(self.blocks) > self.capacity_blocks:
+                self.blocks.popitem(last=False)
+        return estimate_tokens(prompt[cached_chars:]) * self.prefill_ms_per_token / 1000
+
+    def start(self) -> str:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                # 聊天模板把各条消息依次拼接，系统提示在最前
+                prompt = "".join(f"<|{m['role']}|>{m['content']}" for m in body.get("messages", []))
+                time.sleep(server.prefill_seconds(prompt))
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for token in ("1. 合规性判断：合规", "\n2. 置信度：0.8", "\n3. 判断依据：……"):
+                    chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(0.005)
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+
+
+def time_to_first_token(session, api_base, model, messages, api_key="EMPTY"):
+    """发送流式请求，返回收到第一个内容片段的耗时（秒）"""
+    start = time.perf_counter()
+    response = session.post(
+        f"{api_base.rstrip('/')}/chat/completions",
+        json={"model": model, "messages": messages, "stream": True, "temperature": 0.1, "max_tokens": 16},
+        headers={"Authorization": f"Bearer {api_key}"}, stream=True, timeout=300
+    )
+    response.raise_for_status()
+    first = None
+    for line in response.iter_lines():
+        if not line or not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            break
+        delta = json.loads(data)["choices"][0].get("delta", {})
+        if first is None and delta.get("content"):
+            first = time.perf_counter() - start
+    response.close()
+    return first if first is not None else time.perf_counter() - start
+
+
+def synthetic_plan(sections=30, seed=0):
+    """生成带章节标题的模拟施工方案"""
+    rng = random.Random(seed)
+    words = ["脚手架", "模板支撑", "安全带", "临边防护", "混凝土浇筑", "钢筋绑扎", "塔吊", "基坑支护",
+             "应急预案", "技术交底", "验收", "监测", "荷载", "立杆间距", "扫地杆", "剪刀撑", "GB 50204-2015"]
+    lines = []
+    for i in range(1, sections + 1):
+        lines.append(f"{i} 第{i}章 {rng.choice(words)}施工要求")
+        for j in range(1, 4):
+            lines.append(f"{i}.{j} {rng.choice(words)}")
+            lines.append("".join(f"{rng.choice(words)}应符合设计及规范要求，" for _ in range(25)) + "。")
+    return "\n".join(lines)
+
+
+class PlanStub:
+    """只提供 plan_digest 所需的字段，避免为基准测试调用嵌入接口"""
+
+    plan_digest = PlanAuditor.plan_digest
+
+    def __init__(self, plan_content):
+        chunks = TextChunker(CHUNK_CONFIG.max_tokens, CHUNK_CONFIG.overlap_tokens, CHUNK_CONFIG.min_tokens).split(plan_content)
+        self.plan_content = plan_content
+        self.chunks = [c.text for c in chunks]
+        self.chunk_meta = [c.to_meta() for c in chunks]
+        self._digest = None
+        self.lexical = LexicalIndex().build(self.chunks)
+
+    def search(self, query, top_k):
+        return [{"text": self.chunks[idx], "index": idx} for idx, _ in self.lexical.search(query, top_k)]
+
+
+def build_requests(plan, items, layout, model, top_k):
+    digest = plan.plan_digest() if layout == "prefix" else ""
+    result = []
+    for item in items:
+        scenario, category = item.get("专项施工方案严重缺陷情形", ""), item.get("分类", "")
+        context = pack_context(plan.search(scenario, top_k), context_budget(model, scenario, digest))
+        result.append(get_batch_check_messages(scenario, category, context, digest, layout=layout))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提示词布局首 token 延迟对比")
+    parser.add_argument("--api-base", default=None, help="真实服务地址（OpenAI 兼容），不指定时使用内置模拟服务")
+    parser.add_argument("--model", default="qwen2.5:7b")
+    parser.add_argument("--plan", default=None, help="方案文本文件（.txt），默认生成模拟方案")
+    parser.add_argument("--checklist", default=os.path.join(ROOT, "data", "checklist", "weakness_list.jsonl"))
+    parser.add_argument("--items", type=int, default=14, help="检查项数")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--prefill-ms", type=float, default=0.5, help="模拟服务每个未缓存 token 的预填充耗时（毫秒）")
+    parser.add_argument("--block-chars", type=int, default=64, help="模拟服务前缀缓存的分块大小（字符）")
+    args = parser.parse_args()
+
+    if args.plan:
+        with open(args.plan, "r", encoding="utf-8") as f:
+            plan_content = f.read()
+    else:
+        plan_content = synthetic_plan()
+    with open(args.checklist, "r", encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()][:args.items]
+
+    plan = PlanStub(plan_content)
+    print(f"方案 {len(plan_content)} 字符，{len(plan.chunks)} 个文本块，检查项 {len(items)} 个，"
+          f"概要 {estimate_tokens(plan.plan_digest())} tokens")
+
+    results = {}
+    for layout in ("classic", "prefix"):
+        # 每种布局使用全新的模拟服务（缓存为空），真实服务请在两轮之间自行重启或清空缓存
+        server = None
+        api_base = args.api_base
+        if api_base is None:
+            server = StandInServer(args.prefill_ms, args.block_chars)
+            api_base = server.start()
+        session = requests.Session()
+        ttfts = [time_to_first_token(session, api_base, args.model, messages)
+                 for messages in build_requests(plan, items, layout, args.model, args.top_k)]
+        if server:
+            server.stop()
+        results[layout] = ttfts
+
+    print(f"\n{'布局':<10}{'首项(ms)':>10}{'其余平均(ms)':>14}{'p50(ms)':>10}{'总计(ms)':>10}")
+    for layout, ttfts in results.items():
+        rest = sorted(ttfts[1:]) or ttfts
+        print(f"{layout:<10}{ttfts[0] * 1000:>10.1f}{sum(rest) / len(rest) * 1000:>14.1f}"
+              f"{rest[len(rest) // 2] * 1000:>10.1f}{sum(ttfts) * 1000:>10.1f}")
+    if PROMPT_CONFIG.layout != "prefix":
+        print("\n当前 PROMPT_LAYOUT=classic，设置 PROMPT_LAYOUT=prefix 启用前缀布局")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量存储模式对比：float32 / float16 / int8 的召回率与索引大小
+
+用法：
+    python func_test/bench_quantization.py                    # 使用 cache/ 中已缓存方案的向量
+    python func_test/bench_quantization.py --synthetic 20000  # 缓存为空时使用随机向量
+
+召回率以 float32 精确检索的 top-k 为基准，查询向量取自样本向量并加少量噪声。
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import numpy as np
+import faiss
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from objs.VectorIndex import STORAGE_MODES, build_index, index_vectors
+
+
+def load_cached_vectors(cache_dir):
+    """读取缓存目录下所有方案索引中的向量，按维度分组，返回样本最多的一组"""
+    groups = {}
+    for faiss_file in glob.glob(os.path.join(cache_dir, "*", "faiss.idx")):
+        try:
+            vectors = index_vectors(faiss.read_index(faiss_file))
+        except RuntimeError as e:
+            print(f"跳过 {faiss_file}: {e}")
+            continue
+        groups.setdefault(vectors.shape[1], []).append(vectors)
+    if not groups:
+        return None
+    dim = max(groups, key=lambda d: sum(len(v) for v in groups[d]))
+    return np.vstack(groups[dim]).astype(np.float32)
+
+
+def make_queries(vectors, n_queries, seed=0):
+    """从样本中抽取向量加噪声作为查询"""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    scale = float(np.std(vectors)) * 0.1
+    return np.ascontiguousarray(picks + rng.normal(0, scale, picks.shape).astype(np.float32))
+
+
+def recall_at_k(truth, found, k):
+    """found 前 k 个结果中命中 truth 前 k 个的比例"""
+    hits = sum(len(set(t[:k]) & set(f[:k])) for t, f in zip(truth, found))
+    return hits / float(len(truth) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储模式召回率 / 大小对比")
+    parser.add_argument("--cache-dir", default="cache", help="方案缓存目录")
+    parser.add_argument("--synthetic", type=int, default=0, help="使用 N 个随机向量代替缓存向量")
+    parser.add_argument("--dim", type=int, default=768, help="随机向量维度")
+    parser.add_argument("--queries", type=int, default=200, help="查询数")
+    parser.add_argument("--top-k", type=int, default=10, help="召回率计算的 k")
+    args = parser.parse_args()
+
+    vectors = None if args.synthetic else load_cached_vectors(args.cache_dir)
+    if vectors is None:
+        n = args.synthetic or 10000
+        print(f"使用 {n} 个 {args.dim} 维随机向量")
+        vectors = np.random.default_rng(1).normal(size=(n, args.dim)).astype(np.float32)
+    else:
+        print(f"使用缓存向量 {vectors.shape[0]} 个，维度 {vectors.shape[1]}")
+
+    queries = make_queries(vectors, args.queries)
+    k = min(args.top_k, len(vectors))
+
+    truth = None
+    base_size = None
+    print(f"\n{'模式':<10}{'索引大小':>12}{'每向量字节':>12}{'相对大小':>10}{'recall@1':>10}"
+          f"{f'recall@{k}':>11}{'构建(ms)':>11}{'查询(ms/次)':>13}")
+    for storage in STORAGE_MODES:
+        t0 = time.perf_counter()
+        index = build_index(vectors, storage)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        _, found = index.search(queries, k)
+        query_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        if truth is None:
+            truth = found
+        size = len(faiss.serialize_index(index))
+        base_size = base_size or size
+        print(f"{storage:<10}{size / 1024 / 1024:>10.2f}MB{size / len(vectors):>12.1f}"
+              f"{size / base_size:>10.2f}{recall_at_k(truth, found, 1):>10.3f}"
+              f"{recall_at_k(truth, found, k):>11.3f}{build_ms:>11.1f}{query_ms:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
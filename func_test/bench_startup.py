@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准：用 python -X importtime 测量导入耗时，检查重型模块是否被提前导入
+
+用法：
+    python func_test/bench_startup.py                         # 测量 import app
+    python func_test/bench_startup.py --module objs.PlanAuditor --budget-ms 300
+    python func_test/bench_startup.py --runs 5 --top 20
+
+超出预算或导入了禁止的重型模块时退出码为 1，可用于 CI。
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 启动时不应导入的模块（应在首次使用时导入）
+HEAVY_MODULES = ("faiss", "openai", "docx", "tqdm", "sklearn", "requests", "jieba")
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def measure(module):
+    """在子进程中导入模块，返回 [(模块名, 自身耗时us, 累计耗时us, 层级)]"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        raise SystemExit(f"导入 {module} 失败")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动导入耗时基准")
+    parser.add_argument("--module", default="app", help="要测量的模块（默认 app）")
+    parser.add_argument("--runs", type=int, default=3, help="测量次数，取中位数")
+    parser.add_argument("--top", type=int, default=15, help="显示累计耗时最高的模块数")
+    parser.add_argument("--budget-ms", type=float, default=800, help="导入耗时预算（毫秒）")
+    args = parser.parse_args()
+
+    totals, last_rows = [], []
+    for _ in range(max(1, args.runs)):
+        rows = measure(args.module)
+        total = next((cum for name, _, cum, _ in rows if name == args.module), 0)
+        totals.append(total / 1000)
+        last_rows = rows
+    totals.sort()
+    median = totals[len(totals) // 2]
+
+    print(f"import {args.module}: 中位数 {median:.1f} ms（{', '.join(f'{t:.1f}' for t in totals)}）")
+    print(f"\n累计耗时最高的 {args.top} 个模块：")
+    print(f"{'累计(ms)':>10}{'自身(ms)':>10}  模块")
+    for name, self_us, cum_us, level in sorted(last_rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cum_us / 1000:>10.1f}{self_us / 1000:>10.1f}  {'  ' * level}{name}")
+
+    imported = {name.split(".")[0] for name, _, _, _ in last_rows}
+    eager = [name for name in HEAVY_MODULES if name in imported]
+
+    failed = False
+    if eager:
+        print(f"\n启动时导入了重型模块: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\n导入耗时 {median:.1f} ms 超出预算 {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print(f"\n通过：未提前导入重型模块，耗时在预算 {args.budget_ms:.0f} ms 内")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
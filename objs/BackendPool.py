@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型服务负载均衡
+按配置把同一个服务地址（请求中传入的 openai_api_base）映射到多个实际服务节点，
+按未完成请求数最少选择节点；连续失败的节点被暂时摘除，到期后重新参与分配
+"""
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import List, Optional
+
+from .RateLimiter import is_overload_error
+from config.settings import BACKEND_POOL_CONFIG
+
+
+def normalize_base(api_base: str) -> str:
+    """服务地址归一化（忽略末尾的 /）"""
+    return (api_base or "").strip().rstrip("/")
+
+
+class Endpoint:
+    """单个服务节点的状态"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def status(self, now: float) -> dict:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.consecutive_failures,
+            "ejected": not self.available(now),
+            "ejected_seconds_left": round(max(0.0, self.ejected_until - now), 1)
+        }
+
+
+class BackendPool:
+    """一组提供相同模型的服务节点"""
+
+    def __init__(self, api_base: str, endpoints: List[str], models: List[str] = None,
+                 eject_after: int = None, eject_seconds: float = None, eject_max_seconds: float = None):
+        config = BACKEND_POOL_CONFIG
+        self.api_base = normalize_base(api_base)
+        self.endpoints = [Endpoint(url) for url in endpoints]
+        # 为空表示该服务地址的所有模型都走这组节点
+        self.models = set(models or [])
+        self.eject_after = eject_after or config.eject_after
+        self.eject_seconds = eject_seconds or config.eject_seconds
+        self.eject_max_seconds = eject_max_seconds or config.eject_max_seconds
+        self._lock = threading.Lock()
+
+    def serves(self, model: str) -> bool:
+        return not self.models or model in self.models
+
+    def _choose(self) -> Endpoint:
+        """未完成请求最少的可用节点；全部被摘除时选最早恢复的节点"""
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.available(now)]
+        if not candidates:
+            return min(self.endpoints, key=lambda e: e.ejected_until)
+        return min(candidates, key=lambda e: (e.outstanding, e.consecutive_failures, random.random()))
+
+    def _record(self, endpoint: Endpoint, failed: bool):
+        with self._lock:
+            endpoint.outstanding -= 1
+            if not failed:
+                endpoint.consecutive_failures = 0
+                endpoint.ejections = 0
+                return
+            endpoint.errors += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.eject_after:
+                # 多次被摘除的节点摘除时长翻倍
+                seconds = min(self.eject_max_seconds, self.eject_seconds * (2 ** endpoint.ejections))
+                endpoint.ejected_until = time.monotonic() + seconds
+                endpoint.ejections += 1
+                endpoint.consecutive_failures = 0
+                print(f"服务节点 {endpoint.url} 连续失败，摘除 {seconds:.0f} 秒")
+
+    @contextmanager
+    def lease(self):
+        """选择一个节点并占用到代码块结束，返回节点地址；过载类异常计为节点失败"""
+        with self._lock:
+            endpoint = self._choose()
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        failed = False
+        try:
+            yield endpoint.url
+        except Exception as e:
+            failed = is_overload_error(e)
+            raise
+        finally:
+            self._record(endpoint, failed)
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "api_base": self.api_base,
+                "models": sorted(self.models),
+                "endpoints": [e.status(now) for e in self.endpoints]
+            }
+
+
+_pools: Optional[List[BackendPool]] = None
+_pools_lock = threading.Lock()
+
+
+def load_pools(raw: str = None) -> List[BackendPool]:
+    """
+    解析节点池配置（JSON 列表），例如：
+    [{"api_base": "http://59.77.7.24:11434/v1/",
+      "endpoints": ["http://gpu1:11434/v1/", "http://gpu2:11434/v1/"],
+      "models": ["qwen2.5:7b", "bge-m3"]}]
+    """
+    raw = BACKEND_POOL_CONFIG.pools if raw is None else raw
+    if not raw:
+        return []
+    try:
+        items = json.loads(raw)
+    except json.JSONDecodeError as e:
+        print(f"节点池配置不是合法的 JSON，忽略: {e}")
+        return []
+    pools = []
+    for item in items:
+        endpoints = [url for url in item.get("endpoints", []) if url]
+        if not item.get("api_base") or not endpoints:
+            print(f"节点池配置缺少 api_base 或 endpoints，忽略: {item}")
+            continue
+        pools.append(BackendPool(item["api_base"], endpoints, item.get("models")))
+    return pools
+
+
+def get_pools() -> List[BackendPool]:
+    """进程内共享的节点池（首次使用时按配置创建）"""
+    global _pools
+    with _pools_lock:
+        if _pools is None:
+            _pools = load_pools()
+        return _pools
+
+
+def find_pool(api_base: str, model: str = None) -> Optional[BackendPool]:
+    """查找服务该地址和模型的节点池，没有配置时返回 None"""
+    base = normalize_base(api_base)
+    for pool in get_pools():
+        if pool.api_base == base and (model is None or pool.serves(model)):
+            return pool
+    return None
+
+
+@contextmanager
+def backend_lease(api_base: str, model: str = None):
+    """返回本次调用实际使用的服务地址；未配置节点池时即为 api_base 本身"""
+    pool = find_pool(api_base, model)
+    if pool is None:
+        yield api_base
+        return
+    with pool.lease() as url:
+        yield url
+
+
+def backend_pool_stats() -> List[dict]:
+    """所有节点池的当前状态"""
+    return [pool.status() for pool in get_pools()]
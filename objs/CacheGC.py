@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存回收
+按容量上限以最近访问时间（LRU）淘汰方案缓存，清理没有映射的孤立目录和文件夹已丢失的映射；
+正在执行的任务使用的方案可固定（pin），不会被回收。后台线程定期执行，删除按速率限制进行。
+固定同时在方案文件夹中写入 .pin-<主机名>-<进程号> 文件，其他 worker 进程的回收同样跳过；
+进程异常退出留下的固定文件，同一主机上按进程是否存在判断，其他主机上超过 PIN_STALE_SECONDS 后失效
+"""
+import os
+import time
+import socket
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List
+
+from .CorpusIndex import CorpusIndex
+from .FileManager import get_file_manager
+from config.settings import CACHE_CONFIG
+
+# 被固定的方案 hash -> 引用计数（同一进程内共享）
+_pins = Counter()
+# 被固定的方案 hash -> 本进程写入的固定文件
+_pin_files: Dict[str, str] = {}
+_pins_lock = threading.Lock()
+# 当前线程的固定作用域，作用域内访问的方案自动固定
+_scope = threading.local()
+
+PIN_PREFIX = ".pin-"
+# 其他主机写入的固定文件无法判断进程是否存在，超过该时长视为失效
+PIN_STALE_SECONDS = 24 * 3600
+
+
+def _pin_file_name() -> str:
+    return f"{PIN_PREFIX}{socket.gethostname()}-{os.getpid()}"
+
+
+def pin(plan_id: str, folder: str = None):
+    """固定方案缓存，unpin 之前不会被回收；给出方案文件夹时其他进程的回收也会跳过"""
+    with _pins_lock:
+        _pins[plan_id] += 1
+        if folder and plan_id not in _pin_files and os.path.isdir(folder):
+            pin_file = os.path.join(folder, _pin_file_name())
+            try:
+                open(pin_file, 'w').close()
+                _pin_files[plan_id] = pin_file
+            except OSError as e:
+                print(f"写入缓存固定文件失败: {pin_file}, {e}")
+
+
+def unpin(plan_id: str):
+    """解除一次固定"""
+    with _pins_lock:
+        _pins[plan_id] -= 1
+        if _pins[plan_id] <= 0:
+            del _pins[plan_id]
+            pin_file = _pin_files.pop(plan_id, None)
+            if pin_file:
+                try:
+                    os.remove(pin_file)
+                except OSError:
+                    pass
+
+
+def _pin_file_alive(path: str, name: str) -> bool:
+    """固定文件对应的进程是否仍在运行"""
+    host, _, pid = name[len(PIN_PREFIX):].rpartition("-")
+    if host == socket.gethostname() and pid.isdigit() and os.name != "nt":
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+        return True
+    try:
+        return time.time() - os.path.getmtime(path) < PIN_STALE_SECONDS
+    except OSError:
+        return False
+
+
+def _pinned_on_disk(folder: str) -> bool:
+    """方案文件夹中是否有仍有效的固定文件（顺带删除失效的）"""
+    try:
+        names = [name for name in os.listdir(folder) if name.startswith(PIN_PREFIX)]
+    except OSError:
+        return False
+    pinned = False
+    for name in names:
+        path = os.path.join(folder, name)
+        if _pin_file_alive(path, name):
+            pinned = True
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return pinned
+
+
+def is_pinned(plan_id: str, folder: str = None) -> bool:
+    """方案是否被本进程固定，给出文件夹时同时检查其他进程的固定文件"""
+    with _pins_lock:
+        if _pins.get(plan_id, 0) > 0:
+            return True
+    return bool(folder) and _pinned_on_disk(folder)
+
+
+@contextmanager
+def pinning():
+    """
+    固定作用域：作用域内本线程通过 mark_access 访问的方案都被固定，退出时统一解除
+    用于包住一次完整的检查任务
+    """
+    outer = getattr(_scope, "plans", None)
+    _scope.plans = []
+    try:
+        yield
+    finally:
+        for plan_id in _scope.plans:
+            unpin(plan_id)
+        _scope.plans = outer
+
+
+def mark_access(plan_id: str, folder: str):
+    """记录方案缓存的访问时间（更新文件夹修改时间），在固定作用域内时同时固定"""
+    if folder and os.path.isdir(folder):
+        try:
+            os.utime(folder)
+        except OSError:
+            pass
+    plans = getattr(_scope, "plans", None)
+    if plan_id and plans is not None and plan_id not in plans:
+        pin(plan_id, folder)
+        plans.append(plan_id)
+
+
+def _tree_size(path: str) -> int:
+    """文件或目录占用的字节数"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class CacheGC:
+    """缓存目录回收器"""
+
+    def __init__(self, cache_dir: str, file_manager=None, max_bytes: int = None,
+                 grace_seconds: int = None, delete_rate_mb: float = None):
+        self.cache_dir = cache_dir
+        self.file_manager = file_manager or get_file_manager(cache_dir)
+        self.max_bytes = CACHE_CONFIG.max_bytes if max_bytes is None else max_bytes
+        self.grace_seconds = CACHE_CONFIG.gc_grace_seconds if grace_seconds is None else grace_seconds
+        rate_mb = CACHE_CONFIG.gc_delete_rate_mb if delete_rate_mb is None else delete_rate_mb
+        self.delete_rate = int(rate_mb * 1024 * 1024) if rate_mb and rate_mb > 0 else 0
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- 删除 ----------
+
+    def _remove(self, path: str) -> int:
+        """逐个文件删除，按速率限制休眠，返回释放的字节数"""
+        if os.path.isfile(path):
+            files, dirs = [path], []
+        else:
+            files, dirs = [], []
+            # 自底向上遍历，子目录先于上级目录删除
+            for root, _, names in os.walk(path, topdown=False):
+                files.extend(os.path.join(root, name) for name in names)
+                dirs.append(root)
+
+        freed, started = 0, time.monotonic()
+        for file_path in files:
+            try:
+                size = os.path.getsize(file_path)
+                os.remove(file_path)
+            except OSError as e:
+                print(f"删除缓存文件失败: {file_path}, {e}")
+                continue
+            freed += size
+            if self.delete_rate:
+                wait = freed / self.delete_rate - (time.monotonic() - started)
+                if wait > 0:
+                    self._stop.wait(wait)
+        for folder in dirs:
+            try:
+                os.rmdir(folder)
+            except OSError as e:
+                print(f"删除缓存目录失败: {folder}, {e}")
+        return freed
+
+    def _remove_empty_parents(self, folder: str):
+        """删除方案文件夹后，清理缓存目录下因此变空的上级目录（如 scheme_<id>_<hash>/）"""
+        root = os.path.abspath(self.cache_dir)
+        parent = os.path.dirname(os.path.abspath(folder))
+        while parent != root and parent.startswith(root + os.sep):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    # ---------- 扫描 ----------
+
+    def _keep_names(self) -> set:
+        """缓存目录下不参与回收的文件"""
+        keep = {CorpusIndex.DIR_NAME, "file_mapping.json", "file_mapping.json.migrated"}
+        keep.update(self.file_manager.store.file_names())
+        return keep
+
+    def _is_recent(self, path: str, now: float) -> bool:
+        try:
+            return now - os.path.getmtime(path) < self.grace_seconds
+        except OSError:
+            return False
+
+    def _find_orphans(self, mappings: Dict[str, Dict], now: float) -> List[str]:
+        """没有映射引用、也不包含被映射文件夹的目录和文件"""
+        root = os.path.abspath(self.cache_dir)
+        # 早期映射没有 doc_folder 字段，文件夹名即 hash
+        mapped = {os.path.join(root, file_hash) for file_hash in mappings}
+        ancestors = set()
+        for info in mappings.values():
+            folder = info.get("doc_folder")
+            if not folder:
+                continue
+            folder = os.path.abspath(folder)
+            mapped.add(folder)
+            parent = os.path.dirname(folder)
+            while parent.startswith(root + os.sep):
+                ancestors.add(parent)
+                parent = os.path.dirname(parent)
+
+        orphans = []
+        keep = self._keep_names()
+
+        def scan(directory, top_level):
+            for entry in os.scandir(directory):
+                path = os.path.abspath(entry.path)
+                if top_level and (entry.name in keep or entry.name.split("_")[0] in mappings):
+                    # 保留映射存储文件，以及尚未迁移的旧格式缓存文件（<hash>_chunks.txt 等）
+                    continue
+                if path in mapped:
+                    continue
+                if path in ancestors:
+                    scan(path, False)
+                    continue
+                # 被映射文件夹的上级目录中的散落文件（如临时检查清单）保留
+                if not top_level and not entry.is_dir():
+                    continue
+                if not self._is_recent(path, now):
+                    orphans.append(path)
+
+        if os.path.isdir(root):
+            scan(root, True)
+        return orphans
+
+    # ---------- 回收 ----------
+
+    def run_once(self, dry_run: bool = False) -> Dict:
+        """
+        执行一次回收：
+        1. 删除文件夹已不存在的映射
+        2. 删除孤立目录和文件（超过宽限期）
+        3. 总占用超过上限时，按最近访问时间从旧到新淘汰未固定的方案，直到低于上限的 90%
+        """
+        with self._run_lock:
+            now = time.time()
+            report = {"dangling_mappings": [], "orphans": [], "evicted": [],
+                      "freed_bytes": 0, "dry_run": dry_run}
+            mappings = self.file_manager.mappings
+
+            # 1. 映射存在但文件夹已丢失
+            for file_hash, info in list(mappings.items()):
+                folder = info.get("doc_folder")
+                if folder and not os.path.isdir(folder) and not is_pinned(file_hash):
+                    report["dangling_mappings"].append(file_hash)
+                    if not dry_run:
+                        self.file_manager.delete_file_mapping(file_hash, remove_files=False)
+                    mappings.pop(file_hash)
+
+            # 2. 孤立目录和文件
+            for path in self._find_orphans(mappings, now):
+                report["orphans"].append(os.path.relpath(path, self.cache_dir))
+                if dry_run:
+                    report["freed_bytes"] += _tree_size(path)
+                else:
+                    report["freed_bytes"] += self._remove(path)
+                if self._stop.is_set():
+                    break
+
+            # 3. 容量上限
+            total = _tree_size(self.cache_dir) if os.path.isdir(self.cache_dir) else 0
+            if dry_run:
+                total -= report["freed_bytes"]
+            report["total_bytes_before_eviction"] = total
+            if self.max_bytes and total > self.max_bytes:
+                target = int(self.max_bytes * 0.9)
+                candidates = []
+                for file_hash, info in mappings.items():
+                    folder = info.get("doc_folder")
+                    if not folder or is_pinned(file_hash, folder) or self._is_recent(folder, now):
+                        continue
+                    try:
+                        last_access = os.path.getmtime(folder)
+                    except OSError:
+                        continue
+                    candidates.append((last_access, file_hash, folder))
+
+                for last_access, file_hash, folder in sorted(candidates):
+                    if total <= target or self._stop.is_set():
+                        break
+                    # 复查：排序期间可能有任务（包括其他进程的任务）开始使用该方案
+                    if is_pinned(file_hash, folder):
+                        continue
+                    size = _tree_size(folder)
+                    report["evicted"].append({
+                        "plan_id": file_hash,
+                        "original_filename": mappings[file_hash].get("original_filename"),
+                        "last_access": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(last_access)),
+                        "bytes": size
+                    })
+                    if not dry_run:
+                        # 先删映射，新请求不会再加载该方案，再限速删除文件
+                        self.file_manager.delete_file_mapping(file_hash, remove_files=False)
+                        size = self._remove(folder)
+                        self._remove_empty_parents(folder)
+                    report["freed_bytes"] += size
+                    total -= size
+
+            report["total_bytes"] = total
+            report["max_bytes"] = self.max_bytes
+            if report["dangling_mappings"] or report["orphans"] or report["evicted"]:
+                print(f"缓存回收: 失效映射 {len(report['dangling_mappings'])} 个，孤立项 {len(report['orphans'])} 个，"
+                      f"淘汰方案 {len(report['evicted'])} 个，释放 {report['freed_bytes'] / 1024 / 1024:.1f} MB")
+            return report
+
+    # ---------- 后台线程 ----------
+
+    def start(self, interval: int = None):
+        """启动后台回收线程"""
+        interval = CACHE_CONFIG.gc_interval if interval is None else interval
+        if interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"缓存回收失败: {e}")
+
+        self._thread = threading.Thread(target=loop, name="cache-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止后台回收线程（正在进行的限速删除会尽快结束）"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+_cache_gcs = {}
+_cache_gcs_lock = threading.Lock()
+
+
+def get_cache_gc(cache_dir: str = "./cache") -> CacheGC:
+    """获取指定缓存目录共享的回收器（同一进程内只保留一份）"""
+    key = os.path.abspath(cache_dir)
+    with _cache_gcs_lock:
+        if key not in _cache_gcs:
+            _cache_gcs[key] = CacheGC(cache_dir)
+        return _cache_gcs[key]
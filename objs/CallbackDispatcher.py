@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务回调投递
+检查任务完成后只把回调写入发件箱（callback_outbox 表），由后台线程池投递：
+共享连接池的 requests 会话、失败按指数退避重试、用尽次数记为死信、同一目的地限制并发，
+回调接口响应慢或不可用时不再阻塞检查任务的工作线程，也不会丢失回调
+"""
+import gzip
+import json
+import random
+import itertools
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict
+
+from db import CallbackOutboxDAO
+from config.settings import CALLBACK_CONFIG
+
+# 这些 4xx 状态码表示稍后重试可能成功，其余 4xx 直接记为死信
+RETRYABLE_CLIENT_STATUS = (408, 425, 429)
+# 发件箱不可用（数据库未就绪或断开）时扫描间隔逐次翻倍，最长等待秒数
+MAX_UNAVAILABLE_WAIT = 60.0
+
+
+class CallbackDispatcher:
+    """回调发件箱的后台投递器"""
+
+    def __init__(self, workers: int = None, per_destination: int = None, max_attempts: int = None):
+        config = CALLBACK_CONFIG
+        self.workers = max(1, workers or config.workers)
+        self.per_destination = max(1, per_destination or config.per_destination)
+        self.max_attempts = max(1, max_attempts or config.max_attempts)
+        self.timeout = (config.connect_timeout, config.read_timeout)
+
+        self._in_flight: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._session = None
+        # 领取标记：进程标识 + 序号，租约过期的记录可被其他进程重新领取
+        self._owner = uuid.uuid4().hex[:16]
+        self._claims = itertools.count(1)
+
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+        self.direct = 0
+
+    # ---------- 写入 ----------
+
+    def enqueue(self, task_id: str, callback_url: str, payload: dict) -> bool:
+        """写入发件箱并唤醒投递线程；数据库不可用时直接投递一次（不重试）"""
+        self.start()
+        if CallbackOutboxDAO.enqueue(task_id, callback_url, payload) is None:
+            print(f"回调未能写入发件箱，直接投递一次，任务ID: {task_id}")
+            self._get_executor().submit(self._post_once, task_id, callback_url, payload)
+            return False
+        self._wake.set()
+        return True
+
+    # ---------- 投递 ----------
+
+    def _get_session(self):
+        """投递共用的 requests 会话（连接池大小与投递线程数一致）"""
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="callback")
+            return self._executor
+
+    def _post(self, callback_url: str, payload: dict) -> int:
+        # 中文不转义、紧凑分隔符；超过 CALLBACK_GZIP_MIN_BYTES 时 gzip 压缩
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        if 0 < CALLBACK_CONFIG.gzip_min_bytes <= len(body):
+            body = gzip.compress(body, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        response = self._get_session().post(callback_url, data=body, headers=headers, timeout=self.timeout)
+        response.close()
+        return response.status_code
+
+    def _post_once(self, task_id: str, callback_url: str, payload: dict):
+        with self._lock:
+            self.direct += 1
+        try:
+            status_code = self._post(callback_url, payload)
+            print(f"回调直接投递完成，状态码: {status_code}, 任务ID: {task_id}")
+        except Exception as e:
+            print(f"回调直接投递失败: {e}, 任务ID: {task_id}")
+
+    def _retry_delay(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（指数退避，抖动在后一半区间，保证间隔逐次增长）"""
+        delay = min(CALLBACK_CONFIG.backoff_max, CALLBACK_CONFIG.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    def _deliver(self, record):
+        try:
+            self._attempt(record)
+        except Exception as e:
+            # 状态未能写回时记录保持 sending，租约到期后重新投递
+            print(f"更新回调状态失败: {e}, 任务ID: {record.task_id}")
+        finally:
+            self._done(record.destination)
+
+    def _attempt(self, record):
+        status_code, error = None, None
+        try:
+            status_code = self._post(record.callback_url, record.payload_data)
+        except Exception as e:
+            error = str(e)
+        else:
+            if 200 <= status_code < 300:
+                # 只有发送本身的异常才重试，已送达后写回状态失败不能当作投递失败
+                CallbackOutboxDAO.mark_delivered(record, status_code)
+                with self._lock:
+                    self.delivered += 1
+                print(f"回调发送成功，任务ID: {record.task_id}")
+                return
+            error = f"HTTP {status_code}"
+
+        attempts = record.attempts + 1
+        permanent = status_code is not None and 400 <= status_code < 500 \
+            and status_code not in RETRYABLE_CLIENT_STATUS
+        if permanent or attempts >= self.max_attempts:
+            CallbackOutboxDAO.mark_dead(record, status_code, error)
+            with self._lock:
+                self.dead += 1
+            print(f"回调投递失败 {attempts} 次，记为死信: {error}, 任务ID: {record.task_id}")
+        else:
+            delay = self._retry_delay(record.attempts)
+            CallbackOutboxDAO.mark_retry(record, datetime.now() + timedelta(seconds=delay), status_code, error)
+            with self._lock:
+                self.retried += 1
+            print(f"回调投递失败: {error}，{delay:.0f} 秒后重试（第 {attempts} 次），任务ID: {record.task_id}")
+
+    def _done(self, destination: str):
+        with self._lock:
+            self._in_flight[destination] = self._in_flight.get(destination, 1) - 1
+            if self._in_flight[destination] <= 0:
+                del self._in_flight[destination]
+        # 有空闲名额后立即领取下一批
+        self._wake.set()
+
+    def dispatch_due(self) -> int:
+        """领取到期的回调并提交投递，返回提交数"""
+        with self._lock:
+            free = self.workers - sum(self._in_flight.values())
+            saturated = [d for d, n in self._in_flight.items() if n >= self.per_destination]
+        if free <= 0:
+            return 0
+
+        claim_token = f"{self._owner}-{next(self._claims)}"
+        records = CallbackOutboxDAO.claim_due(claim_token, min(CALLBACK_CONFIG.batch_size, free),
+                                              CALLBACK_CONFIG.lease_seconds, saturated)
+        if records is None:
+            raise RuntimeError("回调发件箱不可用")
+        submitted = 0
+        for record in records:
+            with self._lock:
+                busy = self._in_flight.get(record.destination, 0) >= self.per_destination
+                if not busy:
+                    self._in_flight[record.destination] = self._in_flight.get(record.destination, 0) + 1
+            if busy:
+                # 该目的地并发已满，归还记录，等有空闲时再领取
+                CallbackOutboxDAO.release(record)
+                continue
+            self._get_executor().submit(self._deliver, record)
+            submitted += 1
+        return submitted
+
+    # ---------- 后台线程 ----------
+
+    def start(self):
+        """启动投递线程（已启动时忽略）"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="callback-dispatcher", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        failures = 0
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                submitted = self.dispatch_due()
+                if failures:
+                    print(f"回调发件箱恢复可用（此前连续失败 {failures} 次）")
+                    failures = 0
+            except Exception as e:
+                # 数据库不可用时只在首次失败时输出，之后按退避间隔重试
+                if not failures:
+                    print(f"投递回调失败: {e}，恢复前按退避间隔重试")
+                failures += 1
+                submitted = 0
+            if not submitted:
+                # 等待新回调、投递完成或下一次定时扫描（重试到期的回调）
+                wait = CALLBACK_CONFIG.poll_interval
+                if failures:
+                    wait = min(MAX_UNAVAILABLE_WAIT, wait * 2 ** failures)
+                self._wake.wait(wait)
+
+    def stop(self):
+        """停止投递（未完成的回调在租约到期后由下次启动的进程重新投递）"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            executor, self._executor = self._executor, None
+            session, self._session = self._session, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+        if session:
+            session.close()
+
+    def status(self) -> dict:
+        with self._lock:
+            status = {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "in_flight": dict(self._in_flight),
+                "delivered": self.delivered,
+                "retried": self.retried,
+                "dead": self.dead,
+                "direct": self.direct
+            }
+        status["outbox"] = CallbackOutboxDAO.get_status_counts()
+        return status
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_callback_dispatcher() -> CallbackDispatcher:
+    """进程内共享的回调投递器"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = CallbackDispatcher()
+        return _dispatcher
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本块二进制存储
+所有文本块按 UTF-8 编码顺序拼接为一个文件，另存偏移数组，按编号 O(1) 随机读取；
+文本原样保存（包括换行和空白），编号与 FAISS 向量编号严格对应
+"""
+import os
+import json
+import mmap
+import numpy as np
+from collections.abc import Sequence
+from typing import Dict, List
+
+
+class ChunkStore(Sequence):
+    """
+    文本块存储，目录结构：
+    chunks.bin           所有文本块的 UTF-8 字节拼接
+    chunks_offsets.npy   int64 偏移数组，长度为块数+1，第 i 块为 [offsets[i], offsets[i+1])
+    chunks_meta.json     每块的元数据（原文区间、章节路径等）
+    """
+
+    BLOB_FILE = "chunks.bin"
+    OFFSETS_FILE = "chunks_offsets.npy"
+    META_FILE = "chunks_meta.json"
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._offsets = np.load(os.path.join(folder, self.OFFSETS_FILE), mmap_mode="r")
+        self._file = open(os.path.join(folder, self.BLOB_FILE), "rb")
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+            if os.fstat(self._file.fileno()).st_size > 0 else b""
+        self._meta = None
+
+    @classmethod
+    def exists(cls, folder: str) -> bool:
+        """目录中是否已有文本块存储"""
+        return bool(folder) and os.path.exists(os.path.join(folder, cls.BLOB_FILE)) and \
+            os.path.exists(os.path.join(folder, cls.OFFSETS_FILE))
+
+    @classmethod
+    def write(cls, folder: str, chunks: List[str], metas: List[Dict] = None):
+        """写入文本块及元数据（不打开存储，读取时另行创建 ChunkStore(folder)）"""
+        os.makedirs(folder, exist_ok=True)
+        encoded = [c.encode("utf-8") for c in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(b) for b in encoded])
+
+        blob_path = os.path.join(folder, cls.BLOB_FILE)
+        with open(blob_path + ".tmp", "wb") as f:
+            for b in encoded:
+                f.write(b)
+        os.replace(blob_path + ".tmp", blob_path)
+
+        offsets_path = os.path.join(folder, cls.OFFSETS_FILE)
+        with open(offsets_path + ".tmp", "wb") as f:
+            np.save(f, offsets)
+        os.replace(offsets_path + ".tmp", offsets_path)
+
+        meta_path = os.path.join(folder, cls.META_FILE)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(metas if metas and len(metas) == len(chunks) else [{} for _ in chunks],
+                      f, ensure_ascii=False)
+
+    def __len__(self) -> int:
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError("chunk index out of range")
+        return self._blob[int(self._offsets[idx]):int(self._offsets[idx + 1])].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def metas(self) -> List[Dict]:
+        """全部文本块的元数据（首次访问时加载）"""
+        if self._meta is None:
+            meta_path = os.path.join(self.folder, self.META_FILE)
+            self._meta = []
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    self._meta = json.load(f)
+            if len(self._meta) != len(self):
+                self._meta = [{} for _ in range(len(self))]
+        return self._meta
+
+    def meta(self, idx: int) -> Dict:
+        """第 idx 块的元数据"""
+        return self.metas[idx]
+
+    def joined_text(self) -> str:
+        """
+        按原文区间拼回全文：有 start/end 元数据时去掉相邻块的重叠部分，
+        否则按换行拼接
+        """
+        metas = self.metas
+        if not all("start" in m and "end" in m for m in metas):
+            return "\n".join(self)
+
+        parts, pos = [], None
+        for text, m in sorted(zip(self, metas), key=lambda x: x[1]["start"]):
+            start, end = m["start"], m["end"]
+            if pos is None or start >= pos:
+                if pos is not None:
+                    parts.append("\n")
+                parts.append(text)
+            elif end > pos:
+                parts.append(text[pos - start:])
+            pos = max(pos or 0, end)
+        return "".join(parts)
+
+    def close(self):
+        """释放内存映射和文件句柄（可重复调用）"""
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._blob = b""
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __del__(self):
+        # 未显式关闭时在对象回收时释放
+        if getattr(self, "_file", None) is not None:
+            self.close()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型服务 HTTP 客户端注册表
+同一进程内按 (api_base, api_key) 共享 OpenAI 客户端及其连接池，按服务地址共享 requests 会话，
+避免每个 PlanAuditor / 每次请求重复建立 TCP/TLS 连接。
+ASGI 模式下的 AsyncOpenAI / httpx.AsyncClient 绑定创建时的事件循环，按事件循环分别缓存
+"""
+import asyncio
+import threading
+from typing import Dict, Tuple
+
+from config.settings import LLM_CLIENT_CONFIG
+
+# (api_base, api_key) -> OpenAI 客户端
+_openai_clients: Dict[Tuple[str, str], object] = {}
+# 服务地址 -> requests.Session
+_sessions: Dict[str, object] = {}
+# (事件循环, api_base, api_key) -> AsyncOpenAI 客户端；(事件循环, 服务地址) -> httpx.AsyncClient
+_async_openai_clients: Dict[Tuple[int, str, str], object] = {}
+_async_http_clients: Dict[Tuple[int, str], object] = {}
+_clients_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    """httpx 的 HTTP/2 支持依赖 h2 包"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _create_http_client(asynchronous: bool = False):
+    """按配置创建带连接池的 httpx 客户端"""
+    import httpx
+
+    config = LLM_CLIENT_CONFIG
+    client_class = httpx.AsyncClient if asynchronous else httpx.Client
+    return client_class(
+        http2=config.http2 and _http2_available(),
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry
+        ),
+        timeout=httpx.Timeout(config.read_timeout, connect=config.connect_timeout)
+    )
+
+
+def get_openai_client(api_base: str = None, api_key: str = None):
+    """获取共享的 OpenAI 客户端（同一服务地址和密钥只创建一个）"""
+    key = (api_base or "", api_key or "")
+    with _clients_lock:
+        client = _openai_clients.get(key)
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(
+                base_url=api_base,
+                api_key=api_key,
+                http_client=_create_http_client(),
+                max_retries=0  # 重试由 ModelCall.call_with_retry 统一处理
+            )
+            _openai_clients[key] = client
+        return client
+
+
+def get_http_session(base_url: str = ""):
+    """获取共享的 requests 会话（用于直接调用 Ollama 等 HTTP 接口）"""
+    with _clients_lock:
+        session = _sessions.get(base_url)
+        if session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            config = LLM_CLIENT_CONFIG
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=config.max_keepalive_connections,
+                pool_maxsize=config.max_connections
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[base_url] = session
+        return session
+
+
+def get_async_openai_client(api_base: str = None, api_key: str = None):
+    """获取当前事件循环共享的 AsyncOpenAI 客户端（只能在协程中调用）"""
+    key = (id(asyncio.get_running_loop()), api_base or "", api_key or "")
+    with _clients_lock:
+        client = _async_openai_clients.get(key)
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                base_url=api_base,
+                api_key=api_key,
+                http_client=_create_http_client(asynchronous=True),
+                max_retries=0
+            )
+            _async_openai_clients[key] = client
+        return client
+
+
+def get_async_http_client(base_url: str = ""):
+    """获取当前事件循环共享的 httpx.AsyncClient（用于异步调用 Ollama 等 HTTP 接口）"""
+    key = (id(asyncio.get_running_loop()), base_url)
+    with _clients_lock:
+        client = _async_http_clients.get(key)
+        if client is None:
+            client = _create_http_client(asynchronous=True)
+            _async_http_clients[key] = client
+        return client
+
+
+def http_timeout() -> Tuple[float, float]:
+    """requests 使用的 (连接超时, 读取超时)"""
+    return LLM_CLIENT_CONFIG.connect_timeout, LLM_CLIENT_CONFIG.read_timeout
+
+
+def client_stats() -> dict:
+    """当前共享的客户端数量"""
+    with _clients_lock:
+        return {
+            "openai_clients": len(_openai_clients),
+            "http_sessions": len(_sessions),
+            "async_openai_clients": len(_async_openai_clients),
+            "async_http_clients": len(_async_http_clients)
+        }
+
+
+def close_all_clients():
+    """关闭所有共享客户端（应用退出时调用）"""
+    with _clients_lock:
+        clients = list(_openai_clients.values()) + list(_sessions.values())
+        _openai_clients.clear()
+        _sessions.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            print(f"关闭客户端失败: {e}")
+
+
+async def aclose_async_clients():
+    """关闭当前事件循环创建的异步客户端（ASGI 服务退出时调用）"""
+    loop_id = id(asyncio.get_running_loop())
+    with _clients_lock:
+        clients = []
+        for registry in (_async_openai_clients, _async_http_clients):
+            for key in [key for key in registry if key[0] == loop_id]:
+                clients.append(registry.pop(key))
+    for client in clients:
+        try:
+            # httpx.AsyncClient 使用 aclose()，AsyncOpenAI 使用 close()
+            close = getattr(client, "aclose", None) or client.close
+            await close()
+        except Exception as e:
+            print(f"关闭异步客户端失败: {e}")
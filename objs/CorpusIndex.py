@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全局语料向量索引
+汇总所有已缓存方案的文本块向量，支持跨方案检索
+"""
+import os
+import re
+import json
+import time
+import bisect
+import threading
+import numpy as np
+from typing import Dict, List, Iterable
+
+from utils.lazy_import import lazy_import
+from utils.file_lock import file_lock
+from .VectorIndex import create_index, index_vectors, normalize_storage
+from config.settings import INDEX_CONFIG
+
+faiss = lazy_import("faiss")
+
+
+class CorpusIndex:
+    """
+    跨方案的全局向量索引
+
+    不同嵌入模型的向量维度不同，因此每个嵌入模型维护一个独立的子索引：
+    cache/corpus_index/<模型名>/index.faiss   FAISS IndexIDMap2
+    cache/corpus_index/<模型名>/id_map.json   全局ID与 (plan_id, chunk_idx) 的映射
+
+    每个方案分配一段连续的全局ID [start_id, start_id + count)，
+    全局ID减去 start_id 即为该方案内的 chunk_idx。
+
+    向量存储模式跟随 VECTOR_STORAGE；int8 需要按数据训练取值范围，方案陆续加入时无法统一，
+    全局索引此时改用 float16。
+
+    增删方案只修改内存中的索引，由后台线程在 CORPUS_INDEX_SAVE_DELAY 秒后合并保存；
+    多个 worker 进程共享缓存目录时，保存在文件锁内进行，检索前按 id_map.json 的修改时间重新加载。
+    """
+
+    DIR_NAME = "corpus_index"
+
+    def __init__(self, cache_dir: str = "./cache", save_delay: float = None):
+        self.cache_dir = cache_dir
+        self.root = os.path.join(cache_dir, self.DIR_NAME)
+        self._lock = threading.RLock()
+        self._indexes = {}
+        self._id_maps = {}
+        # 子索引加载或保存时 id_map.json 的修改时间，与磁盘不一致说明其他进程保存过
+        self._mtimes = {}
+        # 尚未保存的修改，按子索引记录，保存前若其他进程已写入则在其基础上重放
+        self._pending: Dict[str, list] = {}
+        self._save_timer = None
+        self.save_delay = max(0.0, INDEX_CONFIG.corpus_save_delay if save_delay is None else save_delay)
+        storage = normalize_storage(INDEX_CONFIG.vector_storage)
+        self.vector_storage = "float16" if storage == "int8" else storage
+
+    # ---------- 存储 ----------
+
+    @staticmethod
+    def _model_key(embedding_model: str) -> str:
+        """将模型名转换为可用作目录名的字符串"""
+        return re.sub(r'[^0-9A-Za-z_.-]', '_', embedding_model or "default")
+
+    def _model_dir(self, embedding_model: str) -> str:
+        return os.path.join(self.root, self._model_key(embedding_model))
+
+    def _map_mtime(self, key: str):
+        try:
+            return os.stat(os.path.join(self.root, key, "id_map.json")).st_mtime_ns
+        except OSError:
+            return None
+
+    def _read_model(self, key: str, embedding_model: str):
+        """
+        从磁盘读取子索引，返回 (index, id_map)
+        两个文件分别替换，读到一新一旧时向量数与映射不符，稍后重读
+        """
+        model_dir = os.path.join(self.root, key)
+        index_file = os.path.join(model_dir, "index.faiss")
+        map_file = os.path.join(model_dir, "id_map.json")
+        empty = {"embedding_model": embedding_model, "next_id": 0, "plans": {}}
+        if not (os.path.exists(index_file) and os.path.exists(map_file)):
+            return None, empty
+
+        for attempt in range(3):
+            try:
+                index = faiss.read_index(index_file)
+                with open(map_file, 'r', encoding='utf-8') as f:
+                    id_map = json.load(f)
+            except (IOError, RuntimeError, json.JSONDecodeError) as e:
+                print(f"加载全局索引失败，将重新创建: {e}")
+                return None, empty
+            if index.ntotal == sum(entry["count"] for entry in id_map["plans"].values()):
+                break
+            time.sleep(0.05)
+        return index, id_map
+
+    def _load_model(self, embedding_model: str):
+        """加载（或初始化）指定模型的子索引"""
+        key = self._model_key(embedding_model)
+        if key in self._id_maps:
+            return key
+        self._mtimes[key] = self._map_mtime(key)
+        self._indexes[key], self._id_maps[key] = self._read_model(key, embedding_model)
+        return key
+
+    def _reload_if_changed(self, key: str):
+        """其他进程保存过该子索引时重新加载，并重放本进程尚未保存的修改"""
+        mtime = self._map_mtime(key)
+        if mtime == self._mtimes.get(key):
+            return
+        embedding_model = self._id_maps[key].get("embedding_model", key)
+        self._indexes[key], self._id_maps[key] = self._read_model(key, embedding_model)
+        self._mtimes[key] = mtime
+        for op in self._pending.get(key, []):
+            self._apply(key, op)
+
+    def _refresh(self):
+        """重新加载已被其他进程修改的子索引"""
+        with self._lock:
+            for key in list(self._id_maps.keys()):
+                self._reload_if_changed(key)
+
+    def _write_model(self, model_dir: str, index_data, map_data: str) -> bool:
+        try:
+            if index_data is not None:
+                tmp_index = os.path.join(model_dir, "index.faiss.tmp")
+                with open(tmp_index, 'wb') as f:
+                    f.write(index_data.tobytes())
+                os.replace(tmp_index, os.path.join(model_dir, "index.faiss"))
+            tmp_map = os.path.join(model_dir, "id_map.json.tmp")
+            with open(tmp_map, 'w', encoding='utf-8') as f:
+                f.write(map_data)
+            os.replace(tmp_map, os.path.join(model_dir, "id_map.json"))
+            return True
+        except (IOError, RuntimeError) as e:
+            print(f"保存全局索引失败: {e}")
+            return False
+
+    def _save_model(self, key: str):
+        """
+        保存指定模型的子索引
+        持有目录下的文件锁：其他进程先保存过时重新加载并重放本进程的修改，再整体写回，
+        多个 worker 同时增删方案不会互相覆盖。写文件时不占用进程内的锁，不阻塞检索
+        """
+        model_dir = os.path.join(self.root, key)
+        os.makedirs(model_dir, exist_ok=True)
+        with file_lock(os.path.join(model_dir, ".lock")):
+            with self._lock:
+                self._reload_if_changed(key)
+                saved = len(self._pending.get(key, []))
+                if not saved:
+                    return
+                index = self._indexes.get(key)
+                index_data = faiss.serialize_index(index) if index is not None else None
+                map_data = json.dumps(self._id_maps[key], ensure_ascii=False)
+            if self._write_model(model_dir, index_data, map_data):
+                with self._lock:
+                    self._mtimes[key] = self._map_mtime(key)
+                    # 写文件期间新增的修改留待下次保存
+                    del self._pending[key][:saved]
+
+    def flush(self):
+        """立即保存所有未保存的修改（进程退出前调用）"""
+        with self._lock:
+            keys = [key for key, ops in self._pending.items() if ops]
+        for key in keys:
+            self._save_model(key)
+
+    def _schedule_save(self):
+        """延迟 save_delay 秒后在后台线程保存，期间的多次修改合并为一次写入"""
+        if self._save_timer is not None:
+            return
+
+        def save():
+            with self._lock:
+                self._save_timer = None
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"保存全局索引失败: {e}")
+
+        self._save_timer = threading.Timer(self.save_delay, save)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+
+    def _existing_models(self) -> List[str]:
+        """列出磁盘上已有的模型子索引"""
+        if not os.path.isdir(self.root):
+            return []
+        return [name for name in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, name))]
+
+    # ---------- 增量维护 ----------
+
+    def _add_vectors(self, key: str, plan_id: str, vectors: np.ndarray, meta: Dict) -> int:
+        """向子索引加入一个方案的向量（已存在时先移除）"""
+        self._remove_vectors(key, plan_id)
+        index = self._indexes[key]
+        if index is None:
+            index = faiss.IndexIDMap2(create_index(vectors.shape[1], self.vector_storage))
+            self._indexes[key] = index
+        elif index.d != vectors.shape[1]:
+            return 0
+
+        id_map = self._id_maps[key]
+        start_id = id_map["next_id"]
+        ids = np.arange(start_id, start_id + len(vectors), dtype=np.int64)
+        index.add_with_ids(vectors, ids)
+
+        id_map["next_id"] = start_id + len(vectors)
+        id_map["plans"][plan_id] = dict(meta, start_id=int(start_id), count=int(len(vectors)))
+        return len(vectors)
+
+    def _remove_vectors(self, key: str, plan_id: str) -> bool:
+        """从子索引移除一个方案的向量"""
+        id_map = self._id_maps.get(key)
+        if not id_map or plan_id not in id_map["plans"]:
+            return False
+        entry = id_map["plans"].pop(plan_id)
+        index = self._indexes.get(key)
+        if index is not None:
+            index.remove_ids(faiss.IDSelectorRange(
+                entry["start_id"], entry["start_id"] + entry["count"]))
+        return True
+
+    def _apply(self, key: str, op: tuple):
+        if op[0] == "add":
+            self._add_vectors(key, *op[1:])
+        else:
+            self._remove_vectors(key, op[1])
+
+    def _record(self, key: str, op: tuple):
+        """记录一次修改并安排后台保存"""
+        self._pending.setdefault(key, []).append(op)
+        self._schedule_save()
+
+    def add_plan(self, plan_id: str, vectors: np.ndarray, embedding_model: str,
+                 scheme_id: str = None, original_filename: str = None) -> int:
+        """将一个方案的全部文本块向量加入全局索引，返回加入的向量数（索引在后台保存）"""
+        vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+        if vectors.ndim != 2 or len(vectors) == 0:
+            return 0
+
+        with self._lock:
+            # 同一方案重复加入时先移除旧向量
+            self.remove_plan(plan_id)
+
+            key = self._load_model(embedding_model)
+            index = self._indexes[key]
+            if index is not None and index.d != vectors.shape[1]:
+                print(f"向量维度不匹配（{vectors.shape[1]} != {index.d}），跳过全局索引: {plan_id}")
+                return 0
+
+            meta = {
+                "scheme_id": str(scheme_id) if scheme_id is not None else None,
+                "original_filename": original_filename
+            }
+            count = self._add_vectors(key, plan_id, vectors, meta)
+            self._record(key, ("add", plan_id, vectors, meta))
+            return count
+
+    def add_plan_from_cache(self, plan_id: str, file_info: Dict) -> int:
+        """从方案缓存的FAISS索引中读取向量并加入全局索引"""
+        faiss_file = file_info.get("cache_files", {}).get("faiss_index")
+        if not faiss_file or not os.path.exists(faiss_file):
+            return 0
+        try:
+            plan_index = faiss.read_index(faiss_file)
+            vectors = index_vectors(plan_index)
+        except RuntimeError as e:
+            print(f"读取方案索引失败: {plan_id}, {e}")
+            return 0
+        return self.add_plan(
+            plan_id, vectors,
+            embedding_model=file_info.get("embedding_model", ""),
+            scheme_id=file_info.get("scheme_id"),
+            original_filename=file_info.get("original_filename")
+        )
+
+    def remove_plan(self, plan_id: str) -> bool:
+        """从全局索引中移除一个方案的全部向量（索引在后台保存）"""
+        removed = False
+        with self._lock:
+            for key in self._existing_models() + list(self._id_maps.keys()):
+                if key not in self._id_maps:
+                    self._load_model_by_key(key)
+                if self._remove_vectors(key, plan_id):
+                    self._record(key, ("remove", plan_id))
+                    removed = True
+        return removed
+
+    def _load_model_by_key(self, key: str):
+        """根据目录名加载子索引（目录名无法还原模型名，从id_map中读取）"""
+        map_file = os.path.join(self.root, key, "id_map.json")
+        embedding_model = key
+        if os.path.exists(map_file):
+            try:
+                with open(map_file, 'r', encoding='utf-8') as f:
+                    embedding_model = json.load(f).get("embedding_model", key)
+            except (IOError, json.JSONDecodeError):
+                pass
+        self._load_model(embedding_model)
+
+    def sync(self, file_infos: Iterable[Dict]) -> Dict[str, int]:
+        """与文件映射对齐：补充缺失的方案，移除已不存在的方案"""
+        file_infos = {info.get("file_hash"): info for info in file_infos if info.get("file_hash")}
+        added, removed = 0, 0
+        self._refresh()
+        with self._lock:
+            indexed = set()
+            for key in self._existing_models():
+                self._load_model_by_key(key)
+            for id_map in self._id_maps.values():
+                indexed.update(id_map["plans"].keys())
+
+            for plan_id in indexed - set(file_infos.keys()):
+                if self.remove_plan(plan_id):
+                    removed += 1
+            for plan_id, info in file_infos.items():
+                if plan_id not in indexed and self.add_plan_from_cache(plan_id, info):
+                    added += 1
+        return {"added": added, "removed": removed}
+
+    # ---------- 检索 ----------
+
+    def search(self, query_vec: np.ndarray, embedding_model: str, top_k: int = 5,
+               plan_ids: List[str] = None, scheme_ids: List[str] = None) -> List[Dict]:
+        """
+        在全局索引中检索最相似的文本块
+        可按 plan_ids / scheme_ids 过滤，过滤在FAISS内部通过IDSelector完成
+        """
+        query_vec = np.ascontiguousarray(np.asarray(query_vec, dtype=np.float32).reshape(1, -1))
+
+        with self._lock:
+            key = self._load_model(embedding_model)
+            self._reload_if_changed(key)
+            index = self._indexes[key]
+            id_map = self._id_maps[key]
+            if index is None or index.ntotal == 0:
+                return []
+
+            plans = id_map["plans"]
+            allowed = list(plans.keys())
+            if plan_ids:
+                allowed = [p for p in allowed if p in set(plan_ids)]
+            if scheme_ids:
+                scheme_set = {str(s) for s in scheme_ids}
+                allowed = [p for p in allowed if plans[p].get("scheme_id") in scheme_set]
+            if not allowed:
+                return []
+
+            params = None
+            if plan_ids or scheme_ids:
+                selected_ids = np.concatenate([
+                    np.arange(plans[p]["start_id"], plans[p]["start_id"] + plans[p]["count"], dtype=np.int64)
+                    for p in allowed
+                ])
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(selected_ids))
+
+            distances, ids = index.search(query_vec, top_k, params=params)
+
+            # 根据各方案的起始ID反查 (plan_id, chunk_idx)
+            ranges = sorted((entry["start_id"], plan_id) for plan_id, entry in plans.items())
+            starts = [start for start, _ in ranges]
+
+            results = []
+            for distance, global_id in zip(distances[0], ids[0]):
+                if global_id < 0:
+                    continue
+                pos = bisect.bisect_right(starts, int(global_id)) - 1
+                if pos < 0:
+                    continue
+                plan_id = ranges[pos][1]
+                entry = plans[plan_id]
+                chunk_idx = int(global_id) - entry["start_id"]
+                if chunk_idx >= entry["count"]:
+                    continue
+                results.append({
+                    "plan_id": plan_id,
+                    "chunk_idx": chunk_idx,
+                    "scheme_id": entry.get("scheme_id"),
+                    "original_filename": entry.get("original_filename"),
+                    "similarity": float(1 / (1 + distance)),
+                    "distance": float(distance)
+                })
+            return results
+
+    def stats(self) -> Dict:
+        """返回各模型子索引的统计信息"""
+        self._refresh()
+        with self._lock:
+            for key in self._existing_models():
+                self._load_model_by_key(key)
+            return {
+                id_map.get("embedding_model", key): {
+                    "plans_count": len(id_map["plans"]),
+                    "vectors_count": int(self._indexes[key].ntotal) if self._indexes.get(key) is not None else 0
+                }
+                for key, id_map in self._id_maps.items()
+            }
+
+
+_corpus_indexes = {}
+_corpus_indexes_lock = threading.Lock()
+
+
+def get_corpus_index(cache_dir: str = "./cache") -> CorpusIndex:
+    """获取指定缓存目录共享的全局索引实例（同一进程内只保留一份）"""
+    key = os.path.abspath(cache_dir)
+    with _corpus_indexes_lock:
+        if key not in _corpus_indexes:
+            _corpus_indexes[key] = CorpusIndex(cache_dir)
+        return _corpus_indexes[key]
+
+
+def flush_corpus_indexes():
+    """保存本进程所有全局索引未保存的修改"""
+    with _corpus_indexes_lock:
+        corpus_indexes = list(_corpus_indexes.values())
+    for corpus_index in corpus_indexes:
+        corpus_index.flush()
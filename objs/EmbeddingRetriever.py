@@ -1,13 +1,11 @@
-import os
-import json
-import pickle
-import hashlib
 import numpy as np
-import faiss
-from tqdm import tqdm
-from sklearn.neighbors import NearestNeighbors
+from contextlib import contextmanager, asynccontextmanager, ExitStack, AsyncExitStack
 from typing import Union, List
-from openai import OpenAI
+from .ClientRegistry import get_openai_client, get_async_openai_client
+from .RateLimiter import get_rate_limiter
+from .ModelCall import ModelCallError, call_with_retry, call_with_retry_async, hedged_call
+from .BackendPool import backend_lease, find_pool
+from config.settings import MODEL_CALL_CONFIG
 
 class EmbeddingRetriever:
     """
@@ -18,57 +16,173 @@ class EmbeddingRetriever:
             self,
             embedding_model: str,
             openai_api_key: str = None,
-            openai_api_base: str = None
+            openai_api_base: str = None,
+            hedge_api_base: str = None
     ):
         self.embedding_model = embedding_model
         self.openai_api_key = openai_api_key
         self.openai_api_base = openai_api_base
-        self.client = OpenAI(base_url=self.openai_api_base, api_key=self.openai_api_key)
+        # 备用服务地址（提供相同模型），主服务响应过慢时向其发出对冲请求
+        self.hedge_api_base = hedge_api_base or MODEL_CALL_CONFIG.hedge_api_base or None
+
+    @property
+    def client(self):
+        """OpenAI 客户端，同一服务地址和密钥在进程内共享连接池"""
+        return get_openai_client(self.openai_api_base, self.openai_api_key)
+
+    @contextmanager
+    def _backend(self, api_base, model, stream=False):
+        """选择实际服务节点（配置了节点池时负载均衡），并占用该节点的调用名额"""
+        with backend_lease(api_base, model) as url:
+            with get_rate_limiter(url, model).slot(stream=stream):
+                yield get_openai_client(url, self.openai_api_key)
+
+    @asynccontextmanager
+    async def _abackend(self, api_base, model, stream=False):
+        """协程版 _backend，返回 AsyncOpenAI 客户端"""
+        with backend_lease(api_base, model) as url:
+            async with get_rate_limiter(url, model).async_slot(stream=stream):
+                yield get_async_openai_client(url, self.openai_api_key)
+
     def encode(self, texts: Union[str, List[str]]) -> np.ndarray:
         if isinstance(texts, str):
             texts = [texts]
 
+        from tqdm import tqdm
+
+        def embed(text):
+            with self._backend(self.openai_api_base, self.embedding_model) as client:
+                return client.embeddings.create(
+                    input=text,
+                    model=self.embedding_model,
+                )
+
         embeddings = []
         for text in tqdm(texts, desc='OpenAI embedding', ncols=80):
-            response = self.client.embeddings.create(
-                input=text,
-                model=self.embedding_model,
-            )
+            response = call_with_retry(lambda: embed(text), self.openai_api_base, self.embedding_model)
             embeddings.append(response.data[0].embedding)
         return np.array(embeddings, dtype=np.float32)
-    
-    def generate_text(self, messages, model="qwen2.5:7b", temperature=0.1):
-        """
-        调用大模型生成文本（用于智能判断）
-        """
-        try:
-            response = self.client.chat.completions.create(
+
+    def _complete(self, api_base, messages, model, temperature):
+        """向指定服务发出一次生成请求"""
+        with self._backend(api_base, model) as client:
+            response = client.chat.completions.create(
                 model=model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=2000
             )
-            return response.choices[0].message.content
-        except Exception as e:
+        return response.choices[0].message.content
+
+    def generate_text(self, messages, model="qwen2.5:7b", temperature=0.1):
+        """
+        调用大模型生成文本（用于智能判断）
+        可重试的失败按退避重试，最终失败抛出 ModelCallError
+        """
+        # 没有单独配置备用服务时，节点池中的其他节点可作为对冲目标
+        hedge_base = self.hedge_api_base
+        pool = find_pool(self.openai_api_base, model)
+        if not hedge_base and pool is not None and len(pool.endpoints) > 1:
+            hedge_base = self.openai_api_base
+
+        def attempt():
+            if hedge_base:
+                return hedged_call(
+                    lambda: self._complete(self.openai_api_base, messages, model, temperature),
+                    lambda: self._complete(hedge_base, messages, model, temperature),
+                    self.openai_api_base, model
+                )
+            return self._complete(self.openai_api_base, messages, model, temperature)
+
+        try:
+            return call_with_retry(attempt, self.openai_api_base, model)
+        except ModelCallError as e:
             print(f"大模型调用失败: {e}")
-            return f"模型调用失败: {str(e)}"
+            raise
 
     def generate_text_stream(self, messages, model="qwen2.5:7b", temperature=0.1):
         """
         调用大模型生成文本（流式输出）
+        建立流之前的失败按退避重试；失败时抛出 ModelCallError
         """
-        try:
-            response = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=2000,
-                stream=True
-            )
-            
-            for chunk in response:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-                    
-        except Exception as e:
-            yield f"模型调用失败: {str(e)}"
+        def open_stream():
+            # 每次尝试重新选择节点：失败的节点先记录失败并归还名额，退避期间不占用
+            stack = ExitStack()
+            try:
+                client = stack.enter_context(self._backend(self.openai_api_base, model, stream=True))
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=2000,
+                    stream=True
+                )
+            except BaseException as e:
+                stack.__exit__(type(e), e, e.__traceback__)
+                raise
+            return stack, response
+
+        stack, response = call_with_retry(open_stream, self.openai_api_base, model)
+        # 流式输出期间一直占用所选节点和调用名额
+        with stack:
+            # 已输出部分内容后不再重试，避免重复输出
+            try:
+                for chunk in response:
+                    if chunk.choices[0].delta.content is not None:
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                raise ModelCallError(f"模型流式输出中断: {e}", backend=self.openai_api_base or "",
+                                     model=model, attempts=1, cause=e) from e
+
+    async def aencode(self, texts: Union[str, List[str]]) -> np.ndarray:
+        """协程版 encode（ASGI 模式下的查询向量）"""
+        if isinstance(texts, str):
+            texts = [texts]
+
+        async def embed(text):
+            async with self._abackend(self.openai_api_base, self.embedding_model) as client:
+                return await client.embeddings.create(
+                    input=text,
+                    model=self.embedding_model,
+                )
+
+        embeddings = []
+        for text in texts:
+            response = await call_with_retry_async(lambda: embed(text), self.openai_api_base, self.embedding_model)
+            embeddings.append(response.data[0].embedding)
+        return np.array(embeddings, dtype=np.float32)
+
+    async def agenerate_text_stream(self, messages, model="qwen2.5:7b", temperature=0.1):
+        """
+        协程版 generate_text_stream（AsyncOpenAI），等待模型输出期间不占用线程
+        """
+        async def open_stream():
+            # 与 generate_text_stream 相同，每次尝试重新选择节点
+            stack = AsyncExitStack()
+            try:
+                client = await stack.enter_async_context(
+                    self._abackend(self.openai_api_base, model, stream=True))
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=2000,
+                    stream=True
+                )
+            except BaseException as e:
+                await stack.__aexit__(type(e), e, e.__traceback__)
+                raise
+            return stack, response
+
+        stack, response = await call_with_retry_async(open_stream, self.openai_api_base, model)
+        async with stack:
+            try:
+                async for chunk in response:
+                    if chunk.choices and chunk.choices[0].delta.content is not None:
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                raise ModelCallError(f"模型流式输出中断: {e}", backend=self.openai_api_base or "",
+                                     model=model, attempts=1, cause=e) from e
+            finally:
+                # 客户端断开时关闭上游流，尽快归还连接
+                await response.close()
@@ -7,9 +7,15 @@
 import os
 import json
 import hashlib
+import threading
 from datetime import datetime
 from typing import Dict, List, Optional
 
+from .CorpusIndex import get_corpus_index
+from .ChunkStore import ChunkStore
+from .MappingStore import JsonMappingStore, SqliteMappingStore
+from config.settings import CACHE_CONFIG
+
 class FileManager:
     """文件映射管理器"""
     
@@ -20,31 +26,25 @@ class FileManager:
         # 确保缓存目录存在
         os.makedirs(cache_dir, exist_ok=True)
         
-        # 加载现有映射
-        self.mappings = self._load_mappings()
-        
-        # 迁移旧格式缓存文件
-        self.migrate_old_cache_format()
+        # 加载映射存储（旧数据的导入和迁移由 migrate() 在启动时执行）
+        self.store = self._open_store(CACHE_CONFIG.file_index_backend)
     
-    def _load_mappings(self) -> Dict:
-        """加载文件映射"""
-        if os.path.exists(self.mapping_file):
-            try:
-                with open(self.mapping_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"加载文件映射失败: {e}")
-                return {}
-        return {}
+    def _open_store(self, backend: str):
+        """打开映射存储后端"""
+        if backend == "json":
+            return JsonMappingStore(self.mapping_file)
+        return SqliteMappingStore(os.path.join(self.cache_dir, SqliteMappingStore.FILE_NAME))
     
-    def _save_mappings(self):
-        """保存文件映射"""
-        os.makedirs(self.cache_dir, exist_ok=True)
-        try:
-            with open(self.mapping_file, 'w', encoding='utf-8') as f:
-                json.dump(self.mappings, f, ensure_ascii=False, indent=2)
-        except IOError as e:
-            print(f"保存文件映射失败: {e}")
+    def migrate(self):
+        """启动时执行一次：导入旧的 file_mapping.json，迁移旧格式缓存文件"""
+        if isinstance(self.store, SqliteMappingStore):
+            self.store.import_json(self.mapping_file)
+        self.migrate_old_cache_format()
+    
+    @property
+    def mappings(self) -> Dict:
+        """全部文件映射（hash -> 映射信息）的快照"""
+        return self.store.all()
     
     def generate_file_hash(self, filename: str, content: str) -> str:
         """生成文件hash，结合文件名和内容"""
@@ -52,12 +52,14 @@ class FileManager:
         return hashlib.md5(combined.encode("utf-8")).hexdigest()[:12]
     
     def add_file_mapping(self, original_filename: str, plan_content: str, 
-                        embedding_model: str, chunks_count: int) -> str:
+                        embedding_model: str, chunks_count: int,
+                        scheme_id: str = None, doc_folder: str = None,
+                        base_file_hash: str = None) -> str:
         """添加文件映射，为每个文档创建独立文件夹"""
         file_hash = self.generate_file_hash(original_filename, plan_content)
         
-        # 创建文档专用文件夹
-        doc_folder = os.path.join(self.cache_dir, file_hash)
+        # 创建文档专用文件夹（调用方可指定实际缓存文件所在的文件夹）
+        doc_folder = doc_folder or os.path.join(self.cache_dir, file_hash)
         os.makedirs(doc_folder, exist_ok=True)
         
         mapping_info = {
@@ -67,11 +69,13 @@ class FileManager:
             "text_length": len(plan_content),
             "chunks_count": chunks_count,
             "embedding_model": embedding_model,
+            "scheme_id": str(scheme_id) if scheme_id is not None else None,
+            "base_file_hash": base_file_hash,
             "doc_folder": doc_folder,
             "cache_files": {
-                "chunks": os.path.join(doc_folder, "chunks.txt"),
-                "embeddings": os.path.join(doc_folder, "embeddings.npy"),
+                "chunks": os.path.join(doc_folder, ChunkStore.BLOB_FILE),
                 "faiss_index": os.path.join(doc_folder, "faiss.idx"),
+                "lexical_index": os.path.join(doc_folder, "lexical.json"),
                 "metadata": os.path.join(doc_folder, "metadata.json")
             }
         }
@@ -94,29 +98,33 @@ class FileManager:
         except IOError as e:
             print(f"保存元数据失败: {e}")
         
-        self.mappings[file_hash] = mapping_info
-        self._save_mappings()
+        self.store.put(mapping_info)
+        
+        # 同步加入全局索引
+        try:
+            get_corpus_index(self.cache_dir).add_plan_from_cache(file_hash, mapping_info)
+        except Exception as e:
+            print(f"加入全局索引失败: {e}")
         
         return file_hash
     
     def get_file_info(self, file_hash: str) -> Optional[Dict]:
         """获取文件信息"""
-        return self.mappings.get(file_hash)
+        return self.store.get(file_hash)
     
     def get_all_files(self) -> List[Dict]:
         """获取所有文件列表"""
-        return list(self.mappings.values())
+        return list(self.store.all().values())
     
-    def delete_file_mapping(self, file_hash: str) -> bool:
-        """删除文件映射和相关缓存文件夹"""
-        if file_hash not in self.mappings:
+    def delete_file_mapping(self, file_hash: str, remove_files: bool = True) -> bool:
+        """删除文件映射和相关缓存文件夹（remove_files=False 时只删除映射，文件由调用方处理）"""
+        mapping_info = self.store.get(file_hash)
+        if mapping_info is None:
             return False
         
-        mapping_info = self.mappings[file_hash]
-        
         # 删除整个文档文件夹
         doc_folder = mapping_info.get("doc_folder")
-        if doc_folder and os.path.exists(doc_folder):
+        if remove_files and doc_folder and os.path.exists(doc_folder):
             try:
                 import shutil
                 shutil.rmtree(doc_folder)
@@ -133,59 +141,29 @@ class FileManager:
                             print(f"删除缓存文件失败: {e2}")
         
         # 删除映射记录
-        del self.mappings[file_hash]
-        self._save_mappings()
+        self.store.delete(file_hash)
+        
+        # 同步从全局索引移除
+        try:
+            get_corpus_index(self.cache_dir).remove_plan(file_hash)
+        except Exception as e:
+            print(f"从全局索引移除失败: {e}")
         
         return True
     
     def find_by_filename(self, filename: str) -> Optional[Dict]:
         """根据文件名查找映射"""
-        for file_hash, info in self.mappings.items():
-            if info.get("original_filename") == filename:
-                return info
-        return None
+        return self.store.find_by_filename(filename)
+    
+    def find_previous_version(self, scheme_id: str = None, filename: str = None,
+                              embedding_model: str = None, exclude_hash: str = None) -> Optional[Dict]:
+        """查找同一方案（优先按scheme_id，其次按文件名）最近一次上传的版本"""
+        return self.store.find_previous_version(scheme_id, filename, embedding_model, exclude_hash)
     
     def cleanup_orphaned_cache(self):
-        """清理孤立的缓存文件和文件夹"""
-        if not os.path.exists(self.cache_dir):
-            return
-        
-        # 获取所有有效的文档hash
-        valid_hashes = set(self.mappings.keys())
-        
-        # 检查缓存目录中的内容
-        for item in os.listdir(self.cache_dir):
-            if item == "file_mapping.json":
-                continue
-            
-            item_path = os.path.join(self.cache_dir, item)
-            
-            # 如果是文件夹且不在有效hash列表中，删除它
-            if os.path.isdir(item_path) and item not in valid_hashes:
-                try:
-                    import shutil
-                    shutil.rmtree(item_path)
-                    print(f"清理孤立缓存文件夹: {item_path}")
-                except OSError as e:
-                    print(f"清理文件夹失败: {e}")
-            
-            # 如果是文件且不是映射文件，也删除它（兼容旧格式）
-            elif os.path.isfile(item_path):
-                # 检查是否是旧格式的缓存文件
-                is_old_cache = any(
-                    item.startswith(hash_val) and 
-                    (item.endswith('_chunks.txt') or 
-                     item.endswith('_embeds.npy') or 
-                     item.endswith('_faiss.idx'))
-                    for hash_val in valid_hashes
-                )
-                
-                if not is_old_cache:
-                    try:
-                        os.remove(item_path)
-                        print(f"清理孤立缓存文件: {item_path}")
-                    except OSError as e:
-                        print(f"清理文件失败: {e}")
+        """清理孤立的缓存文件和文件夹（由缓存回收器执行，不做容量淘汰）"""
+        from .CacheGC import CacheGC
+        return CacheGC(self.cache_dir, file_manager=self, max_bytes=0).run_once()
     
     def migrate_old_cache_format(self):
         """迁移旧的缓存格式到新的文件夹结构"""
@@ -218,7 +196,8 @@ class FileManager:
         
         # 迁移旧文件到新文件夹结构
         for hash_val, files in old_files.items():
-            if hash_val in self.mappings:
+            mapping_info = self.store.get(hash_val)
+            if mapping_info is not None:
                 doc_folder = os.path.join(self.cache_dir, hash_val)
                 os.makedirs(doc_folder, exist_ok=True)
                 
@@ -241,7 +220,6 @@ class FileManager:
                         print(f"迁移文件失败: {e}")
                 
                 # 更新映射信息
-                mapping_info = self.mappings[hash_val]
                 mapping_info["doc_folder"] = doc_folder
                 mapping_info["cache_files"] = {
                     "chunks": os.path.join(doc_folder, "chunks.txt"),
@@ -249,7 +227,20 @@ class FileManager:
                     "faiss_index": os.path.join(doc_folder, "faiss.idx"),
                     "metadata": os.path.join(doc_folder, "metadata.json")
                 }
+                self.store.put(mapping_info)
         
         if old_files:
-            self._save_mappings()
-            print(f"迁移完成，共处理 {len(old_files)} 个文档的缓存文件") 
\ No newline at end of file
+            print(f"迁移完成，共处理 {len(old_files)} 个文档的缓存文件") 
+
+
+_file_managers = {}
+_file_managers_lock = threading.Lock()
+
+
+def get_file_manager(cache_dir: str = "./cache") -> FileManager:
+    """获取指定缓存目录共享的文件映射管理器（同一进程内只保留一份）"""
+    key = os.path.abspath(cache_dir)
+    with _file_managers_lock:
+        if key not in _file_managers:
+            _file_managers[key] = FileManager(cache_dir)
+        return _file_managers[key]
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本块词法倒排索引
+BM25 打分，用于补充向量检索难以命中的规范编号、章节号和专业术语
+"""
+import os
+import re
+import json
+import math
+import importlib.util
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+# jieba 导入和加载词典较慢，只检测是否安装，首次分词时才导入
+JIEBA_AVAILABLE = importlib.util.find_spec("jieba") is not None
+_jieba = None
+
+
+def _get_jieba():
+    global _jieba
+    if _jieba is None:
+        import jieba
+        jieba.setLogLevel(60)
+        _jieba = jieba
+    return _jieba
+
+
+# 中文连续片段
+_CJK_RE = re.compile(r'[一-鿿]+')
+# 规范编号、章节号、英文术语，如 GB 50204-2015、1.1、JGJ130
+_ASCII_RE = re.compile(r'[A-Za-z]+|\d+(?:[.\-/]\d+)*')
+
+# RRF 融合常数
+RRF_K = 60
+
+
+def tokenize(text: str, use_jieba: bool = None) -> List[str]:
+    """
+    中文感知分词：中文片段切分为字二元组（安装jieba时使用jieba分词），
+    数字与英文按整体保留，使规范编号、章节号可以精确匹配
+    """
+    if use_jieba is None:
+        use_jieba = JIEBA_AVAILABLE
+    tokens = [t.lower() for t in _ASCII_RE.findall(text)]
+    for run in _CJK_RE.findall(text):
+        if use_jieba:
+            tokens.extend(w for w in _get_jieba().cut_for_search(run) if w.strip())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class LexicalIndex:
+    """BM25 倒排索引"""
+
+    FILE_NAME = "lexical.json"
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.tokenizer = "jieba" if JIEBA_AVAILABLE else "bigram"
+        self.postings = {}
+        self.doc_lens = []
+        self.avgdl = 0.0
+
+    def build(self, chunks: List[str]):
+        """根据文本块列表构建索引，文档编号即 chunk 下标"""
+        postings = defaultdict(list)
+        doc_lens = []
+        for doc_id, chunk in enumerate(chunks):
+            tf = Counter(tokenize(chunk, self.tokenizer == "jieba"))
+            doc_lens.append(sum(tf.values()))
+            for term, freq in tf.items():
+                postings[term].append([doc_id, freq])
+        self.postings = dict(postings)
+        self.doc_lens = doc_lens
+        self.avgdl = sum(doc_lens) / len(doc_lens) if doc_lens else 0.0
+        return self
+
+    def __len__(self):
+        return len(self.doc_lens)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
+        """返回 [(chunk下标, BM25分数)]，按分数降序"""
+        n_docs = len(self.doc_lens)
+        if n_docs == 0:
+            return []
+
+        scores = defaultdict(float)
+        for term in set(tokenize(query, self.tokenizer == "jieba")):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc_id, freq in plist:
+                norm = 1 - self.b + self.b * self.doc_lens[doc_id] / (self.avgdl or 1)
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + self.k1 * norm)
+
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+    def save(self, path: str):
+        """保存索引到文件"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "tokenizer": self.tokenizer,
+                "k1": self.k1,
+                "b": self.b,
+                "doc_lens": self.doc_lens,
+                "postings": self.postings
+            }, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str):
+        """从文件加载索引，分词方式与当前环境不一致时返回 None 以便重建"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"加载词法索引失败: {e}")
+            return None
+
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75))
+        if data.get("tokenizer") != index.tokenizer:
+            return None
+        index.postings = data.get("postings", {})
+        index.doc_lens = data.get("doc_lens", [])
+        index.avgdl = sum(index.doc_lens) / len(index.doc_lens) if index.doc_lens else 0.0
+        return index
+
+
+def rrf_fuse(ranked_lists: List[List[int]], k: int = RRF_K) -> Dict[int, float]:
+    """倒数排名融合（RRF），返回 {chunk下标: 融合分数}"""
+    fused = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked):
+            fused[doc_id] += 1.0 / (k + rank + 1)
+    return dict(fused)
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件映射存储后端
+json：整体读写 file_mapping.json（旧实现），文件修改时间变化时重新加载，
+写入时持有 file_mapping.json.lock 文件锁，多个 worker 进程同时增删不会互相覆盖
+sqlite：嵌入式 SQLite 索引，按 hash / 文件名 / 上传时间 / 嵌入模型 / scheme_id 建索引，
+WAL 模式下多进程可并发读，每次增删只写一行
+"""
+import os
+import json
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from utils.file_lock import file_lock
+
+
+class JsonMappingStore:
+    """基于 file_mapping.json 的映射存储"""
+
+    def __init__(self, mapping_file: str):
+        self.mapping_file = mapping_file
+        self.lock_file = mapping_file + ".lock"
+        self._lock = threading.RLock()
+        self._mtime = None
+        self._mappings = {}
+        self._refresh()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.mapping_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh(self):
+        """文件被其他进程修改过时重新加载"""
+        mtime = self._file_mtime()
+        if mtime == self._mtime:
+            return
+        mappings = {}
+        if mtime is not None:
+            try:
+                with open(self.mapping_file, 'r', encoding='utf-8') as f:
+                    mappings = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"加载文件映射失败: {e}")
+                return
+        self._mappings = mappings
+        self._mtime = mtime
+
+    def _save(self):
+        try:
+            tmp_file = self.mapping_file + ".tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._mappings, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.mapping_file)
+            self._mtime = self._file_mtime()
+        except IOError as e:
+            print(f"保存文件映射失败: {e}")
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        with self._lock:
+            self._refresh()
+            return self._mappings.get(file_hash)
+
+    def put(self, info: Dict):
+        # 在文件锁内重新加载后修改并写回，避免覆盖其他进程刚写入的映射
+        with self._lock, file_lock(self.lock_file):
+            self._refresh()
+            self._mappings[info["file_hash"]] = info
+            self._save()
+
+    def delete(self, file_hash: str) -> bool:
+        with self._lock, file_lock(self.lock_file):
+            self._refresh()
+            if self._mappings.pop(file_hash, None) is None:
+                return False
+            self._save()
+            return True
+
+    def all(self) -> Dict[str, Dict]:
+        with self._lock:
+            self._refresh()
+            return dict(self._mappings)
+
+    def find_by_filename(self, filename: str) -> Optional[Dict]:
+        for info in self.all().values():
+            if info.get("original_filename") == filename:
+                return info
+        return None
+
+    def find_previous_version(self, scheme_id: str = None, filename: str = None,
+                              embedding_model: str = None, exclude_hash: str = None) -> Optional[Dict]:
+        # 给出 scheme_id 时只按 scheme_id 匹配：同名的“施工方案.docx”可能属于不相关的方案
+        if scheme_id is None and not filename:
+            return None
+        candidates = []
+        for file_hash, info in self.all().items():
+            if file_hash == exclude_hash:
+                continue
+            if embedding_model and info.get("embedding_model") != embedding_model:
+                continue
+            if scheme_id is not None:
+                if info.get("scheme_id") == str(scheme_id):
+                    candidates.append(info)
+            elif info.get("original_filename") == filename:
+                candidates.append(info)
+        if not candidates:
+            return None
+        return max(candidates, key=lambda info: info.get("upload_time", ""))
+
+    def file_names(self) -> List[str]:
+        """存储占用的文件名（清理缓存时跳过）"""
+        return [os.path.basename(self.mapping_file), os.path.basename(self.lock_file)]
+
+
+class SqliteMappingStore:
+    """基于 SQLite 的映射存储，完整映射信息以 JSON 保存在 info 列，查询字段单独建列和索引"""
+
+    FILE_NAME = "file_index.db"
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS file_mappings (
+        file_hash TEXT PRIMARY KEY,
+        original_filename TEXT,
+        upload_time TEXT,
+        embedding_model TEXT,
+        scheme_id TEXT,
+        info TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_file_mappings_filename ON file_mappings(original_filename, upload_time);
+    CREATE INDEX IF NOT EXISTS idx_file_mappings_upload_time ON file_mappings(upload_time);
+    CREATE INDEX IF NOT EXISTS idx_file_mappings_model ON file_mappings(embedding_model);
+    CREATE INDEX IF NOT EXISTS idx_file_mappings_scheme ON file_mappings(scheme_id, upload_time);
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=30000")
+        with self._lock:
+            self._conn.executescript(self._SCHEMA)
+
+    @staticmethod
+    def _row_values(info: Dict):
+        return (
+            info["file_hash"],
+            info.get("original_filename"),
+            info.get("upload_time", ""),
+            info.get("embedding_model"),
+            str(info["scheme_id"]) if info.get("scheme_id") is not None else None,
+            json.dumps(info, ensure_ascii=False)
+        )
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        rows = self._query("SELECT info FROM file_mappings WHERE file_hash = ?", (file_hash,))
+        return rows[0] if rows else None
+
+    def put(self, info: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO file_mappings "
+                "(file_hash, original_filename, upload_time, embedding_model, scheme_id, info) "
+                "VALUES (?, ?, ?, ?, ?, ?)", self._row_values(info))
+
+    def put_many(self, infos: List[Dict]) -> int:
+        """在一个事务中批量写入，已存在的 hash 不覆盖，返回新增条数"""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO file_mappings "
+                    "(file_hash, original_filename, upload_time, embedding_model, scheme_id, info) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", [self._row_values(info) for info in infos])
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._conn.total_changes - before
+
+    def delete(self, file_hash: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM file_mappings WHERE file_hash = ?", (file_hash,))
+        return cursor.rowcount > 0
+
+    def all(self) -> Dict[str, Dict]:
+        return {info["file_hash"]: info
+                for info in self._query("SELECT info FROM file_mappings ORDER BY upload_time")}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM file_mappings").fetchone()[0]
+
+    def find_by_filename(self, filename: str) -> Optional[Dict]:
+        rows = self._query("SELECT info FROM file_mappings WHERE original_filename = ? "
+                           "ORDER BY upload_time DESC LIMIT 1", (filename,))
+        return rows[0] if rows else None
+
+    def find_previous_version(self, scheme_id: str = None, filename: str = None,
+                              embedding_model: str = None, exclude_hash: str = None) -> Optional[Dict]:
+        # 给出 scheme_id 时只按 scheme_id 匹配：同名的“施工方案.docx”可能属于不相关的方案
+        if scheme_id is not None:
+            sql, params = "SELECT info FROM file_mappings WHERE scheme_id = ?", [str(scheme_id)]
+        elif filename:
+            sql, params = "SELECT info FROM file_mappings WHERE original_filename = ?", [filename]
+        else:
+            return None
+
+        if exclude_hash:
+            sql += " AND file_hash != ?"
+            params.append(exclude_hash)
+        if embedding_model:
+            sql += " AND embedding_model = ?"
+            params.append(embedding_model)
+        rows = self._query(sql + " ORDER BY upload_time DESC LIMIT 1", params)
+        return rows[0] if rows else None
+
+    def import_json(self, mapping_file: str) -> int:
+        """导入旧的 file_mapping.json，导入后将其重命名为 .migrated，返回导入条数"""
+        if not os.path.exists(mapping_file):
+            return 0
+        try:
+            with open(mapping_file, 'r', encoding='utf-8') as f:
+                mappings = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"读取旧文件映射失败: {e}")
+            return 0
+        infos = [dict(info, file_hash=info.get("file_hash") or file_hash)
+                 for file_hash, info in mappings.items()]
+        imported = self.put_many(infos)
+        try:
+            os.replace(mapping_file, mapping_file + ".migrated")
+        except OSError:
+            # 其他进程已完成导入
+            pass
+        print(f"已将 {os.path.basename(mapping_file)} 导入 SQLite 索引: {imported} 条")
+        return imported
+
+    def file_names(self) -> List[str]:
+        """存储占用的文件名（清理缓存时跳过）"""
+        name = os.path.basename(self.db_file)
+        return [name, name + "-wal", name + "-shm"]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型调用的重试与对冲
+可重试的失败（429/5xx、超时、连接失败）按指数退避重试，重试用尽抛出 ModelCallError，
+不再把错误文字当作模型回复返回；配置了备用服务时，主服务超过历史延迟分位数仍未返回，
+向备用服务发出一份相同请求，取先成功的结果
+"""
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Tuple
+
+from .RateLimiter import is_overload_error
+from config.settings import MODEL_CALL_CONFIG
+
+
+class ModelCallError(Exception):
+    """模型调用失败（已按策略重试）"""
+
+    def __init__(self, message: str, backend: str = "", model: str = "", attempts: int = 0,
+                 retryable: bool = False, cause: Exception = None):
+        super().__init__(message)
+        self.backend = backend
+        self.model = model
+        self.attempts = attempts
+        self.retryable = retryable
+        self.cause = cause
+
+
+def backoff_delay(attempt: int, base: float = None, maximum: float = None) -> float:
+    """第 attempt 次重试前的等待时间（指数退避 + 全抖动）"""
+    base = MODEL_CALL_CONFIG.backoff_base if base is None else base
+    maximum = MODEL_CALL_CONFIG.backoff_max if maximum is None else maximum
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+def call_with_retry(func: Callable, backend: str = "", model: str = "", max_retries: int = None):
+    """调用 func，可重试的失败按退避重试，最终失败抛出 ModelCallError"""
+    max_retries = MODEL_CALL_CONFIG.max_retries if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except ModelCallError:
+            raise
+        except Exception as e:
+            retryable = is_overload_error(e)
+            if not retryable or attempt >= max_retries:
+                raise ModelCallError(
+                    f"模型调用失败（{backend or 'default'}/{model}，尝试 {attempt + 1} 次）: {e}",
+                    backend=backend, model=model, attempts=attempt + 1, retryable=retryable, cause=e
+                ) from e
+            delay = backoff_delay(attempt)
+            print(f"模型调用失败，{delay:.1f} 秒后重试（第 {attempt + 1} 次）: {e}")
+            time.sleep(delay)
+            attempt += 1
+
+
+async def call_with_retry_async(func: Callable, backend: str = "", model: str = "", max_retries: int = None):
+    """协程版 call_with_retry，func 返回可等待对象，退避期间不占用线程"""
+    max_retries = MODEL_CALL_CONFIG.max_retries if max_retries is None else max_retries
+    attempt = 0
+    while True:
+        try:
+            return await func()
+        except ModelCallError:
+            raise
+        except Exception as e:
+            retryable = is_overload_error(e)
+            if not retryable or attempt >= max_retries:
+                raise ModelCallError(
+                    f"模型调用失败（{backend or 'default'}/{model}，尝试 {attempt + 1} 次）: {e}",
+                    backend=backend, model=model, attempts=attempt + 1, retryable=retryable, cause=e
+                ) from e
+            delay = backoff_delay(attempt)
+            print(f"模型调用失败，{delay:.1f} 秒后重试（第 {attempt + 1} 次）: {e}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+class LatencyTracker:
+    """记录最近若干次调用耗时，用于计算对冲触发延迟"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float):
+        """样本不足 hedge_min_samples 时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < MODEL_CALL_CONFIG.hedge_min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+# (服务地址, 模型) -> 延迟记录
+_trackers: Dict[Tuple[str, str], LatencyTracker] = {}
+_trackers_lock = threading.Lock()
+# 对冲请求使用的线程池，及已提交未完成的任务数（不超过线程数，提交的任务总能立即开始）
+_executor = None
+_outstanding = 0
+
+
+def get_latency_tracker(backend: str = "", model: str = "") -> LatencyTracker:
+    key = (backend or "", model or "")
+    with _trackers_lock:
+        if key not in _trackers:
+            _trackers[key] = LatencyTracker()
+        return _trackers[key]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _trackers_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MODEL_CALL_CONFIG.hedge_workers,
+                                           thread_name_prefix="model-hedge")
+        return _executor
+
+
+def _submit(func: Callable):
+    """线程池有空闲线程时提交 func 并返回 Future，已满时返回 None（不排队）"""
+    global _outstanding
+    with _trackers_lock:
+        if _outstanding >= MODEL_CALL_CONFIG.hedge_workers:
+            return None
+        _outstanding += 1
+
+    def run():
+        global _outstanding
+        try:
+            return func()
+        finally:
+            with _trackers_lock:
+                _outstanding -= 1
+
+    return _get_executor().submit(run)
+
+
+def hedged_call(primary: Callable, secondary: Callable, backend: str = "", model: str = ""):
+    """
+    先调用 primary；超过其延迟分位数仍未返回时再调用 secondary，返回先成功的结果。
+    延迟样本不足或对冲线程池已满时只在当前线程调用 primary。两者都失败时抛出 primary 的异常。
+    同步模型调用无法中途取消：落后的一方继续运行到结束（仍占用其服务节点和限流名额），
+    结果丢弃，其延迟照常记录；同时在途的对冲调用数以 LLM_HEDGE_WORKERS 为上限
+    """
+    tracker = get_latency_tracker(backend, model)
+    delay = tracker.percentile(MODEL_CALL_CONFIG.hedge_percentile)
+
+    def timed():
+        start = time.monotonic()
+        result = primary()
+        tracker.record(time.monotonic() - start)
+        return result
+
+    primary_future = _submit(timed) if delay is not None else None
+    if primary_future is None:
+        return timed()
+
+    delay = max(delay, MODEL_CALL_CONFIG.hedge_min_delay)
+    done, _ = wait([primary_future], timeout=delay)
+    if done:
+        return primary_future.result()
+
+    secondary_future = _submit(secondary)
+    if secondary_future is None:
+        # 线程池已满，不再对冲
+        return primary_future.result()
+
+    print(f"模型调用超过 {delay:.1f} 秒未返回，向备用服务发出对冲请求（{model}）")
+    pending = {primary_future, secondary_future}
+    first_error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                return future.result()
+            except Exception as e:
+                if first_error is None or future is primary_future:
+                    first_error = e
+    raise first_error
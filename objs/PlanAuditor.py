@@ -1,21 +1,55 @@
 import hashlib
 import os
+import asyncio
 import json
-import pickle
+import difflib
+import threading
 import numpy as np
-import faiss
-from tqdm import tqdm
-from sklearn.neighbors import NearestNeighbors
-from typing import Union, List
-from openai import OpenAI
+from utils.lazy_import import lazy_import
+from utils.token_counter import estimate_tokens
+from utils.context_packer import truncate_tokens
 from .EmbeddingRetriever import EmbeddingRetriever
-from .FileManager import FileManager
+from .FileManager import get_file_manager
+from .LexicalIndex import LexicalIndex, rrf_fuse
+from .TextChunker import TextChunker
+from .ChunkStore import ChunkStore
+from .VectorIndex import build_index, index_storage, index_vectors, normalize_storage
+from .CacheGC import mark_access
+from config.settings import CHUNK_CONFIG, INDEX_CONFIG, PROMPT_CONFIG
+
+faiss = lazy_import("faiss")
+
+# 检查项文件缓存：绝对路径 -> (修改时间, 检查项列表)，文件修改后重新读取
+_check_list_cache = {}
+_check_list_lock = threading.Lock()
+
+
+def read_check_list(check_list_file):
+    """读取 JSONL 检查项文件（按修改时间缓存），返回检查项列表的副本"""
+    path = os.path.abspath(check_list_file)
+    mtime = os.stat(path).st_mtime_ns
+    with _check_list_lock:
+        cached = _check_list_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        items = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    items.append(json.loads(line.strip()))
+        cached = (mtime, items)
+        with _check_list_lock:
+            _check_list_cache[path] = cached
+    return [dict(item) for item in cached[1]]
+
 
 class PlanAuditor:
     """
     施工方案审核器，使用OpenAI接口进行文本嵌入和检索
     """
 
+    # int8 索引解码后的向量再次量化会逐版本累积误差，另存一份 float16 向量供下一版本复用
+    REUSE_VECTORS_FILE = "vectors.f16.npy"
+
     def __init__(
             self,
             plan_content: str,
@@ -24,16 +58,18 @@ class PlanAuditor:
             openai_api_key: str = None,
             openai_api_base: str = None,
             cache_dir: str = "./cache",
-            original_filename: str = None
+            original_filename: str = None,
+            scheme_id: str = None
     ):
         self.plan_content = plan_content
         self.check_list_file = check_list_file
         self.cache_dir = cache_dir
         self.original_filename = original_filename
+        self.scheme_id = scheme_id
         self.embedding_model = embedding_model
 
         # 初始化文件管理器
-        self.file_manager = FileManager(cache_dir)
+        self.file_manager = get_file_manager(cache_dir)
 
         # 初始化嵌入器
         self.embedder = EmbeddingRetriever(
@@ -48,23 +84,32 @@ class PlanAuditor:
         # 加载检查项
         self.check_items = self.load_check_items()
 
+        # 文本分块器
+        self.chunker = TextChunker(
+            max_tokens=CHUNK_CONFIG.max_tokens,
+            overlap_tokens=CHUNK_CONFIG.overlap_tokens,
+            min_tokens=CHUNK_CONFIG.min_tokens
+        )
+
         # 初始化嵌入
         self.chunks = []
-        self.chunk_embeddings = None
+        # 各文本块在原文中的字符区间和章节路径，与 chunks 一一对应
+        self.chunk_meta = []
+        # 向量只保存在 FAISS 索引中（float32 / float16 / int8），不再单独保存 embeddings.npy
+        self.vector_storage = normalize_storage(INDEX_CONFIG.vector_storage)
         self.faiss_index = None
+        self.lexical_index = None
         self.file_hash = None
+        # 相对上一版本的修订信息，首次构建时为 None
+        self.revision_info = None
+        # 方案概要缓存 (token 数, 概要文本)
+        self._digest = None
 
     def load_check_items(self):
         """
         读取 JSONL 文件，返回包含所有检查项的列表，每个检查项为一个字典
         """
-        items = []
-        with open(self.check_list_file, "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    item = json.loads(line.strip())
-                    items.append(item)
-        return items
+        return read_check_list(self.check_list_file)
 
     def get_hash(self):
         """用文件名和内容 hash 区分不同方案文本"""
@@ -73,62 +118,15 @@ class PlanAuditor:
             self.file_hash = self.file_manager.generate_file_hash(filename, self.plan_content)
         return self.file_hash
 
-    def split_text(self, text, max_length=300):
-        """将文本分割成块，增加错误处理"""
-        import re
-        
-        # 检查输入文本
-        if not text or not text.strip():
-            return ["空文档"]
-        
-        try:
-            # 按句子分割
-            sentences = re.split(r'(?<=[。！？\.\!\?])', text)
-            
-            # 过滤空句子
-            sentences = [s.strip() for s in sentences if s.strip()]
-            
-            if not sentences:
-                return [text.strip()]
-            
-            chunks, chunk = [], ""
-            for sent in sentences:
-                # 检查单个句子是否过长
-                if len(sent) > max_length:
-                    # 如果当前chunk不为空，先添加到chunks
-                    if chunk:
-                        chunks.append(chunk.strip())
-                        chunk = ""
-                    # 将长句子按字符强制分割
-                    for i in range(0, len(sent), max_length):
-                        chunks.append(sent[i:i+max_length])
-                else:
-                    # 正常处理
-                    if len(chunk) + len(sent) > max_length and chunk:
-                        chunks.append(chunk.strip())
-                        chunk = ""
-                    chunk += sent
-            
-            # 添加最后一个chunk
-            if chunk and chunk.strip():
-                chunks.append(chunk.strip())
-            
-            # 确保至少有一个chunk
-            if not chunks:
-                chunks = [text[:max_length] if len(text) > max_length else text]
-            
-            return chunks
-            
-        except Exception as e:
-            print(f"文本分割错误: {e}")
-            # 降级处理：按固定长度分割
-            if len(text) <= max_length:
-                return [text]
-            else:
-                chunks = []
-                for i in range(0, len(text), max_length):
-                    chunks.append(text[i:i+max_length])
-                return chunks
+    def split_text(self, text, max_length=None):
+        """
+        按章节标题和表格结构分块，max_length 为单块最大 token 数（默认取分块配置）
+        返回 Chunk 列表，每块记录原文区间 [start, end) 和章节路径
+        """
+        chunker = self.chunker
+        if max_length is not None:
+            chunker = TextChunker(max_length, self.chunker.overlap_tokens, self.chunker.min_tokens)
+        return chunker.split(text)
 
     def build_or_load_embeddings(self, use_cache=True):
         """
@@ -142,108 +140,343 @@ class PlanAuditor:
             # 使用文件映射中的路径
             cache_files = file_info.get("cache_files", {})
             chunk_file = cache_files.get("chunks")
-            emb_file = cache_files.get("embeddings")
             faiss_file = cache_files.get("faiss_index")
         else:
             # 创建新的文档文件夹结构
             doc_folder = os.path.join(self.cache_dir, hash_prefix)
             os.makedirs(doc_folder, exist_ok=True)
             
-            chunk_file = os.path.join(doc_folder, "chunks.txt")
-            emb_file = os.path.join(doc_folder, "embeddings.npy")
+            chunk_file = os.path.join(doc_folder, ChunkStore.BLOB_FILE)
             faiss_file = os.path.join(doc_folder, "faiss.idx")
 
         # 检查缓存
-        if use_cache and chunk_file and emb_file and faiss_file and \
-           os.path.exists(chunk_file) and os.path.exists(emb_file) and os.path.exists(faiss_file):
+        if use_cache and faiss_file and self.chunks_exist(chunk_file) and os.path.exists(faiss_file):
             print(f"加载嵌入缓存: {hash_prefix}")
-            self.load_embeddings(chunk_file, emb_file, faiss_file)
+            self.load_embeddings(chunk_file, faiss_file)
             return hash_prefix
 
         print("首次生成嵌入...")
         # 分割文本
-        self.chunks = self.split_text(self.plan_content)
+        chunks = self.split_text(self.plan_content)
+        self._release_chunks()
+        if chunks:
+            self.chunks = [c.text for c in chunks]
+            self.chunk_meta = [c.to_meta() for c in chunks]
+        else:
+            self.chunks = ["空文档"]
+            self.chunk_meta = [{"start": 0, "end": 0, "section_path": []}]
         print(f"共分割为 {len(self.chunks)} 个文本块")
 
         if not self.chunks:
             raise ValueError("文本分割失败，没有生成任何文本块")
 
-        # 生成嵌入
-        print("文本块嵌入中...")
-        self.chunk_embeddings = self.embedder.encode(self.chunks)
+        # 生成嵌入，存在上一版本时只嵌入变化的文本块
+        self.revision_info = None
+        previous = self.file_manager.find_previous_version(
+            scheme_id=self.scheme_id,
+            filename=self.original_filename,
+            embedding_model=self.embedding_model,
+            exclude_hash=hash_prefix
+        )
+        if previous:
+            embeddings = self.reuse_previous_embeddings(previous)
+        else:
+            print("文本块嵌入中...")
+            embeddings = self.embedder.encode(self.chunks)
+
+        # 构建 FAISS 索引，按配置的存储模式保存向量
+        print(f"嵌入向量形状: {embeddings.shape}, 存储模式: {self.vector_storage}")
+        self.faiss_index = build_index(embeddings, self.vector_storage)
 
-        # 构建 FAISS 索引
-        dim = self.chunk_embeddings.shape[1]
-        self.faiss_index = faiss.IndexFlatL2(dim)
-        # 确保嵌入向量是正确的数据类型和连续性
-        embeddings_float32 = np.ascontiguousarray(self.chunk_embeddings.astype(np.float32))
-        print(f"嵌入向量形状: {embeddings_float32.shape}, 数据类型: {embeddings_float32.dtype}")
-        self.faiss_index.add(embeddings_float32)
+        # 构建词法索引
+        self.lexical_index = LexicalIndex().build(self.chunks)
 
         # 确保目录存在（如果是新文件）
         if chunk_file:
             os.makedirs(os.path.dirname(chunk_file), exist_ok=True)
             
         # 保存到缓存
-        self.save_embeddings(chunk_file, emb_file, faiss_file)
+        self.save_embeddings(chunk_file, faiss_file, embeddings)
         
+        # 保存修订信息
+        revision_file = os.path.join(os.path.dirname(faiss_file), "revision.json")
+        if self.revision_info:
+            with open(revision_file, "w", encoding="utf-8") as f:
+                json.dump(self.revision_info, f, ensure_ascii=False, indent=2)
+        elif os.path.exists(revision_file):
+            os.remove(revision_file)
+
         # 添加文件映射（如果还没有）
         if self.original_filename and not file_info:
             hash_prefix = self.file_manager.add_file_mapping(
                 original_filename=self.original_filename,
                 plan_content=self.plan_content,
                 embedding_model=self.embedding_model,
-                chunks_count=len(self.chunks)
+                chunks_count=len(self.chunks),
+                scheme_id=self.scheme_id,
+                doc_folder=os.path.dirname(faiss_file),
+                base_file_hash=self.revision_info["base_file_hash"] if self.revision_info else None
             )
         
+        mark_access(hash_prefix, os.path.dirname(faiss_file))
         print("嵌入保存成功。")
         return hash_prefix
 
-    def save_embeddings(self, chunk_file, emb_file, faiss_file):
-        """保存嵌入到文件"""
-        # 保存 chunk 文本
-        with open(chunk_file, "w", encoding="utf-8") as f:
-            for c in self.chunks:
-                f.write(c.replace("\n", " ") + "\n")
-        # 保存 embedding
-        np.save(emb_file, self.chunk_embeddings)
-        # 保存 faiss index
+    @staticmethod
+    def _chunk_key(chunk):
+        """文本块比较键，忽略换行差异（兼容旧版 chunks.txt 中保存的形式）"""
+        return chunk.replace("\n", " ").strip()
+
+    def reuse_previous_embeddings(self, previous):
+        """
+        与上一版本的文本块逐块对比：未变化的文本块直接复用旧向量，只对新增或修改的文本块调用嵌入接口。
+        新索引按新的文本块顺序构建，保证 FAISS 编号与 chunk 下标一致。
+        """
+        cache_files = previous.get("cache_files", {})
+        try:
+            old_store = self.read_chunks(cache_files["chunks"])
+            try:
+                old_keys = [self._chunk_key(c) for c in old_store]
+            finally:
+                if isinstance(old_store, ChunkStore):
+                    old_store.close()
+            reuse_file = os.path.join(os.path.dirname(cache_files["faiss_index"]), self.REUSE_VECTORS_FILE)
+            if os.path.exists(reuse_file):
+                old_vectors = np.load(reuse_file).astype(np.float32)
+            else:
+                old_vectors = index_vectors(faiss.read_index(cache_files["faiss_index"]))
+        except (IOError, RuntimeError, KeyError, ValueError) as e:
+            print(f"读取上一版本缓存失败，全部重新嵌入: {e}")
+            return self.embedder.encode(self.chunks)
+
+        if len(old_keys) != len(old_vectors):
+            print("上一版本文本块与向量数量不一致，全部重新嵌入")
+            return self.embedder.encode(self.chunks)
+
+        new_keys = [self._chunk_key(c) for c in self.chunks]
+        known_vectors = {}
+        for key, vec in zip(old_keys, old_vectors):
+            known_vectors.setdefault(key, vec)
+
+        embeddings = np.zeros((len(self.chunks), old_vectors.shape[1]), dtype=np.float32)
+        missing = []
+        for i, key in enumerate(new_keys):
+            if key in known_vectors:
+                embeddings[i] = known_vectors[key]
+            else:
+                missing.append(i)
+
+        print(f"基于上一版本 {previous.get('file_hash')} 增量嵌入: "
+              f"复用 {len(self.chunks) - len(missing)} 块，新嵌入 {len(missing)} 块")
+        if missing:
+            new_vectors = self.embedder.encode([self.chunks[i] for i in missing])
+            if new_vectors.shape[1] != embeddings.shape[1]:
+                print("向量维度与上一版本不一致，全部重新嵌入")
+                return self.embedder.encode(self.chunks)
+            embeddings[missing] = new_vectors
+
+        # 记录变化区间，new 为本版本的 chunk 下标区间 [start, end)
+        matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+        changed_ranges = [
+            {"op": tag, "old": [i1, i2], "new": [j1, j2]}
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"
+        ]
+        self.revision_info = {
+            "base_file_hash": previous.get("file_hash"),
+            "base_chunks_count": len(old_keys),
+            "reused_chunks": len(self.chunks) - len(missing),
+            "embedded_chunks": len(missing),
+            "changed_ranges": changed_ranges
+        }
+        return embeddings
+
+    def get_changed_chunk_indices(self):
+        """
+        返回相对上一版本发生变化的 chunk 下标集合；
+        删除的区间以其前后相邻的文本块表示。没有修订信息时返回 None
+        """
+        if not self.revision_info:
+            return None
+        changed = set()
+        for r in self.revision_info.get("changed_ranges", []):
+            start, end = r["new"]
+            if start < end:
+                changed.update(range(start, end))
+            else:
+                changed.update(i for i in (start - 1, start) if 0 <= i < len(self.chunks))
+        return changed
+
+    def save_embeddings(self, chunk_file, faiss_file, embeddings=None):
+        """保存嵌入到文件（int8 索引同时保存 float16 向量，供下一版本复用）"""
+        # 保存 chunk 文本及元数据（二进制存储，原样保留换行）
+        folder = os.path.dirname(chunk_file)
+        ChunkStore.write(folder, list(self.chunks), self.chunk_meta)
+        legacy_chunk_file = os.path.join(folder, "chunks.txt")
+        if os.path.exists(legacy_chunk_file):
+            os.remove(legacy_chunk_file)
+        # 保存 faiss index（向量只存这一份，旧版的 embeddings.npy 一并删除）
         faiss.write_index(self.faiss_index, faiss_file)
+        legacy_emb_file = os.path.join(folder, "embeddings.npy")
+        if os.path.exists(legacy_emb_file):
+            os.remove(legacy_emb_file)
+        reuse_file = os.path.join(folder, self.REUSE_VECTORS_FILE)
+        if embeddings is not None and index_storage(self.faiss_index) == "int8":
+            np.save(reuse_file, np.asarray(embeddings, dtype=np.float16))
+        elif os.path.exists(reuse_file):
+            os.remove(reuse_file)
+        # 保存词法索引
+        if self.lexical_index is not None:
+            self.lexical_index.save(os.path.join(os.path.dirname(faiss_file), LexicalIndex.FILE_NAME))
+
+    @staticmethod
+    def chunks_exist(chunk_file):
+        """缓存的 chunk 文本是否存在（二进制存储或旧版 chunks.txt）"""
+        return bool(chunk_file) and (ChunkStore.exists(os.path.dirname(chunk_file)) or os.path.exists(chunk_file))
+
+    @staticmethod
+    def read_chunks(chunk_file):
+        """读取缓存的 chunk 文本，优先使用同目录下的二进制存储"""
+        folder = os.path.dirname(chunk_file)
+        if ChunkStore.exists(folder):
+            return ChunkStore(folder)
+        # 兼容旧版 chunks.txt（每行一块）
+        with open(chunk_file, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def _release_chunks(self):
+        """释放当前文本块存储的内存映射和文件句柄（替换 self.chunks 之前调用）"""
+        if isinstance(self.chunks, ChunkStore):
+            self.chunks.close()
 
-    def load_embeddings(self, chunk_file, emb_file, faiss_file):
+    def close(self):
+        """释放审查器打开的缓存文件"""
+        self._release_chunks()
+        self.chunks = []
+
+    def joined_chunks_text(self):
+        """由文本块拼回方案全文（从缓存加载、没有原文时使用）"""
+        if isinstance(self.chunks, ChunkStore):
+            return self.chunks.joined_text()
+        return "\n".join(self.chunks)
+
+    def plan_digest(self, max_tokens: int = None) -> str:
+        """
+        方案概要：章节目录 + 方案开头部分，同一方案内固定不变，
+        作为检查提示词的公共前缀，使模型服务的前缀缓存可以跨检查项复用
+        """
+        max_tokens = max_tokens or PROMPT_CONFIG.digest_tokens
+        if self._digest is not None and self._digest[0] == max_tokens:
+            return self._digest[1]
+
+        # 章节目录最多占概要的六成，其余放方案开头
+        outline, used = [], 0
+        seen = set()
+        for meta in self.chunk_meta:
+            path = " > ".join(meta.get("section_path") or [])
+            if not path or path in seen:
+                continue
+            cost = estimate_tokens(path) + 1
+            if used + cost > max_tokens * 0.6:
+                break
+            seen.add(path)
+            outline.append(path)
+            used += cost
+
+        content = self.plan_content or self.joined_chunks_text()
+        parts = []
+        if outline:
+            parts.append("章节目录：\n" + "\n".join(outline))
+        head = truncate_tokens(content, max(0, max_tokens - used - 10))
+        if head:
+            parts.append("方案开头：\n" + head)
+        digest = "\n\n".join(parts)
+        self._digest = (max_tokens, digest)
+        return digest
+
+    def load_embeddings(self, chunk_file, faiss_file):
         """从文件加载嵌入"""
         # 加载 chunk 文本
-        with open(chunk_file, "r", encoding="utf-8") as f:
-            self.chunks = [line.strip() for line in f if line.strip()]
-        # 加载 embedding
-        self.chunk_embeddings = np.load(emb_file)
-        # 加载 faiss index
+        self._release_chunks()
+        self.chunks = self.read_chunks(chunk_file)
+        # 加载 faiss index（存储模式以索引文件为准）
         self.faiss_index = faiss.read_index(faiss_file)
+        # 加载文本块元数据（旧缓存没有时为空）
+        self.chunk_meta = self.chunks.metas if isinstance(self.chunks, ChunkStore) else []
+        # 加载修订信息
+        revision_file = os.path.join(os.path.dirname(faiss_file), "revision.json")
+        self.revision_info = None
+        if os.path.exists(revision_file):
+            with open(revision_file, "r", encoding="utf-8") as f:
+                self.revision_info = json.load(f)
+        # 加载词法索引，旧缓存没有时直接由文本块重建（不需要调用嵌入接口）
+        lexical_file = os.path.join(os.path.dirname(faiss_file), LexicalIndex.FILE_NAME)
+        self.lexical_index = LexicalIndex.load(lexical_file)
+        if self.lexical_index is None or len(self.lexical_index) != len(self.chunks):
+            self.lexical_index = LexicalIndex().build(self.chunks)
+            try:
+                self.lexical_index.save(lexical_file)
+            except IOError as e:
+                print(f"保存词法索引失败: {e}")
+        # 记录访问时间（缓存回收按最近访问淘汰）
+        mark_access(self.file_hash, os.path.dirname(faiss_file))
 
-    def search_similar_chunks(self, query: str, top_k: int = 5):
+    def search_similar_chunks(self, query: str, top_k: int = 5, hybrid: bool = True, query_vec=None):
         """
         根据查询检索最相似的文本块
+        hybrid=True 时融合向量检索与 BM25 词法检索（RRF）；
+        已有查询向量时可通过 query_vec 传入，避免重复调用嵌入接口
         """
         if self.faiss_index is None:
             raise ValueError("请先调用 build_or_load_embeddings() 初始化嵌入")
 
-        query_vec = self.embedder.encode([query])
-        distances, indices = self.faiss_index.search(query_vec, top_k)
+        if query_vec is None:
+            query_vec = self.embedder.encode([query])
+
+        if not hybrid or self.lexical_index is None:
+            distances, indices = self.faiss_index.search(query_vec, top_k)
+            return [self._format_hit(int(idx), float(dist))
+                    for idx, dist in zip(indices[0], distances[0]) if idx >= 0]
+
+        # 两路各取较多候选再融合
+        pool_size = min(max(top_k * 4, 20), self.faiss_index.ntotal)
+        distances, indices = self.faiss_index.search(query_vec, pool_size)
+        vector_hits = {int(idx): float(dist) for idx, dist in zip(indices[0], distances[0]) if idx >= 0}
+        lexical_hits = self.lexical_index.search(query, pool_size)
+
+        fused = rrf_fuse([list(vector_hits.keys()), [idx for idx, _ in lexical_hits]])
+        ranked = sorted(fused.items(), key=lambda x: x[1], reverse=True)[:top_k]
 
         results = []
-        for i in range(top_k):
-            if i < len(indices[0]):
-                idx = indices[0][i]
-                distance = distances[0][i]
-                similarity = 1 / (1 + distance)  # 转换为相似度
-                results.append({
-                    "text": self.chunks[idx],
-                    "index": int(idx),
-                    "similarity": float(similarity),
-                    "distance": float(distance)
-                })
+        for idx, score in ranked:
+            distance = vector_hits.get(idx)
+            if distance is None:
+                # 仅词法命中的文本块，补算向量距离以保持 similarity 含义一致
+                vec = self.faiss_index.reconstruct(idx)
+                distance = float(np.sum((vec - query_vec[0]) ** 2))
+            hit = self._format_hit(idx, distance)
+            hit["rrf_score"] = float(score)
+            results.append(hit)
         return results
 
+    async def asearch_similar_chunks(self, query: str, top_k: int = 5, hybrid: bool = True):
+        """协程版 search_similar_chunks：异步获取查询向量，FAISS/BM25 检索在线程池中执行"""
+        if self.faiss_index is None:
+            raise ValueError("请先调用 build_or_load_embeddings() 初始化嵌入")
+        query_vec = await self.embedder.aencode([query])
+        return await asyncio.to_thread(self.search_similar_chunks, query, top_k, hybrid, query_vec)
+
+    def _format_hit(self, idx: int, distance: float):
+        """组装检索结果，有分块元数据时附带原文区间和章节路径"""
+        hit = {
+            "text": self.chunks[idx],
+            "index": idx,
+            "similarity": float(1 / (1 + distance)),  # 转换为相似度
+            "distance": distance
+        }
+        if idx < len(self.chunk_meta):
+            hit.update(self.chunk_meta[idx])
+        return hit
+
     def response_user_query(self, query: str, top_k: int = 5):
         """
         根据查询条件，从方案文本中检索出相关的内容
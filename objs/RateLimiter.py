@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型服务限流
+每个 (服务地址, 模型) 一个限流器：并发上限 + 令牌桶速率，并按观测到的延迟和 429/5xx 响应
+做 AIMD 调整（正常时并发上限缓慢加一，过载时减半），避免并行任务压垮 Ollama 等后端。
+并发上限默认不启用（LLM_MAX_CONCURRENCY=0），此时只统计调用数，不排队也不做 AIMD 调整。
+同步调用（线程）和 ASGI 模式下的协程共享同一组名额
+"""
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+from config.settings import RATE_LIMIT_CONFIG, ASYNC_SERVER_CONFIG
+
+# 视为后端过载的 HTTP 状态码
+OVERLOAD_STATUS = (429, 500, 502, 503, 504)
+
+
+def is_overload_error(error: Exception) -> bool:
+    """判断异常是否表示后端过载（429/5xx、超时、连接失败）"""
+    cause = getattr(error, "cause", None)
+    if isinstance(cause, Exception):
+        return is_overload_error(cause)
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    if status is not None:
+        return status in OVERLOAD_STATUS
+    name = type(error).__name__
+    return isinstance(error, TimeoutError) or "Timeout" in name or "Connection" in name
+
+
+class RateLimiter:
+    """单个后端模型的并发与速率控制"""
+
+    def __init__(self, name: str, max_concurrency: int = None, min_concurrency: int = None,
+                 rate: float = None, burst: int = None, latency_target: float = None,
+                 acquire_timeout: float = None):
+        config = RATE_LIMIT_CONFIG
+        self.name = name
+        max_concurrency = config.max_concurrency if max_concurrency is None else max_concurrency
+        # 0 表示不限制并发
+        self.max_concurrency = max(0, max_concurrency)
+        self.min_concurrency = max(1, min_concurrency or config.min_concurrency)
+        if self.max_concurrency:
+            self.min_concurrency = min(self.min_concurrency, self.max_concurrency)
+        self.rate = config.rate if rate is None else rate
+        self.burst = max(1, burst or config.burst)
+        self.latency_target = config.latency_target if latency_target is None else latency_target
+        self.acquire_timeout = config.acquire_timeout if acquire_timeout is None else acquire_timeout
+
+        # 当前并发上限（AIMD 调整），从最大值开始
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        # 令牌桶
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        # 上次减半时间，同一波过载只减半一次（monotonic 从系统启动计时，初值不能用 0）
+        self._decreased_at = float("-inf")
+
+        self.completed = 0
+        self.overloaded = 0
+        self.waited_seconds = 0.0
+
+    def _take_token(self) -> float:
+        """取一个令牌，返回还需等待的秒数（0 表示已取到）"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def _try_acquire(self, start: float) -> Optional[float]:
+        """持有锁时尝试占用名额：成功返回 0，等待令牌时返回需等待的秒数，等待名额释放时返回 None"""
+        if self.max_concurrency and self.in_flight >= int(self.limit):
+            return None
+        wait = self._take_token()
+        if wait == 0:
+            self.in_flight += 1
+            self.waited_seconds += time.monotonic() - start
+        return wait
+
+    def _bounded_wait(self, wait: Optional[float], deadline: Optional[float]) -> Optional[float]:
+        """按 acquire_timeout 截断等待时间，已超时抛出 TimeoutError"""
+        if deadline is None:
+            return wait
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"等待模型服务 {self.name} 的调用名额超时")
+        return min(wait, remaining) if wait is not None else remaining
+
+    def _deadline(self, start: float) -> Optional[float]:
+        return start + self.acquire_timeout if self.acquire_timeout > 0 else None
+
+    def acquire(self):
+        """等待并发名额和令牌，超过 acquire_timeout 抛出 TimeoutError"""
+        start = time.monotonic()
+        deadline = self._deadline(start)
+        with self._cond:
+            while True:
+                wait = self._try_acquire(start)
+                if wait == 0:
+                    return
+                self._cond.wait(self._bounded_wait(wait, deadline))
+
+    async def acquire_async(self):
+        """协程版 acquire：等待期间不占用线程，按 ASGI_POLL_INTERVAL 轮询名额"""
+        start = time.monotonic()
+        deadline = self._deadline(start)
+        poll = ASYNC_SERVER_CONFIG.poll_interval
+        while True:
+            with self._cond:
+                wait = self._try_acquire(start)
+                if wait == 0:
+                    return
+                wait = self._bounded_wait(wait, deadline)
+            await asyncio.sleep(min(wait, poll) if wait is not None else poll)
+
+    def release(self, latency: float = None, overloaded: bool = False):
+        """释放名额并根据本次调用结果调整并发上限（latency 为 None 时只按是否过载调整）"""
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            slow = latency is not None and self.latency_target > 0 and latency > self.latency_target
+            if overloaded or slow:
+                self.overloaded += overloaded
+                # 一个延迟目标周期内只减半一次，避免同一批失败把上限压到最低
+                if self.max_concurrency and now - self._decreased_at >= max(self.latency_target, 1.0):
+                    self.limit = max(float(self.min_concurrency), self.limit / 2)
+                    self._decreased_at = now
+            else:
+                self.completed += 1
+                if self.max_concurrency:
+                    self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, stream: bool = False):
+        """
+        占用一个调用名额，代码块抛出过载类异常时按过载处理。
+        stream=True 时名额占用到流式输出结束，但输出时长取决于生成长度而非后端负载，不计入延迟
+        """
+        self.acquire()
+        start = time.monotonic()
+        latency, overloaded = None, False
+        try:
+            yield
+            if not stream:
+                latency = time.monotonic() - start
+        except Exception as e:
+            overloaded = is_overload_error(e)
+            raise
+        finally:
+            # 流式输出被提前关闭（GeneratorExit）时也要释放名额
+            self.release(latency=latency, overloaded=overloaded)
+
+    @asynccontextmanager
+    async def async_slot(self, stream: bool = False):
+        """协程版 slot；请求被取消（CancelledError）时同样释放名额"""
+        await self.acquire_async()
+        start = time.monotonic()
+        latency, overloaded = None, False
+        try:
+            yield
+            if not stream:
+                latency = time.monotonic() - start
+        except Exception as e:
+            overloaded = is_overload_error(e)
+            raise
+        finally:
+            self.release(latency=latency, overloaded=overloaded)
+
+    def status(self) -> dict:
+        with self._cond:
+            return {
+                "name": self.name,
+                "limit": round(self.limit, 2) if self.max_concurrency else None,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "rate": self.rate,
+                "completed": self.completed,
+                "overloaded": self.overloaded,
+                "waited_seconds": round(self.waited_seconds, 3)
+            }
+
+
+# (服务地址, 模型) -> 限流器（同一进程内共享）
+_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_base: str = None, model: str = None) -> RateLimiter:
+    """获取指定后端和模型共享的限流器"""
+    key = (api_base or "", model or "")
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(f"{key[0] or 'default'}/{key[1] or '*'}")
+        return _limiters[key]
+
+
+def rate_limiter_stats() -> list:
+    """所有限流器的当前状态"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.status() for limiter in limiters]
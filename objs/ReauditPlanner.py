@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+差异复审规划器
+方案修订后复查时，检索证据与基准任务完全一致的检查项直接复用基准任务结果，不再调用大模型
+"""
+import os
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from .PlanAuditor import PlanAuditor
+
+# 基准结果中不随复用复制的字段
+_SKIP_FIELDS = ("id", "task_id", "created_time")
+
+
+class ReauditPlanner:
+    """
+    差异复审规划器
+
+    对同一检索查询，只嵌入一次，分别在当前方案和基准方案的索引中检索；
+    两边 top-k 证据文本（含顺序）完全相同，说明送入大模型的上下文与基准任务一致，可直接复用其结果
+    """
+
+    def __init__(self, auditor: PlanAuditor, base_auditor: PlanAuditor,
+                 base_items: Dict[str, Dict], base_task_id: str, status_field: str):
+        self.auditor = auditor
+        self.base_auditor = base_auditor
+        self.base_items = base_items
+        self.base_task_id = base_task_id
+        self.status_field = status_field
+        self.reused_count = 0
+
+    @classmethod
+    def create(cls, auditor: PlanAuditor, base_task_id: str, base_result: Optional[Dict],
+               results_field: str, key_field: str, status_field: str) -> Optional['ReauditPlanner']:
+        """
+        根据基准任务结果创建规划器
+        base_result 为 DAO.get_check_result() 的返回值；基准方案缓存不可用时返回 None（全部重新检查）
+        """
+        if not base_task_id or not base_result:
+            return None
+
+        base_items = {}
+        for item in base_result.get(results_field, []):
+            key = item.get(key_field)
+            if key is not None and key != "":
+                base_items[str(key)] = item
+        if not base_items:
+            return None
+
+        base_plan_id = base_result.get("plan_id")
+        if base_plan_id == auditor.get_hash():
+            # 方案未修改，证据必然一致
+            return cls(auditor, auditor, base_items, base_task_id, status_field)
+
+        base_auditor = cls._load_base_auditor(auditor, base_plan_id)
+        if base_auditor is None:
+            return None
+        return cls(auditor, base_auditor, base_items, base_task_id, status_field)
+
+    @staticmethod
+    def _load_base_auditor(auditor: PlanAuditor, base_plan_id: str) -> Optional[PlanAuditor]:
+        """从缓存加载基准方案的索引，共用当前审查器的嵌入客户端"""
+        file_info = auditor.file_manager.get_file_info(base_plan_id) if base_plan_id else None
+        if not file_info or file_info.get("embedding_model") != auditor.embedding_model:
+            return None
+
+        cache_files = file_info.get("cache_files", {})
+        chunk_file = cache_files.get("chunks")
+        faiss_file = cache_files.get("faiss_index")
+        if not PlanAuditor.chunks_exist(chunk_file) or not faiss_file or not os.path.exists(faiss_file):
+            return None
+
+        base_auditor = PlanAuditor(
+            plan_content="",
+            check_list_file=auditor.check_list_file,
+            embedding_model=auditor.embedding_model,
+            openai_api_key=auditor.embedder.openai_api_key,
+            openai_api_base=auditor.embedder.openai_api_base,
+            cache_dir=auditor.cache_dir,
+            original_filename=file_info.get("original_filename")
+        )
+        base_auditor.embedder = auditor.embedder
+        base_auditor.file_hash = base_plan_id
+        base_auditor.load_embeddings(chunk_file, faiss_file)
+        return base_auditor
+
+    def search(self, query: str, top_k: int) -> Tuple[List[Dict], bool]:
+        """检索当前方案，返回 (检索结果, 证据是否与基准方案一致)"""
+        if self.base_auditor is self.auditor:
+            return self.auditor.search_similar_chunks(query, top_k=top_k), True
+
+        query_vec = self.auditor.embedder.encode([query])
+        results = self.auditor.search_similar_chunks(query, top_k=top_k, query_vec=query_vec)
+        base_results = self.base_auditor.search_similar_chunks(query, top_k=top_k, query_vec=query_vec)
+        unchanged = [r["text"] for r in results] == [r["text"] for r in base_results]
+        return results, unchanged
+
+    def _copy_base_item(self, key, match: Dict = None) -> Optional[Dict]:
+        """复制基准结果；基准中没有该项、该项检查失败或与 match 中的字段不一致时返回 None"""
+        base_item = self.base_items.get(str(key))
+        if not base_item or base_item.get(self.status_field) == "检查失败":
+            return None
+        if match and any(str(base_item.get(field, "")) != str(value) for field, value in match.items()):
+            return None
+
+        item = {}
+        for field, value in base_item.items():
+            if field in _SKIP_FIELDS:
+                continue
+            # 数据库 DECIMAL 字段读出为 Decimal，回调序列化前转换
+            item[field] = float(value) if isinstance(value, Decimal) else value
+        item["reused_from_task"] = self.base_task_id
+        return item
+
+    def reuse(self, key, match: Dict = None) -> Optional[Dict]:
+        """返回可复用的基准结果副本，不可复用时返回 None"""
+        item = self._copy_base_item(key, match)
+        if item is not None:
+            self.reused_count += 1
+        return item
+
+    def reuse_group(self, entries: List[Tuple[str, Dict]]) -> Optional[List[Dict]]:
+        """整组复用（如逐章节检查的一整章），任一项不可复用则整组返回 None"""
+        items = [self._copy_base_item(key, match) for key, match in entries]
+        if not items or any(item is None for item in items):
+            return None
+        self.reused_count += len(items)
+        return items
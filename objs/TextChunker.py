@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结构感知的文本分块器
+按章节标题和表格切分施工方案文本，按 token 数控制块大小，同一章节内相邻块可重叠，
+并记录每个文本块在原文中的字符区间和所属章节路径
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from utils.token_counter import estimate_tokens
+
+_CN_NUM = "一二三四五六七八九十百零〇"
+
+# 标题规则：(正则, 层级)，层级越小越靠上；数字编号标题的层级由点号个数决定
+_HEADING_RULES = [
+    (re.compile(rf'^第[{_CN_NUM}\d]+[章篇部]'), 1),
+    (re.compile(rf'^第[{_CN_NUM}\d]+节'), 2),
+    (re.compile(rf'^[{_CN_NUM}]+[、．.]'), 3),
+    (re.compile(r'^(\d{1,2}(?:\.\d{1,2})*)(?:[、．.\s]|(?=[^\d.]))'), None),
+    (re.compile(rf'^[（(][{_CN_NUM}]+[）)]'), 8),
+    (re.compile(r'^[（(]\d{1,2}[）)]'), 9),
+]
+_HEADING_MAX_CHARS = 40
+_HEADING_BAD_ENDINGS = "。；;，,"
+
+# 一行内的句子：以中英文句末标点结尾，或到行尾
+_SENTENCE_RE = re.compile(r'[^。！？!?；;]+[。！？!?；;]*|[。！？!?；;]+')
+# 非空行
+_LINE_RE = re.compile(r'[^\n]+')
+
+
+@dataclass
+class Chunk:
+    """文本块：text 为原文 [start, end) 区间的内容"""
+    text: str
+    start: int
+    end: int
+    section_path: List[str] = field(default_factory=list)
+    tokens: int = 0
+
+    def to_meta(self) -> Dict:
+        """文本块元数据（不含正文）"""
+        return {"start": self.start, "end": self.end, "section_path": self.section_path}
+
+
+@dataclass
+class _Unit:
+    """分块的最小单位：句子、标题行或表格"""
+    start: int
+    end: int
+    tokens: int
+    heading_rank: int = None
+    title: str = ""
+    rows: List[Tuple[int, int]] = None
+
+
+def heading_rank(line: str):
+    """判断一行是否为章节标题，是则返回层级，否则返回 None"""
+    line = line.strip()
+    if not line or len(line) > _HEADING_MAX_CHARS or line[-1] in _HEADING_BAD_ENDINGS:
+        return None
+    for pattern, rank in _HEADING_RULES:
+        match = pattern.match(line)
+        if not match:
+            continue
+        if rank is None:
+            # 纯数字行（页码、数值）不是标题
+            if not line[match.end():].strip():
+                return None
+            rank = 4 + match.group(1).count(".")
+        return rank
+    return None
+
+
+def _is_table_line(line: str) -> bool:
+    """制表符分隔或竖线分隔的表格行"""
+    return "\t" in line.strip() or line.count("|") >= 2
+
+
+class TextChunker:
+    """结构感知的文本分块器"""
+
+    def __init__(self, max_tokens: int = 300, overlap_tokens: int = 50, min_tokens: int = 60):
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self.min_tokens = max(0, min(min_tokens, self.max_tokens))
+
+    def split(self, text: str) -> List[Chunk]:
+        """将文本切分为文本块列表"""
+        if not text or not text.strip():
+            return []
+        return self._pack(text, self._units(text))
+
+    # ---------- 切分为最小单位 ----------
+
+    def _units(self, text: str) -> List[_Unit]:
+        units = []
+        for line_match in _LINE_RE.finditer(text):
+            line = line_match.group()
+            if not line.strip():
+                continue
+            start = line_match.start() + len(line) - len(line.lstrip())
+            end = line_match.start() + len(line.rstrip())
+
+            if _is_table_line(line):
+                tokens = estimate_tokens(text[start:end])
+                prev = units[-1] if units else None
+                # 连续的表格行合并为一个表格单位
+                if prev is not None and prev.rows is not None and not text[prev.end:start].strip():
+                    prev.end = end
+                    prev.tokens += tokens
+                    prev.rows.append((start, end))
+                else:
+                    units.append(_Unit(start, end, tokens, rows=[(start, end)]))
+                continue
+
+            rank = heading_rank(line)
+            if rank is not None:
+                units.append(_Unit(start, end, estimate_tokens(text[start:end]),
+                                   heading_rank=rank, title=text[start:end]))
+                continue
+
+            for sent_match in _SENTENCE_RE.finditer(line):
+                sent = sent_match.group()
+                if not sent.strip():
+                    continue
+                s = line_match.start() + sent_match.start() + len(sent) - len(sent.lstrip())
+                e = line_match.start() + sent_match.start() + len(sent.rstrip())
+                units.extend(self._split_long(text, s, e))
+
+        # 超长表格按行拆开
+        result = []
+        for unit in units:
+            if unit.rows is not None and unit.tokens > self.max_tokens:
+                for s, e in unit.rows:
+                    result.extend(self._split_long(text, s, e))
+            else:
+                result.append(unit)
+        return result
+
+    def _split_long(self, text: str, start: int, end: int) -> List[_Unit]:
+        """超过最大 token 数的句子按字符强制切分"""
+        tokens = estimate_tokens(text[start:end])
+        if tokens <= self.max_tokens:
+            return [_Unit(start, end, tokens)]
+        step = max(1, int((end - start) * self.max_tokens / tokens * 0.9))
+        pieces = []
+        for s in range(start, end, step):
+            e = min(s + step, end)
+            pieces.append(_Unit(s, e, estimate_tokens(text[s:e])))
+        return pieces
+
+    # ---------- 组装文本块 ----------
+
+    def _pack(self, text: str, units: List[_Unit]) -> List[Chunk]:
+        chunks = []
+        stack = []          # [(层级, 标题)]
+        current = []        # 当前文本块包含的单位
+        current_tokens = 0
+        current_path = []
+
+        def flush(keep_overlap: bool):
+            nonlocal current, current_tokens
+            if not current:
+                return
+            start, end = current[0].start, current[-1].end
+            chunks.append(Chunk(text[start:end], start, end, list(current_path), current_tokens))
+
+            carry, carry_tokens = [], 0
+            if keep_overlap and self.overlap_tokens:
+                for unit in reversed(current[1:]):
+                    if carry_tokens + unit.tokens > self.overlap_tokens:
+                        break
+                    carry.insert(0, unit)
+                    carry_tokens += unit.tokens
+            current, current_tokens = carry, carry_tokens
+
+        for unit in units:
+            if unit.heading_rank is not None:
+                # 新章节开始：当前块足够大时结束，章节之间不重叠
+                if current and current_tokens >= self.min_tokens:
+                    flush(keep_overlap=False)
+                while stack and stack[-1][0] >= unit.heading_rank:
+                    stack.pop()
+                stack.append((unit.heading_rank, unit.title))
+
+            if current and current_tokens + unit.tokens > self.max_tokens:
+                flush(keep_overlap=True)
+                # 重叠部分加上当前单位仍超限时放弃重叠
+                if current and current_tokens + unit.tokens > self.max_tokens:
+                    current, current_tokens = [], 0
+
+            if not current:
+                current_path = [title for _, title in stack]
+            current.append(unit)
+            current_tokens += unit.tokens
+
+        flush(keep_overlap=False)
+        return chunks
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量索引构建
+按存储模式创建 FAISS 索引：float32 为精确的 IndexFlatL2，float16 / int8 为 IndexScalarQuantizer，
+向量只保存在索引中，需要原始向量时通过 reconstruct 解码
+"""
+import numpy as np
+
+from utils.lazy_import import lazy_import
+
+faiss = lazy_import("faiss")
+
+STORAGE_MODES = ("float32", "float16", "int8")
+
+# 各模式每个维度占用的字节数
+BYTES_PER_DIM = {"float32": 4, "float16": 2, "int8": 1}
+
+
+def normalize_storage(storage: str) -> str:
+    """规范化存储模式名称，无法识别时回退为 float32"""
+    storage = (storage or "").strip().lower()
+    aliases = {"fp32": "float32", "fp16": "float16", "half": "float16", "sq8": "int8", "uint8": "int8"}
+    storage = aliases.get(storage, storage)
+    return storage if storage in STORAGE_MODES else "float32"
+
+
+def create_index(dim: int, storage: str = "float32"):
+    """创建空索引（int8 模式需要先 train）"""
+    storage = normalize_storage(storage)
+    if storage == "float16":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+    if storage == "int8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    return faiss.IndexFlatL2(dim)
+
+
+def build_index(vectors: np.ndarray, storage: str = "float32"):
+    """由向量构建索引；int8 模式按这批向量训练各维度的取值范围"""
+    vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    index = create_index(vectors.shape[1], storage)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def index_storage(index) -> str:
+    """判断已有索引的存储模式"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16:
+            return "float16"
+        if index.sq.qtype == faiss.ScalarQuantizer.QT_8bit:
+            return "int8"
+    return "float32"
+
+
+def index_vectors(index) -> np.ndarray:
+    """取出索引中的全部向量（量化索引返回解码后的近似值）"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
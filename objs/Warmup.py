@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动预热
+在后台线程中依次执行预热步骤（数据库连接池、检查项文件、最近使用的方案等），
+全部必需步骤成功后才报告就绪，供 /readyz 使用
+"""
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Dict
+
+
+class Warmup:
+    """启动预热任务"""
+
+    def __init__(self):
+        self._steps = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = "pending"        # pending / running / done
+        self.results = {}
+        self.started_at = None
+        self.finished_at = None
+
+    def add_step(self, name: str, func: Callable, required: bool = False):
+        """
+        添加预热步骤，func 无参数，返回值记入状态详情
+        required=True 的步骤失败时不报告就绪
+        """
+        self._steps.append((name, func, required))
+        return self
+
+    def start(self):
+        """在后台线程中执行全部步骤"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = "running"
+            self.started_at = datetime.now().isoformat()
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        """依次执行预热步骤，单个步骤失败不影响后续步骤"""
+        self.state = "running"
+        for name, func, required in self._steps:
+            started = time.perf_counter()
+            result = {"required": required}
+            try:
+                result["detail"] = func()
+                result["status"] = "ok"
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = str(e)
+                print(f"预热步骤失败: {name}, {e}")
+            result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            with self._lock:
+                self.results[name] = result
+        with self._lock:
+            self.state = "done"
+            self.finished_at = datetime.now().isoformat()
+
+    @property
+    def ready(self) -> bool:
+        """预热已完成且必需步骤全部成功"""
+        with self._lock:
+            return self.state == "done" and all(
+                r["status"] == "ok" for r in self.results.values() if r["required"])
+
+    def status(self) -> Dict:
+        """预热状态"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "ready": self.state == "done" and all(
+                    r["status"] == "ok" for r in self.results.values() if r["required"]),
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "steps": dict(self.results)
+            }
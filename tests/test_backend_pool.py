@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+模型服务节点池的单元测试：最少未完成请求选择、连续失败摘除与恢复、配置解析（不连接模型服务）
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from objs import BackendPool as backend_pool
+from objs import ModelCall
+from objs.BackendPool import BackendPool, backend_lease, load_pools
+from objs.ModelCall import call_with_retry
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(backend_pool, "time", SimpleNamespace(monotonic=fake.monotonic))
+    return fake
+
+
+def pool(**kwargs):
+    options = dict(eject_after=2, eject_seconds=10, eject_max_seconds=25)
+    options.update(kwargs)
+    return BackendPool("http://llm:11434/v1/", ["http://a", "http://b"], **options)
+
+
+def fail(p, error):
+    with pytest.raises(type(error)):
+        with p.lease() as url:
+            raise error
+    return url
+
+
+def test_least_outstanding_endpoint_is_chosen():
+    p = pool()
+    with p.lease() as first:
+        with p.lease() as second:
+            assert {first, second} == {"http://a", "http://b"}
+    assert all(e.outstanding == 0 for e in p.endpoints)
+    assert sum(e.requests for e in p.endpoints) == 2
+
+
+def test_consecutive_overload_failures_eject_endpoint(clock):
+    p = pool()
+    a = p.endpoints[0]
+    p.endpoints[1].outstanding = 5  # 让选择固定落在 a
+    fail(p, StatusError(503))
+    assert a.available(clock.now)
+    fail(p, StatusError(503))
+    assert not a.available(clock.now)
+    assert a.errors == 2
+
+    p.endpoints[1].outstanding = 0
+    with p.lease() as url:
+        assert url == "http://b"
+
+    clock.now += 10
+    assert a.available(clock.now)
+
+
+def test_ejection_time_doubles_up_to_max(clock):
+    p = pool(eject_after=1)
+    a = p.endpoints[0]
+    p.endpoints[1].outstanding = 5
+    for expected in (10, 20, 25):
+        clock.now = max(clock.now, a.ejected_until)
+        fail(p, StatusError(429))
+        assert a.ejected_until - clock.now == expected
+
+    # 成功一次后摘除时长重新计算
+    clock.now = a.ejected_until
+    with p.lease():
+        pass
+    fail(p, StatusError(429))
+    assert a.ejected_until - clock.now == 10
+
+
+def test_non_overload_errors_do_not_count(clock):
+    p = pool(eject_after=1)
+    p.endpoints[1].outstanding = 5
+    fail(p, ValueError("参数错误"))
+    fail(p, StatusError(400))
+    a = p.endpoints[0]
+    assert a.available(clock.now)
+    assert a.errors == 0 and a.consecutive_failures == 0
+
+
+def test_all_ejected_uses_earliest_recovering(clock):
+    p = pool()
+    p.endpoints[0].ejected_until = clock.now + 30
+    p.endpoints[1].ejected_until = clock.now + 5
+    with p.lease() as url:
+        assert url == "http://b"
+    assert p.status()["endpoints"][0]["ejected"] is True
+
+
+def test_retry_leases_another_endpoint(clock, monkeypatch):
+    monkeypatch.setattr(ModelCall, "backoff_delay", lambda attempt: 0.0)
+    p = pool(eject_after=1)
+    used = []
+
+    def call():
+        with p.lease() as url:
+            used.append(url)
+            if len(used) == 1:
+                raise StatusError(503)
+            return url
+
+    # 第一个节点失败后被摘除，重试时在可调用对象内重新选择节点
+    result = call_with_retry(call, max_retries=2)
+    assert len(used) == 2 and used[0] != used[1]
+    assert result == used[1]
+
+
+def test_load_pools_parses_and_skips_invalid():
+    pools = load_pools('[{"api_base": "http://llm:11434/v1/", "endpoints": ["http://a", ""], '
+                       '"models": ["qwen2.5:7b"]}, {"api_base": "http://x"}]')
+    assert len(pools) == 1
+    assert pools[0].api_base == "http://llm:11434/v1"
+    assert [e.url for e in pools[0].endpoints] == ["http://a"]
+    assert pools[0].serves("qwen2.5:7b") and not pools[0].serves("bge-m3")
+    assert load_pools("not json") == []
+    assert load_pools("") == []
+
+
+def test_backend_lease_without_pool_returns_api_base(monkeypatch):
+    monkeypatch.setattr(backend_pool, "_pools", [pool(models=["qwen2.5:7b"])])
+    with backend_lease("http://other/v1/") as url:
+        assert url == "http://other/v1/"
+    with backend_lease("http://llm:11434/v1", "bge-m3") as url:
+        assert url == "http://llm:11434/v1"
+    with backend_lease("http://llm:11434/v1/", "qwen2.5:7b") as url:
+        assert url in ("http://a", "http://b")
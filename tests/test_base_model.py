@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+BaseModel 批量插入的单元测试（使用记录语句的假游标和连接，不连接 MySQL）
+"""
+import re
+
+import pytest
+
+from db import connection as db_connection
+from db.base_model import DB_CONFIG
+from db.models import AsyncTask, StructureCheckItem
+
+
+class FakeCursor:
+    def __init__(self, log, fail_on=None):
+        self.log = log
+        self.fail_on = fail_on
+        self.lastrowid = 0
+
+    def execute(self, sql, params=None):
+        if self.fail_on and self.fail_on in (params or []):
+            raise RuntimeError("插入失败")
+        self.log.append((sql, list(params or [])))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, fail_on=None):
+        self.log = []
+        self.fail_on = fail_on
+
+    def cursor(self):
+        return FakeCursor(self.log, self.fail_on)
+
+    def begin(self):
+        self.log.append("BEGIN")
+
+    def commit(self):
+        self.log.append("COMMIT")
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+def make_items(count, text="x"):
+    return [StructureCheckItem(task_id="t1", item_id=str(i), name=f"{text}{i}") for i in range(count)]
+
+
+def inserts(log):
+    return [entry for entry in log if isinstance(entry, tuple)]
+
+
+def rows_per_insert(log):
+    columns = len(StructureCheckItem.get_fields()) - 1
+    return [len(params) // columns for _, params in inserts(log)]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """让 get_db_connection 返回假连接"""
+    holder = {}
+
+    def get_connection():
+        return holder["connection"]
+
+    monkeypatch.setattr(db_connection, "get_connection", get_connection)
+    monkeypatch.setattr(db_connection, "return_connection", lambda conn: None)
+    return holder
+
+
+def test_insert_rows_splits_by_row_count(monkeypatch):
+    monkeypatch.setattr(DB_CONFIG, "bulk_insert_bytes", 1024 * 1024)
+    log = []
+    assert StructureCheckItem.insert_rows(FakeCursor(log), make_items(25), batch_size=10) == 25
+    assert rows_per_insert(log) == [10, 10, 5]
+    sql = inserts(log)[0][0]
+    assert sql.startswith("INSERT INTO structure_check_items (")
+    assert " id," not in sql and "(id," not in sql
+    assert sql.count("), (") == 9
+
+
+def test_insert_rows_splits_by_bytes(monkeypatch):
+    monkeypatch.setattr(DB_CONFIG, "bulk_insert_bytes", 2000)
+    log = []
+    StructureCheckItem.insert_rows(FakeCursor(log), make_items(10, text="长" * 100), batch_size=500)
+    counts = rows_per_insert(log)
+    assert sum(counts) == 10
+    assert len(counts) > 1
+    assert all(count >= 1 for count in counts)
+
+
+def test_insert_rows_keeps_order_and_values(monkeypatch):
+    monkeypatch.setattr(DB_CONFIG, "bulk_insert_bytes", 1024 * 1024)
+    log = []
+    StructureCheckItem.insert_rows(FakeCursor(log), make_items(3), batch_size=2)
+    names = [value for _, params in inserts(log) for value in params if str(value).startswith("x")]
+    assert names == ["x0", "x1", "x2"]
+
+
+def test_insert_rows_empty():
+    log = []
+    assert StructureCheckItem.insert_rows(FakeCursor(log), []) == 0
+    assert log == []
+
+
+def test_batch_insert_commits_in_one_transaction(fake_db, monkeypatch):
+    monkeypatch.setattr(DB_CONFIG, "bulk_insert_bytes", 1024 * 1024)
+    fake_db["connection"] = conn = FakeConnection()
+    assert StructureCheckItem.batch_insert(make_items(7), batch_size=3) is True
+    assert conn.log[0] == "BEGIN" and conn.log[-1] == "COMMIT"
+    assert rows_per_insert(conn.log) == [3, 3, 1]
+
+
+def test_batch_insert_rolls_back_on_failure(fake_db, monkeypatch):
+    monkeypatch.setattr(DB_CONFIG, "bulk_insert_bytes", 1024 * 1024)
+    fake_db["connection"] = conn = FakeConnection(fail_on="x4")
+    assert StructureCheckItem.batch_insert(make_items(7), batch_size=3) is False
+    assert "COMMIT" not in conn.log
+    assert "ROLLBACK" in conn.log
+
+
+def test_upsert_without_primary_key_is_plain_insert():
+    log = []
+    assert AsyncTask(task_id="t1")._upsert(FakeCursor(log), AsyncTask(task_id="t1").to_dict()) is True
+    sql, _ = log[0]
+    assert "ON DUPLICATE KEY" not in sql
+
+
+def test_upsert_updates_only_the_row_with_same_primary_key():
+    log = []
+    task = AsyncTask(id=5, task_id="t1", status="success")
+    assert task._upsert(FakeCursor(log), task.to_dict()) is True
+    sql, params = log[0]
+    assert "status = IF(id = VALUES(id), VALUES(status), status)" in sql
+    assert "task_id = IF(id = VALUES(id), VALUES(task_id), task_id)" in sql
+    assert not re.search(r"(UPDATE|,) id = ", sql)
+    assert 5 in params
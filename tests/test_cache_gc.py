@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+缓存回收的单元测试：按容量上限 LRU 淘汰、固定（本进程与固定文件）不被回收、孤立目录清理
+（使用只保存映射字典的假文件管理器）
+"""
+import os
+import time
+
+import pytest
+
+from objs import CacheGC as cache_gc
+from objs.CacheGC import CacheGC, pin, unpin, pinning, mark_access, is_pinned
+
+
+class FakeStore:
+    def file_names(self):
+        return ["file_index.db"]
+
+
+class FakeFileManager:
+    def __init__(self, mappings):
+        self._mappings = mappings
+        self.store = FakeStore()
+        self.deleted = []
+
+    @property
+    def mappings(self):
+        return dict(self._mappings)
+
+    def delete_file_mapping(self, file_hash, remove_files=True):
+        self.deleted.append(file_hash)
+        return self._mappings.pop(file_hash, None) is not None
+
+
+def make_plan(cache_dir, file_hash, size, age):
+    """创建大小为 size 字节、最近访问时间为 age 秒前的方案文件夹"""
+    folder = os.path.join(str(cache_dir), file_hash)
+    os.makedirs(folder)
+    with open(os.path.join(folder, "chunks.bin"), "wb") as f:
+        f.write(b"x" * size)
+    stamp = time.time() - age
+    os.utime(os.path.join(folder, "chunks.bin"), (stamp, stamp))
+    os.utime(folder, (stamp, stamp))
+    return {"file_hash": file_hash, "doc_folder": folder, "original_filename": f"{file_hash}.docx"}
+
+
+@pytest.fixture(autouse=True)
+def clean_pins():
+    yield
+    cache_gc._pins.clear()
+    cache_gc._pin_files.clear()
+
+
+def make_gc(tmp_path, plans, max_bytes):
+    mappings = {info["file_hash"]: info for info in plans}
+    manager = FakeFileManager(mappings)
+    return CacheGC(str(tmp_path), file_manager=manager, max_bytes=max_bytes,
+                   grace_seconds=0, delete_rate_mb=0), manager
+
+
+def test_evicts_least_recently_used_until_below_cap(tmp_path):
+    plans = [make_plan(tmp_path, "old", 1000, 300), make_plan(tmp_path, "mid", 1000, 200),
+             make_plan(tmp_path, "new", 1000, 100)]
+    gc, manager = make_gc(tmp_path, plans, max_bytes=2500)
+
+    report = gc.run_once()
+    assert [e["plan_id"] for e in report["evicted"]] == ["old"]
+    assert manager.deleted == ["old"]
+    assert not os.path.exists(plans[0]["doc_folder"])
+    assert os.path.isdir(plans[1]["doc_folder"]) and os.path.isdir(plans[2]["doc_folder"])
+    assert report["total_bytes"] <= 2500 * 0.9
+
+
+def test_dry_run_reports_without_deleting(tmp_path):
+    plans = [make_plan(tmp_path, "old", 1000, 300), make_plan(tmp_path, "new", 1000, 100)]
+    gc, manager = make_gc(tmp_path, plans, max_bytes=1500)
+
+    report = gc.run_once(dry_run=True)
+    assert [e["plan_id"] for e in report["evicted"]] == ["old"]
+    assert manager.deleted == []
+    assert os.path.isdir(plans[0]["doc_folder"])
+
+
+def test_pinned_plan_is_not_evicted(tmp_path):
+    plans = [make_plan(tmp_path, "old", 1000, 300), make_plan(tmp_path, "new", 1000, 100)]
+    gc, _ = make_gc(tmp_path, plans, max_bytes=1500)
+
+    pin("old")
+    report = gc.run_once()
+    assert [e["plan_id"] for e in report["evicted"]] == ["new"]
+    assert os.path.isdir(plans[0]["doc_folder"])
+    unpin("old")
+    assert not is_pinned("old")
+
+
+def test_pin_file_protects_plan_from_other_processes(tmp_path):
+    plans = [make_plan(tmp_path, "old", 1000, 300)]
+    gc, _ = make_gc(tmp_path, plans, max_bytes=500)
+    folder = plans[0]["doc_folder"]
+
+    pin("old", folder)
+    pin_files = [name for name in os.listdir(folder) if name.startswith(cache_gc.PIN_PREFIX)]
+    assert len(pin_files) == 1
+    # 模拟另一个进程：本进程的引用计数不可见，只剩固定文件
+    cache_gc._pins.clear()
+    assert is_pinned("old", folder)
+    assert gc.run_once()["evicted"] == []
+
+    cache_gc._pins["old"] = 1
+    unpin("old")
+    assert not any(name.startswith(cache_gc.PIN_PREFIX) for name in os.listdir(folder))
+    assert [e["plan_id"] for e in gc.run_once()["evicted"]] == ["old"]
+
+
+def test_stale_pin_file_of_dead_process_is_removed(tmp_path):
+    folder = make_plan(tmp_path, "old", 10, 300)["doc_folder"]
+    dead = os.path.join(folder, f"{cache_gc.PIN_PREFIX}{cache_gc.socket.gethostname()}-999999999")
+    open(dead, "w").close()
+    assert not is_pinned("old", folder)
+    assert not os.path.exists(dead)
+
+
+def test_pinning_scope_pins_accessed_plans(tmp_path):
+    folder = make_plan(tmp_path, "old", 10, 300)["doc_folder"]
+    with pinning():
+        mark_access("old", folder)
+        assert is_pinned("old")
+    assert not is_pinned("old", folder)
+
+
+def test_orphans_and_dangling_mappings_are_removed(tmp_path):
+    plan = make_plan(tmp_path, "kept", 10, 300)
+    orphan = make_plan(tmp_path, "orphan", 10, 300)["doc_folder"]
+    missing = {"file_hash": "gone", "doc_folder": str(tmp_path / "gone")}
+    gc, manager = make_gc(tmp_path, [plan, missing], max_bytes=0)
+
+    report = gc.run_once()
+    assert report["orphans"] == ["orphan"]
+    assert report["dangling_mappings"] == ["gone"]
+    assert not os.path.exists(orphan)
+    assert os.path.isdir(plan["doc_folder"])
+    assert manager.deleted == ["gone"]
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+回调投递状态转换的单元测试（替换 HTTP 发送和发件箱 DAO，不连接数据库和回调接口）
+"""
+import pytest
+
+from db import CallbackOutboxDAO
+from db.models import CallbackOutbox
+from objs import CallbackDispatcher as dispatcher_module
+from objs.CallbackDispatcher import CallbackDispatcher
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    """记录 mark_* 调用"""
+    calls = []
+    monkeypatch.setattr(CallbackOutboxDAO, "mark_delivered",
+                        staticmethod(lambda record, status_code: calls.append(("delivered", status_code))))
+    monkeypatch.setattr(CallbackOutboxDAO, "mark_retry",
+                        staticmethod(lambda record, next_time, status_code=None, error=None:
+                                     calls.append(("retry", status_code, next_time))))
+    monkeypatch.setattr(CallbackOutboxDAO, "mark_dead",
+                        staticmethod(lambda record, status_code=None, error=None:
+                                     calls.append(("dead", status_code, error))))
+    return calls
+
+
+def make_dispatcher(monkeypatch, response, max_attempts=3):
+    """response 为状态码或异常，_post 每次返回/抛出它"""
+    dispatcher = CallbackDispatcher(workers=2, per_destination=1, max_attempts=max_attempts)
+    posted = []
+
+    def post(callback_url, payload):
+        posted.append(callback_url)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(dispatcher, "_post", post)
+    monkeypatch.setattr(dispatcher, "_retry_delay", lambda attempt: 10.0)
+    dispatcher.posted = posted
+    return dispatcher
+
+
+def record(attempts=0):
+    return CallbackOutbox(id=1, task_id="t1", callback_url="http://receiver/cb", destination="receiver:80",
+                          payload_data={"status": "success"}, status="sending", attempts=attempts,
+                          claim_token="c-1")
+
+
+def test_success_marks_delivered(monkeypatch, outbox):
+    dispatcher = make_dispatcher(monkeypatch, 200)
+    dispatcher._attempt(record())
+    assert outbox == [("delivered", 200)]
+    assert dispatcher.delivered == 1
+
+
+@pytest.mark.parametrize("response", [500, 503, 408, 429, ConnectionError("refused")])
+def test_retryable_failure_schedules_retry(monkeypatch, outbox, response):
+    dispatcher = make_dispatcher(monkeypatch, response)
+    dispatcher._attempt(record(attempts=0))
+    assert len(outbox) == 1 and outbox[0][0] == "retry"
+    assert outbox[0][1] == (response if isinstance(response, int) else None)
+    assert dispatcher.retried == 1
+
+
+@pytest.mark.parametrize("status_code", [400, 404, 410])
+def test_client_error_is_dead_letter(monkeypatch, outbox, status_code):
+    dispatcher = make_dispatcher(monkeypatch, status_code)
+    dispatcher._attempt(record(attempts=0))
+    assert outbox == [("dead", status_code, f"HTTP {status_code}")]
+    assert dispatcher.dead == 1
+
+
+def test_last_attempt_is_dead_letter(monkeypatch, outbox):
+    dispatcher = make_dispatcher(monkeypatch, 503, max_attempts=3)
+    dispatcher._attempt(record(attempts=1))
+    assert outbox[-1][0] == "retry"
+    dispatcher._attempt(record(attempts=2))
+    assert outbox[-1][0] == "dead"
+    assert dispatcher.retried == 1 and dispatcher.dead == 1
+
+
+def test_deliver_releases_destination_when_status_update_fails(monkeypatch):
+    dispatcher = make_dispatcher(monkeypatch, 200)
+
+    def fail(record, status_code):
+        raise RuntimeError("数据库不可用")
+
+    monkeypatch.setattr(CallbackOutboxDAO, "mark_delivered", staticmethod(fail))
+    dispatcher._in_flight["receiver:80"] = 1
+    dispatcher._deliver(record())
+    assert dispatcher._in_flight == {}
+
+
+def test_dispatch_due_raises_when_outbox_unavailable(monkeypatch):
+    dispatcher = make_dispatcher(monkeypatch, 200)
+    monkeypatch.setattr(CallbackOutboxDAO, "claim_due", staticmethod(lambda *args: None))
+    with pytest.raises(RuntimeError):
+        dispatcher.dispatch_due()
+
+
+def test_retry_delay_grows(monkeypatch):
+    monkeypatch.setattr(dispatcher_module.CALLBACK_CONFIG, "backoff_base", 2.0)
+    monkeypatch.setattr(dispatcher_module.CALLBACK_CONFIG, "backoff_max", 600.0)
+    dispatcher = CallbackDispatcher(workers=1)
+    for attempt in range(5):
+        delay = dispatcher._retry_delay(attempt)
+        assert 2.0 * 2 ** attempt / 2 <= delay <= 2.0 * 2 ** attempt
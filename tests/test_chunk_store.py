@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+文本块二进制存储的单元测试：写入读取往返、元数据、拼回全文与关闭
+"""
+import mmap
+
+import pytest
+
+from objs.ChunkStore import ChunkStore
+
+
+CHUNKS = ["第一章 概况\n本工程为框架结构。", "  含前后空白和换行 \n", "", "English and 中文 mixed ✓"]
+
+
+def test_round_trip_keeps_text_exactly(tmp_path):
+    ChunkStore.write(str(tmp_path), CHUNKS)
+    assert ChunkStore.exists(str(tmp_path))
+    with ChunkStore(str(tmp_path)) as store:
+        assert len(store) == len(CHUNKS)
+        assert list(store) == CHUNKS
+        assert store[1] == CHUNKS[1]
+        assert store[-1] == CHUNKS[-1]
+        assert store[1:3] == CHUNKS[1:3]
+        with pytest.raises(IndexError):
+            store[len(CHUNKS)]
+
+
+def test_metas_round_trip_and_fallback(tmp_path):
+    metas = [{"start": i, "end": i + 1, "section_path": ["第一章"]} for i in range(len(CHUNKS))]
+    ChunkStore.write(str(tmp_path / "with"), CHUNKS, metas)
+    with ChunkStore(str(tmp_path / "with")) as store:
+        assert store.metas == metas
+        assert store.meta(2) == metas[2]
+
+    # 元数据条数不一致时按空元数据处理
+    ChunkStore.write(str(tmp_path / "without"), CHUNKS, metas[:1])
+    with ChunkStore(str(tmp_path / "without")) as store:
+        assert store.metas == [{} for _ in CHUNKS]
+
+
+def test_empty_store(tmp_path):
+    ChunkStore.write(str(tmp_path), [])
+    with ChunkStore(str(tmp_path)) as store:
+        assert len(store) == 0
+        assert list(store) == []
+
+
+def test_joined_text_removes_overlap(tmp_path):
+    text = "第一句。第二句。第三句。"
+    chunks = [text[0:8], text[4:12]]
+    metas = [{"start": 0, "end": 8}, {"start": 4, "end": 12}]
+    ChunkStore.write(str(tmp_path), chunks, metas)
+    with ChunkStore(str(tmp_path)) as store:
+        assert store.joined_text() == text
+
+
+def test_joined_text_without_offsets_uses_newlines(tmp_path):
+    ChunkStore.write(str(tmp_path), ["甲", "乙"])
+    with ChunkStore(str(tmp_path)) as store:
+        assert store.joined_text() == "甲\n乙"
+
+
+def test_close_releases_handles_and_is_idempotent(tmp_path):
+    ChunkStore.write(str(tmp_path), CHUNKS)
+    store = ChunkStore(str(tmp_path))
+    blob = store._blob
+    assert isinstance(blob, mmap.mmap)
+    store.close()
+    store.close()
+    assert blob.closed
+    assert store._file.closed
+    assert len(store) == 0
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+证据打包的单元测试：预算裁剪、重复去除、文档顺序与截断
+（中文每字按 1 个 token 估算，文本块在预算中另计 1 个分隔符）
+"""
+from config.settings import CONTEXT_CONFIG
+from utils.context_packer import context_budget, pack_chunks, pack_context, truncate_tokens
+from utils.token_counter import estimate_tokens
+
+
+def hit(index, text, similarity=0.9):
+    return {"index": index, "text": text, "similarity": similarity}
+
+
+# 按相关性排序的检索结果，前两块共 25 个 token
+HITS = [hit(5, "模板支撑体系验收要求明确"), hit(1, "脚手架立杆间距满足规定"),
+        hit(9, "混凝土浇筑后养护七天以上"), hit(3, "安全员每日巡查施工现场")]
+
+
+def test_budget_keeps_most_relevant_chunks():
+    packed = pack_chunks(HITS, budget=25, mmr_lambda=1.0)
+    assert [c["index"] for c in packed] == [1, 5]
+    assert sum(estimate_tokens(c["text"]) + 1 for c in packed) <= 25
+
+
+def test_large_budget_keeps_all_in_document_order():
+    packed = pack_chunks(HITS, budget=1000)
+    assert [c["index"] for c in packed] == [1, 3, 5, 9]
+
+
+def test_chunk_that_does_not_fit_is_skipped_for_smaller_ones():
+    hits = [hit(0, "短句一二三四"), hit(1, "很长" * 20), hit(2, "短句五六七八")]
+    packed = pack_chunks(hits, budget=16, mmr_lambda=1.0)
+    assert [c["index"] for c in packed] == [0, 2]
+
+
+def test_near_duplicates_are_dropped():
+    hits = [hit(0, "模板支撑体系验收要求明确"), hit(1, "模板支撑体系验收要求明确。"),
+            hit(2, "脚手架立杆间距满足规定")]
+    packed = pack_chunks(hits, budget=1000, dup_threshold=0.8)
+    assert [c["index"] for c in packed] == [0, 2]
+
+
+def test_truncates_first_chunk_when_nothing_fits():
+    packed = pack_chunks([hit(0, "很长的证据" * 20)], budget=10)
+    assert len(packed) == 1
+    assert packed[0]["truncated"] is True
+    assert estimate_tokens(packed[0]["text"]) <= 9
+    assert "很长的证据".startswith(packed[0]["text"][:5])
+
+
+def test_formatter_cost_counts_against_budget():
+    formatter = lambda c: f"相关度{c['similarity']:.3f}: {c['text']}"
+    plain = pack_chunks(HITS, budget=44, mmr_lambda=1.0)
+    formatted = pack_chunks(HITS, budget=44, formatter=formatter, mmr_lambda=1.0)
+    assert len(formatted) < len(plain)
+    text = pack_context(HITS, budget=44, formatter=formatter)
+    assert text.startswith("相关度")
+    assert estimate_tokens(text) <= 44
+
+
+def test_same_evidence_set_packs_identically():
+    assert pack_context(HITS, 1000) == pack_context(list(reversed(HITS)), 1000)
+
+
+def test_truncate_tokens():
+    assert truncate_tokens("一二三四五", 0) == ""
+    assert truncate_tokens("一二三四五", 10) == "一二三四五"
+    assert estimate_tokens(truncate_tokens("一二三四五" * 10, 7)) <= 7
+
+
+def test_context_budget_subtracts_template_and_fixed_text(monkeypatch):
+    monkeypatch.setattr(CONTEXT_CONFIG, "prompt_budget", 1000)
+    monkeypatch.setattr(CONTEXT_CONFIG, "model_budgets", {"big": 5000})
+    monkeypatch.setattr(CONTEXT_CONFIG, "template_tokens", 100)
+    monkeypatch.setattr(CONTEXT_CONFIG, "min_evidence_tokens", 50)
+    assert context_budget() == 900
+    assert context_budget("big", "一二三四五") == 4895
+    assert context_budget("small", "字" * 2000) == 50
+    assert pack_chunks([], 100) == []
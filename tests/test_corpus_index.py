@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+全局语料索引的单元测试：按方案增删向量（IndexIDMap2 + 连续全局ID）、过滤检索、保存与多实例同步
+"""
+import numpy as np
+import pytest
+
+from objs.CorpusIndex import CorpusIndex
+
+pytest.importorskip("faiss")
+
+MODEL = "nomic-embed-text:latest"
+DIM = 8
+
+
+def vectors(seed, count):
+    return np.random.default_rng(seed).normal(size=(count, DIM)).astype(np.float32)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    # 不自动保存，由测试调用 flush
+    index = CorpusIndex(str(tmp_path), save_delay=3600)
+    yield index
+    if index._save_timer is not None:
+        index._save_timer.cancel()
+
+
+def test_add_assigns_contiguous_ids_and_search_maps_back(corpus):
+    a, b = vectors(1, 3), vectors(2, 4)
+    assert corpus.add_plan("plan-a", a, MODEL, scheme_id=1, original_filename="a.docx") == 3
+    assert corpus.add_plan("plan-b", b, MODEL, scheme_id=2) == 4
+
+    plans = corpus._id_maps[corpus._model_key(MODEL)]["plans"]
+    assert (plans["plan-a"]["start_id"], plans["plan-a"]["count"]) == (0, 3)
+    assert (plans["plan-b"]["start_id"], plans["plan-b"]["count"]) == (3, 4)
+
+    hit = corpus.search(b[2], MODEL, top_k=1)[0]
+    assert (hit["plan_id"], hit["chunk_idx"], hit["scheme_id"]) == ("plan-b", 2, "2")
+    hit = corpus.search(a[1], MODEL, top_k=1)[0]
+    assert (hit["plan_id"], hit["chunk_idx"], hit["original_filename"]) == ("plan-a", 1, "a.docx")
+
+
+def test_remove_plan_drops_its_vectors_only(corpus):
+    a, b = vectors(1, 3), vectors(2, 4)
+    corpus.add_plan("plan-a", a, MODEL)
+    corpus.add_plan("plan-b", b, MODEL)
+
+    assert corpus.remove_plan("plan-a") is True
+    assert corpus.remove_plan("plan-a") is False
+    assert corpus.stats()[MODEL] == {"plans_count": 1, "vectors_count": 4}
+    assert {hit["plan_id"] for hit in corpus.search(a[0], MODEL, top_k=10)} == {"plan-b"}
+
+
+def test_re_adding_plan_replaces_vectors(corpus):
+    corpus.add_plan("plan-a", vectors(1, 3), MODEL)
+    new = vectors(3, 2)
+    corpus.add_plan("plan-a", new, MODEL)
+    assert corpus.stats()[MODEL] == {"plans_count": 1, "vectors_count": 2}
+    hit = corpus.search(new[1], MODEL, top_k=1)[0]
+    assert (hit["plan_id"], hit["chunk_idx"]) == ("plan-a", 1)
+
+
+def test_search_filters_by_plan_and_scheme(corpus):
+    a, b = vectors(1, 3), vectors(2, 3)
+    corpus.add_plan("plan-a", a, MODEL, scheme_id=1)
+    corpus.add_plan("plan-b", b, MODEL, scheme_id=2)
+
+    assert {h["plan_id"] for h in corpus.search(a[0], MODEL, top_k=6, plan_ids=["plan-b"])} == {"plan-b"}
+    assert {h["plan_id"] for h in corpus.search(b[0], MODEL, top_k=6, scheme_ids=[1])} == {"plan-a"}
+    assert corpus.search(a[0], MODEL, plan_ids=["missing"]) == []
+    assert corpus.search(a[0], "other-model") == []
+
+
+def test_dimension_mismatch_is_skipped(corpus):
+    corpus.add_plan("plan-a", vectors(1, 3), MODEL)
+    assert corpus.add_plan("plan-b", np.ones((2, DIM + 1), dtype=np.float32), MODEL) == 0
+    assert corpus.add_plan("plan-c", np.zeros((0, DIM), dtype=np.float32), MODEL) == 0
+
+
+def test_flush_persists_and_other_instance_reloads(corpus, tmp_path):
+    a, b = vectors(1, 3), vectors(2, 4)
+    corpus.add_plan("plan-a", a, MODEL)
+    corpus.flush()
+
+    other = CorpusIndex(str(tmp_path), save_delay=3600)
+    try:
+        assert other.stats()[MODEL] == {"plans_count": 1, "vectors_count": 3}
+        # 另一实例（模拟另一个 worker 进程）保存的修改，检索前按 id_map.json 的修改时间重新加载
+        other.add_plan("plan-b", b, MODEL)
+        other.remove_plan("plan-a")
+        other.flush()
+    finally:
+        if other._save_timer is not None:
+            other._save_timer.cancel()
+
+    hits = corpus.search(b[0], MODEL, top_k=10)
+    assert {h["plan_id"] for h in hits} == {"plan-b"}
+    assert corpus.stats()[MODEL] == {"plans_count": 1, "vectors_count": 4}
+
+
+def test_sync_removes_plans_without_mapping(corpus):
+    corpus.add_plan("plan-a", vectors(1, 3), MODEL)
+    corpus.add_plan("plan-b", vectors(2, 3), MODEL)
+    assert corpus.sync([{"file_hash": "plan-b"}]) == {"added": 0, "removed": 1}
+    assert corpus.stats()[MODEL]["plans_count"] == 1
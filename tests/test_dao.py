@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+任务状态更新的单元测试：一条 UPDATE 语句完成更新，影响行数为 0 时区分任务不存在与重复写入
+（使用记录语句的假游标和连接，不连接 MySQL）
+"""
+import json
+
+import pytest
+
+from db import connection as db_connection
+from db.dao import AsyncTaskDAO
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self._row = None
+
+    def execute(self, sql, params=None):
+        self.conn.log.append((sql, list(params or [])))
+        if sql.startswith("UPDATE"):
+            self.rowcount = self.conn.update_rowcount
+        elif sql.startswith("SELECT COUNT"):
+            self._row = {"count": self.conn.existing}
+
+    def fetchone(self):
+        return self._row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, update_rowcount=1, existing=1):
+        self.log = []
+        self.update_rowcount = update_rowcount
+        self.existing = existing
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.log.append("ROLLBACK")
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """让 get_db_connection 返回假连接"""
+    holder = {"connection": FakeConnection()}
+    monkeypatch.setattr(db_connection, "get_connection", lambda: holder["connection"])
+    monkeypatch.setattr(db_connection, "return_connection", lambda conn: None)
+    return holder
+
+
+def statements(conn):
+    return [entry for entry in conn.log if isinstance(entry, tuple)]
+
+
+def test_single_update_statement(fake_db):
+    conn = fake_db["connection"]
+    assert AsyncTaskDAO.update_task_status("t1", "processing") is True
+    (sql, params), = statements(conn)
+    assert sql.startswith("UPDATE async_tasks SET status = %s, updated_time = %s")
+    assert sql.endswith("WHERE task_id = %s")
+    assert "completed_time" not in sql
+    assert params[0] == "processing" and params[-1] == "t1"
+
+
+def test_final_status_sets_result_and_completed_time(fake_db):
+    conn = fake_db["connection"]
+    result = {"items": [{"name": "编制依据", "ok": True}]}
+    assert AsyncTaskDAO.update_task_status("t1", "success", result_data=result) is True
+    (sql, params), = statements(conn)
+    assert "result_data = %s" in sql and "completed_time = %s" in sql
+    assert json.loads(params[2]) == result
+    # 完成时间与更新时间一致
+    assert params[1] == params[3]
+
+
+def test_failed_status_writes_error_message(fake_db):
+    conn = fake_db["connection"]
+    assert AsyncTaskDAO.update_task_status("t1", "failed", error_message="模型超时") is True
+    (sql, params), = statements(conn)
+    assert "error_message = %s" in sql
+    assert "模型超时" in params
+
+
+def test_zero_rowcount_for_missing_task(fake_db):
+    fake_db["connection"] = conn = FakeConnection(update_rowcount=0, existing=0)
+    assert AsyncTaskDAO.update_task_status("missing", "processing") is False
+    sqls = [sql for sql, _ in statements(conn)]
+    assert sqls[0].startswith("UPDATE") and sqls[1].startswith("SELECT COUNT")
+
+
+def test_zero_rowcount_for_unchanged_task(fake_db):
+    # 同一秒内重复写入相同的值时 MySQL 返回影响行数 0，任务仍存在
+    fake_db["connection"] = FakeConnection(update_rowcount=0, existing=1)
+    assert AsyncTaskDAO.update_task_status("t1", "processing") is True
+
+
+def test_database_error_returns_false(fake_db):
+    class BrokenConnection(FakeConnection):
+        def cursor(self):
+            raise RuntimeError("连接已断开")
+
+    fake_db["connection"] = BrokenConnection()
+    assert AsyncTaskDAO.update_task_status("t1", "processing") is False
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+词法索引的单元测试：分词、BM25 排序、保存加载与 RRF 融合
+（固定使用字二元组分词，结果与是否安装 jieba 无关）
+"""
+import pytest
+
+from objs.LexicalIndex import LexicalIndex, rrf_fuse, tokenize
+
+
+CHUNKS = [
+    "模板支撑体系按 GB 50204-2015 验收。",
+    "脚手架搭设应符合 JGJ130 的规定，立杆间距满足要求。",
+    "混凝土浇筑前检查模板和钢筋。混凝土养护不少于七天。",
+    "安全员每日巡查施工现场。",
+]
+
+
+def bigram_index(chunks=CHUNKS):
+    index = LexicalIndex()
+    index.tokenizer = "bigram"
+    return index.build(chunks)
+
+
+def test_tokenize_keeps_codes_and_splits_bigrams():
+    tokens = tokenize("按GB 50204-2015验收", use_jieba=False)
+    assert "gb" in tokens
+    assert "50204-2015" in tokens
+    assert "验收" in tokens
+    assert tokenize("章", use_jieba=False) == ["章"]
+
+
+def test_exact_code_match_ranks_first():
+    index = bigram_index()
+    assert index.search("GB 50204-2015", top_k=3)[0][0] == 0
+    assert index.search("jgj130", top_k=3)[0][0] == 1
+
+
+def test_term_frequency_raises_score():
+    hits = bigram_index().search("混凝土模板", top_k=4)
+    ids = [doc_id for doc_id, _ in hits]
+    assert ids[0] == 2
+    assert 0 in ids
+    scores = [score for _, score in hits]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_no_match_and_empty_index():
+    assert bigram_index().search("塔吊") == []
+    assert bigram_index([]).search("模板") == []
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = bigram_index()
+    path = str(tmp_path / LexicalIndex.FILE_NAME)
+    index.save(path)
+
+    loaded = LexicalIndex.load(path)
+    if loaded is None:
+        # 当前环境使用 jieba，二元组索引应被判定为需要重建
+        assert LexicalIndex().tokenizer == "jieba"
+        return
+    assert len(loaded) == len(CHUNKS)
+    assert loaded.search("GB 50204-2015") == index.search("GB 50204-2015")
+
+
+def test_load_missing_or_broken_file(tmp_path):
+    assert LexicalIndex.load(str(tmp_path / "missing.json")) is None
+    broken = tmp_path / "broken.json"
+    broken.write_text("{", encoding="utf-8")
+    assert LexicalIndex.load(str(broken)) is None
+
+
+def test_rrf_prefers_documents_ranked_high_in_both_lists():
+    fused = rrf_fuse([[1, 2, 3], [2, 1, 4]])
+    order = sorted(fused, key=fused.get, reverse=True)
+    assert set(order[:2]) == {1, 2}
+    assert set(order[2:]) == {3, 4}
+    assert fused[1] == pytest.approx(1 / 61 + 1 / 62)
+    assert fused[3] == pytest.approx(fused[4])
+
+
+def test_rrf_single_list_keeps_order():
+    fused = rrf_fuse([[7, 3, 5]])
+    assert sorted(fused, key=fused.get, reverse=True) == [7, 3, 5]
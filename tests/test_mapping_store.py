@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+文件映射存储的单元测试：多进程并发写入不丢失、上一版本查找（json 与 sqlite 两种后端）
+"""
+import multiprocessing
+
+import pytest
+
+from objs.MappingStore import JsonMappingStore, SqliteMappingStore
+
+
+def mapping(file_hash, filename="方案.docx", scheme_id=None, upload_time="2026-01-01T00:00:00",
+            model="nomic-embed-text:latest"):
+    info = {"file_hash": file_hash, "original_filename": filename,
+            "upload_time": upload_time, "embedding_model": model}
+    if scheme_id is not None:
+        info["scheme_id"] = str(scheme_id)
+    return info
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        yield JsonMappingStore(str(tmp_path / "file_mapping.json"))
+    else:
+        s = SqliteMappingStore(str(tmp_path / SqliteMappingStore.FILE_NAME))
+        yield s
+        s.close()
+
+
+def _put_many_json(args):
+    path, worker, count = args
+    s = JsonMappingStore(path)
+    for i in range(count):
+        s.put(mapping(f"{worker}-{i}"))
+
+
+def test_json_concurrent_puts_from_processes_are_not_lost(tmp_path):
+    path = str(tmp_path / "file_mapping.json")
+    workers, count = 4, 25
+    with multiprocessing.get_context("fork").Pool(workers) as pool:
+        pool.map(_put_many_json, [(path, w, count) for w in range(workers)])
+    assert len(JsonMappingStore(path).all()) == workers * count
+
+
+def test_json_store_sees_writes_from_other_instances(tmp_path):
+    path = str(tmp_path / "file_mapping.json")
+    a, b = JsonMappingStore(path), JsonMappingStore(path)
+    a.put(mapping("h1"))
+    b.put(mapping("h2"))
+    assert set(a.all()) == {"h1", "h2"}
+    assert b.delete("h1") is True
+    assert a.get("h1") is None
+    assert a.delete("h1") is False
+
+
+def test_put_get_delete(store):
+    store.put(mapping("h1"))
+    assert store.get("h1")["original_filename"] == "方案.docx"
+    store.put(dict(mapping("h1"), original_filename="新方案.docx"))
+    assert store.find_by_filename("新方案.docx")["file_hash"] == "h1"
+    assert store.delete("h1") is True
+    assert store.get("h1") is None
+
+
+def test_previous_version_matches_scheme_id_only(store):
+    store.put(mapping("old", filename="施工方案.docx", scheme_id=7, upload_time="2026-01-01"))
+    store.put(mapping("other", filename="施工方案.docx", scheme_id=8, upload_time="2026-03-01"))
+    store.put(mapping("new", filename="施工方案-修订.docx", scheme_id=7, upload_time="2026-02-01"))
+
+    # 同名但属于其他方案的文件不算上一版本
+    found = store.find_previous_version(scheme_id=7, filename="施工方案.docx", exclude_hash="current")
+    assert found["file_hash"] == "new"
+    assert store.find_previous_version(scheme_id=7, exclude_hash="new")["file_hash"] == "old"
+    assert store.find_previous_version(scheme_id=9, filename="施工方案.docx") is None
+
+
+def test_previous_version_by_filename_and_model(store):
+    store.put(mapping("a", upload_time="2026-01-01"))
+    store.put(mapping("b", upload_time="2026-02-01", model="bge-m3"))
+    store.put(mapping("c", upload_time="2026-03-01"))
+
+    assert store.find_previous_version(filename="方案.docx", exclude_hash="c")["file_hash"] == "b"
+    found = store.find_previous_version(filename="方案.docx", embedding_model="nomic-embed-text:latest",
+                                        exclude_hash="c")
+    assert found["file_hash"] == "a"
+    assert store.find_previous_version() is None
+
+
+def test_sqlite_imports_json_mapping(tmp_path):
+    json_path = str(tmp_path / "file_mapping.json")
+    JsonMappingStore(json_path).put(mapping("h1"))
+    s = SqliteMappingStore(str(tmp_path / SqliteMappingStore.FILE_NAME))
+    try:
+        assert s.import_json(json_path) == 1
+        assert s.get("h1")["file_hash"] == "h1"
+        assert (tmp_path / "file_mapping.json.migrated").exists()
+    finally:
+        s.close()
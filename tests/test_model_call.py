@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+模型调用重试与错误分类的单元测试（不连接模型服务）
+"""
+import asyncio
+
+import pytest
+
+from objs import ModelCall
+from objs.ModelCall import ModelCallError, call_with_retry, call_with_retry_async
+from objs.RateLimiter import is_overload_error
+
+
+class StatusError(Exception):
+    """模拟带状态码的 openai.APIStatusError"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class APITimeoutError(Exception):
+    pass
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ModelCall, "backoff_delay", lambda attempt: 0.0)
+
+
+def flaky(errors, result="ok"):
+    """前 len(errors) 次调用依次抛出 errors 中的异常，之后返回 result"""
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    func.calls = calls
+    return func
+
+
+@pytest.mark.parametrize("error", [
+    StatusError(429), StatusError(500), StatusError(503), APITimeoutError(), APIConnectionError(), TimeoutError()
+])
+def test_retryable_errors_are_retried(error):
+    func = flaky([error, error])
+    assert call_with_retry(func, max_retries=2) == "ok"
+    assert len(func.calls) == 3
+
+
+@pytest.mark.parametrize("error", [StatusError(400), StatusError(401), StatusError(404), ValueError("bad")])
+def test_non_retryable_errors_fail_immediately(error):
+    func = flaky([error])
+    with pytest.raises(ModelCallError) as info:
+        call_with_retry(func, backend="http://backend", model="m", max_retries=2)
+    assert len(func.calls) == 1
+    assert info.value.retryable is False
+    assert info.value.attempts == 1
+    assert info.value.cause is error
+    assert info.value.backend == "http://backend"
+
+
+def test_retries_exhausted():
+    func = flaky([StatusError(503)] * 5)
+    with pytest.raises(ModelCallError) as info:
+        call_with_retry(func, max_retries=2)
+    assert len(func.calls) == 3
+    assert info.value.retryable is True
+    assert info.value.attempts == 3
+
+
+def test_model_call_error_is_not_retried_again():
+    inner = ModelCallError("inner", retryable=True)
+    func = flaky([inner])
+    with pytest.raises(ModelCallError) as info:
+        call_with_retry(func, max_retries=2)
+    assert info.value is inner
+    assert len(func.calls) == 1
+
+
+def test_wrapped_cause_is_classified():
+    assert is_overload_error(ModelCallError("x", cause=StatusError(503)))
+    assert not is_overload_error(ModelCallError("x", cause=StatusError(400)))
+
+
+def test_async_retry():
+    func = flaky([StatusError(502)])
+
+    async def call():
+        return func()
+
+    assert asyncio.run(call_with_retry_async(call, max_retries=1)) == "ok"
+    assert len(func.calls) == 2
+
+
+def test_async_non_retryable():
+    func = flaky([StatusError(422)])
+
+    async def call():
+        return func()
+
+    with pytest.raises(ModelCallError):
+        asyncio.run(call_with_retry_async(call, max_retries=3))
+    assert len(func.calls) == 1
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+限流器并发上限与 AIMD 调整的单元测试
+"""
+import time
+
+import pytest
+
+from objs.RateLimiter import RateLimiter
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def limiter(**kwargs):
+    options = dict(max_concurrency=8, min_concurrency=1, rate=0, latency_target=60, acquire_timeout=0.05)
+    options.update(kwargs)
+    return RateLimiter("test", **options)
+
+
+def allow_decrease(r: RateLimiter):
+    """跳过“一个周期只减半一次”的限制"""
+    r._decreased_at = float("-inf")
+
+
+def test_unlimited_never_blocks_or_adjusts():
+    r = limiter(max_concurrency=0)
+    for _ in range(100):
+        r.acquire()
+    assert r.in_flight == 100
+    for _ in range(100):
+        r.release(latency=600, overloaded=True)
+    status = r.status()
+    assert status["in_flight"] == 0
+    assert status["limit"] is None
+    assert status["overloaded"] == 100
+
+
+def test_concurrency_cap_times_out():
+    r = limiter(max_concurrency=2)
+    r.acquire()
+    r.acquire()
+    with pytest.raises(TimeoutError):
+        r.acquire()
+    r.release(latency=0.1)
+    r.acquire()
+    assert r.in_flight == 2
+
+
+def test_overload_halves_once_per_period():
+    r = limiter()
+    for _ in range(3):
+        r.acquire()
+    r.release(overloaded=True)
+    assert r.limit == 4
+    # 同一周期内的后续失败不再减半
+    r.release(overloaded=True)
+    r.release(latency=120)
+    assert r.limit == 4
+    assert r.overloaded == 2
+
+
+def test_decrease_stops_at_min_concurrency():
+    r = limiter(min_concurrency=3)
+    for _ in range(5):
+        r.acquire()
+        allow_decrease(r)
+        r.release(overloaded=True)
+    assert r.limit == 3
+
+
+def test_success_increases_additively_up_to_max():
+    r = limiter(max_concurrency=4)
+    r.acquire()
+    r.release(overloaded=True)
+    assert r.limit == 2
+    r.acquire()
+    r.release(latency=1)
+    assert r.limit == pytest.approx(2.5)
+    for _ in range(20):
+        r.acquire()
+        r.release(latency=1)
+    assert r.limit == 4
+    assert r.completed == 21
+
+
+def test_slow_call_counts_as_overload():
+    r = limiter(latency_target=0.01)
+    with r.slot():
+        time.sleep(0.03)
+    assert r.limit == 4
+    assert r.overloaded == 0
+
+
+def test_stream_slot_does_not_report_duration():
+    r = limiter(latency_target=0.01)
+    with r.slot(stream=True):
+        time.sleep(0.03)
+    assert r.limit == 8
+    assert r.completed == 1
+
+
+def test_slot_releases_on_overload_error():
+    r = limiter()
+    with pytest.raises(StatusError):
+        with r.slot():
+            raise StatusError(503)
+    assert r.in_flight == 0
+    assert r.limit == 4
+    assert r.overloaded == 1
+
+
+def test_slot_client_error_is_not_overload():
+    r = limiter()
+    with pytest.raises(StatusError):
+        with r.slot():
+            raise StatusError(400)
+    assert r.in_flight == 0
+    assert r.limit == 8
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+差异复审规划器的单元测试：证据一致时复用基准结果、证据变化或基准失败时重新检查
+（使用按查询返回固定检索结果的假审查器）
+"""
+from decimal import Decimal
+
+from objs.ReauditPlanner import ReauditPlanner
+
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, texts):
+        self.calls += 1
+        return [[0.0]]
+
+
+class FakeAuditor:
+    def __init__(self, plan_hash, evidence, embedder=None):
+        self.plan_hash = plan_hash
+        self.evidence = evidence
+        self.embedder = embedder or FakeEmbedder()
+
+    def get_hash(self):
+        return self.plan_hash
+
+    def search_similar_chunks(self, query, top_k=5, query_vec=None):
+        return [{"text": text} for text in self.evidence.get(query, [])[:top_k]]
+
+
+BASE_RESULT = {
+    "plan_id": "base",
+    "items": [
+        {"id": 1, "task_id": "base-task", "item_id": "1", "name": "编制依据", "status": "符合",
+         "score": Decimal("0.9")},
+        {"id": 2, "task_id": "base-task", "item_id": "2", "name": "工程概况", "status": "检查失败"},
+        {"id": 3, "task_id": "base-task", "item_id": "3", "name": "施工部署", "status": "不符合"},
+    ]
+}
+
+
+def planner(current, base):
+    return ReauditPlanner(current, base, {item["item_id"]: item for item in BASE_RESULT["items"]},
+                          "base-task", "status")
+
+
+def test_create_without_base_result_returns_none():
+    auditor = FakeAuditor("new", {})
+    assert ReauditPlanner.create(auditor, "", BASE_RESULT, "items", "item_id", "status") is None
+    assert ReauditPlanner.create(auditor, "base-task", None, "items", "item_id", "status") is None
+    assert ReauditPlanner.create(auditor, "base-task", {"plan_id": "base", "items": []},
+                                 "items", "item_id", "status") is None
+
+
+def test_unchanged_plan_reuses_without_second_search():
+    auditor = FakeAuditor("base", {"q": ["证据一"]})
+    p = ReauditPlanner.create(auditor, "base-task", BASE_RESULT, "items", "item_id", "status")
+    assert p.base_auditor is auditor
+    results, unchanged = p.search("q", top_k=3)
+    assert unchanged and results == [{"text": "证据一"}]
+    assert auditor.embedder.calls == 0
+
+
+def test_same_evidence_is_reused_with_one_embedding():
+    embedder = FakeEmbedder()
+    current = FakeAuditor("new", {"q": ["证据一", "证据二", "新增内容"]}, embedder)
+    base = FakeAuditor("base", {"q": ["证据一", "证据二", "旧内容"]}, embedder)
+    p = planner(current, base)
+
+    _, unchanged = p.search("q", top_k=2)
+    assert unchanged
+    assert embedder.calls == 1
+    # top-k 证据或其顺序变化时不可复用
+    assert p.search("q", top_k=3)[1] is False
+    base.evidence["q"] = ["证据二", "证据一"]
+    assert p.search("q", top_k=2)[1] is False
+
+
+def test_reuse_copies_base_item():
+    p = planner(FakeAuditor("new", {}), FakeAuditor("base", {}))
+    item = p.reuse("1", {"name": "编制依据"})
+    assert item == {"item_id": "1", "name": "编制依据", "status": "符合", "score": 0.9,
+                    "reused_from_task": "base-task"}
+    assert isinstance(item["score"], float)
+    assert p.reused_count == 1
+
+
+def test_failed_missing_or_mismatched_items_are_not_reused():
+    p = planner(FakeAuditor("new", {}), FakeAuditor("base", {}))
+    assert p.reuse("2") is None
+    assert p.reuse("9") is None
+    assert p.reuse("1", {"name": "其他检查项"}) is None
+    assert p.reused_count == 0
+
+
+def test_reuse_group_is_all_or_nothing():
+    p = planner(FakeAuditor("new", {}), FakeAuditor("base", {}))
+    assert p.reuse_group([("1", None), ("2", None)]) is None
+    assert p.reused_count == 0
+    items = p.reuse_group([("1", None), ("3", {"name": "施工部署"})])
+    assert [item["item_id"] for item in items] == ["1", "3"]
+    assert p.reused_count == 2
+    assert p.reuse_group([]) is None
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+SSE 输出的单元测试：token 合并（按字节数、按时间、模型停顿）、多路事件交错与帧编码
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from utils.sse import coalesce_events, acoalesce_events, format_event, interleave_events
+
+
+def token(content, **extra):
+    return dict({"type": "token", "content": content}, **extra)
+
+
+def contents(events):
+    return [e.get("content") for e in events]
+
+
+def test_tokens_merge_until_other_event():
+    events = [token("施"), token("工"), {"type": "done"}, token("方"), token("案")]
+    out = list(coalesce_events(events, interval_ms=10000, max_bytes=1024))
+    assert out == [token("施工"), {"type": "done"}, token("方案")]
+
+
+def test_flush_when_bytes_exceed_limit():
+    out = list(coalesce_events([token("ab"), token("cd"), token("e")], interval_ms=10000, max_bytes=4))
+    assert contents(out) == ["abcd", "e"]
+
+
+def test_sources_merge_separately_and_keep_order():
+    events = [token("a", item_index=0), token("x", item_index=1), token("b", item_index=0),
+              token("y", item_index=1)]
+    out = list(coalesce_events(events, interval_ms=10000, max_bytes=1024))
+    assert out == [token("ab", item_index=0), token("xy", item_index=1)]
+
+
+def test_pending_tokens_flush_during_model_stall():
+    def slow():
+        yield token("a")
+        yield token("b")
+        time.sleep(0.5)
+        yield token("c")
+
+    started = time.monotonic()
+    arrivals = []
+    for event in coalesce_events(slow(), interval_ms=50, max_bytes=1024):
+        arrivals.append((event["content"], time.monotonic() - started))
+    assert [c for c, _ in arrivals] == ["ab", "c"]
+    # 停顿期间已合并的内容按合并间隔发送，而不是等到下一个 token
+    assert arrivals[0][1] < 0.3
+
+
+def test_source_error_is_raised_after_pending_tokens():
+    def failing():
+        yield token("a")
+        raise ValueError("模型调用失败")
+
+    out = []
+    with pytest.raises(ValueError):
+        for event in coalesce_events(failing(), interval_ms=10000, max_bytes=1024):
+            out.append(event)
+    assert contents(out) == ["a"]
+
+
+def test_closing_output_closes_source():
+    closed = []
+
+    def source():
+        try:
+            while True:
+                yield {"type": "status"}
+        finally:
+            closed.append(True)
+
+    stream = coalesce_events(source(), interval_ms=10000, max_bytes=1024)
+    assert next(stream) == {"type": "status"}
+    stream.close()
+    deadline = time.monotonic() + 2
+    while not closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert closed
+
+
+def test_async_coalesce_flushes_during_stall():
+    async def slow():
+        yield token("a")
+        yield token("b")
+        await asyncio.sleep(0.5)
+        yield token("c")
+        yield {"type": "done"}
+
+    async def collect():
+        started = time.monotonic()
+        return [(e.get("content"), time.monotonic() - started)
+                async for e in acoalesce_events(slow(), interval_ms=50, max_bytes=1024)]
+
+    arrivals = asyncio.run(collect())
+    assert [c for c, _ in arrivals] == ["ab", "c", None]
+    assert arrivals[0][1] < 0.3
+
+
+def test_format_event():
+    event = {"type": "token", "content": "中文"}
+    assert format_event(event) == 'data: {"type":"token","content":"中文"}\n\n'.encode("utf-8")
+    assert format_event(event, compact=False) == b"data: " + json.dumps(event).encode() + b"\n\n"
+
+
+def test_interleave_keeps_order_within_each_stream():
+    def stream(item):
+        def run():
+            for i in range(20):
+                yield {"item_index": item, "seq": i}
+        return run
+
+    out = list(interleave_events([stream(i) for i in range(3)], workers=3))
+    assert len(out) == 60
+    for item in range(3):
+        assert [e["seq"] for e in out if e["item_index"] == item] == list(range(20))
+
+
+def test_interleave_emits_events_as_they_are_produced():
+    release = threading.Event()
+
+    def blocked():
+        release.wait(2)
+        yield {"item_index": 0}
+
+    def fast():
+        yield {"item_index": 1}
+
+    stream = interleave_events([blocked, fast], workers=2)
+    # 前一项未产生事件时，后一项的事件先输出
+    assert next(stream) == {"item_index": 1}
+    release.set()
+    assert list(stream) == [{"item_index": 0}]
+
+
+def test_interleave_limits_parallel_streams():
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def stream():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        yield {"type": "done"}
+        with lock:
+            running[0] -= 1
+
+    assert len(list(interleave_events([stream] * 6, workers=2))) == 6
+    assert peak[0] <= 2
+
+
+def test_interleave_raises_stream_error():
+    def failing():
+        yield {"item_index": 0}
+        raise RuntimeError("检查失败")
+
+    with pytest.raises(RuntimeError):
+        list(interleave_events([failing], workers=1))
+
+
+def test_interleave_close_stops_streams():
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while True:
+                time.sleep(0.01)
+                yield {"type": "status"}
+        finally:
+            closed.set()
+
+    stream = interleave_events([endless], workers=1)
+    next(stream)
+    stream.close()
+    assert closed.wait(2)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+结构感知分块器的单元测试：字符区间、章节路径、表格与块大小
+"""
+from objs.TextChunker import TextChunker, heading_rank
+from utils.token_counter import estimate_tokens
+
+
+PLAN = (
+    "第一章 工程概况\n"
+    "本工程为框架结构办公楼。地上十二层，地下两层。\n"
+    "1.1 编制依据\n"
+    "依据现行施工规范编制。\n"
+    "第二章 施工部署\n"
+    "一、组织机构\n"
+    "项目经理全面负责。技术负责人负责方案审核。\n"
+    "序号\t岗位\t人数\n"
+    "1\t安全员\t2\n"
+)
+
+
+def test_heading_rank_levels():
+    assert heading_rank("第一章 工程概况") == 1
+    assert heading_rank("第二节 施工准备") == 2
+    assert heading_rank("一、组织机构") == 3
+    assert heading_rank("1.1 编制依据") == 5
+    assert heading_rank("（1）材料进场") == 9
+    assert heading_rank("12") is None
+    assert heading_rank("本工程为框架结构。") is None
+
+
+def test_offsets_point_into_original_text():
+    chunks = TextChunker(max_tokens=20, overlap_tokens=5, min_tokens=0).split(PLAN)
+    assert chunks
+    for chunk in chunks:
+        assert PLAN[chunk.start:chunk.end] == chunk.text
+        assert chunk.tokens <= 20 or len(chunk.text) == 1
+
+
+def test_section_paths_follow_headings():
+    chunks = TextChunker(max_tokens=1000, min_tokens=0).split(PLAN)
+    paths = [chunk.section_path for chunk in chunks]
+    assert ["第一章 工程概况"] in paths
+    assert ["第一章 工程概况", "1.1 编制依据"] in paths
+    assert ["第二章 施工部署", "一、组织机构"] in paths
+    # 新章节开始时上一章的子标题出栈
+    assert all("1.1 编制依据" not in path for path in paths if "第二章 施工部署" in path)
+
+
+def test_table_rows_stay_in_one_chunk():
+    chunks = TextChunker(max_tokens=1000, min_tokens=0).split(PLAN)
+    table = [chunk for chunk in chunks if "序号\t岗位" in chunk.text]
+    assert len(table) == 1
+    assert "1\t安全员\t2" in table[0].text
+
+
+def test_long_sentence_is_split_within_budget():
+    text = "混凝土浇筑" * 200 + "。"
+    chunks = TextChunker(max_tokens=50, overlap_tokens=0, min_tokens=0).split(text)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk.text) <= 50 for chunk in chunks)
+    assert "".join(chunk.text for chunk in chunks) == text
+
+
+def test_overlap_repeats_tail_within_section():
+    text = "第一章 概况\n" + "".join(f"第{i}句内容较长需要分块。" for i in range(30))
+    chunks = TextChunker(max_tokens=40, overlap_tokens=15, min_tokens=0).split(text)
+    assert len(chunks) > 2
+    assert any(b.start < a.end for a, b in zip(chunks, chunks[1:]))
+
+
+def test_empty_text():
+    assert TextChunker().split("") == []
+    assert TextChunker().split(" \n ") == []
+
+
+def test_meta_has_offsets_and_path():
+    chunk = TextChunker(min_tokens=0).split(PLAN)[0]
+    assert chunk.to_meta() == {"start": chunk.start, "end": chunk.end, "section_path": chunk.section_path}
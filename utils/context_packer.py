@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+检查提示词的证据打包
+按模型的 token 预算选取检索到的文本块：MMR 去掉与已选内容高度重复的文本块，
+超出预算的文本块跳过，最后按文档顺序排列，使相同证据集合生成相同的提示词
+"""
+from typing import Callable, Dict, List
+
+from utils.token_counter import estimate_tokens
+from config.settings import CONTEXT_CONFIG
+
+
+def context_budget(model: str = None, *fixed_texts: str) -> int:
+    """
+    可用于证据的 token 数：模型的提示词预算减去模板预留和提示词中的其他可变内容
+    （检查情形、引用信息、章节目录项等，通过 fixed_texts 传入）
+    """
+    budget = CONTEXT_CONFIG.model_budgets.get(model or "", CONTEXT_CONFIG.prompt_budget)
+    used = CONTEXT_CONFIG.template_tokens + sum(estimate_tokens(text) for text in fixed_texts if text)
+    return max(CONTEXT_CONFIG.min_evidence_tokens, budget - used)
+
+
+def _shingles(text: str) -> set:
+    """字符二元组集合，用于估计文本块之间的重复程度"""
+    text = "".join(text.split())
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    """把文本截断到预算内"""
+    if budget <= 0:
+        return ""
+    if estimate_tokens(text) <= budget:
+        return text
+    # 先按比例估计截断位置，再逐步收缩
+    end = max(1, int(len(text) * budget / max(estimate_tokens(text), 1)))
+    while end > 1 and estimate_tokens(text[:end]) > budget:
+        end = int(end * 0.9)
+    return text[:end]
+
+
+def pack_chunks(chunks: List[Dict], budget: int, formatter: Callable[[Dict], str] = None,
+                mmr_lambda: float = None, dup_threshold: float = None) -> List[Dict]:
+    """
+    从按相关性排序的检索结果中选取放入提示词的文本块，返回按文档顺序排列的结果。
+    chunks 为 search_similar_chunks 的返回值；formatter 为单个文本块在提示词中的写法，
+    用于计算 token 数。没有任何文本块放得下时截断最相关的一块
+    """
+    if not chunks:
+        return []
+    formatter = formatter or (lambda chunk: chunk.get("text", ""))
+    mmr_lambda = CONTEXT_CONFIG.mmr_lambda if mmr_lambda is None else mmr_lambda
+    dup_threshold = CONTEXT_CONFIG.dup_threshold if dup_threshold is None else dup_threshold
+
+    n = len(chunks)
+    # 检索结果已按相关性排序，按名次给出相关性分数
+    relevance = [(n - rank) / n for rank in range(n)]
+    shingles = [_shingles(chunk.get("text", "")) for chunk in chunks]
+    costs = [estimate_tokens(formatter(chunk)) + 1 for chunk in chunks]
+
+    remaining = list(range(n))
+    selected = []
+    used = 0
+    while remaining:
+        best, best_score, best_overlap = None, None, 0.0
+        for i in remaining:
+            overlap = max((_jaccard(shingles[i], shingles[j]) for j in selected), default=0.0)
+            score = mmr_lambda * relevance[i] - (1 - mmr_lambda) * overlap
+            if best_score is None or score > best_score:
+                best, best_score, best_overlap = i, score, overlap
+        remaining.remove(best)
+        if best_overlap >= dup_threshold:
+            continue
+        if used + costs[best] <= budget:
+            selected.append(best)
+            used += costs[best]
+
+    if not selected:
+        first = dict(chunks[0])
+        overhead = max(0, costs[0] - 1 - estimate_tokens(first.get("text", "")))
+        first["text"] = truncate_tokens(first.get("text", ""), max(1, budget - overhead - 1))
+        first["truncated"] = True
+        return [first]
+
+    # 按文档顺序排列（没有文本块编号时保持相关性顺序）
+    selected.sort(key=lambda i: (chunks[i].get("index", n + i), i))
+    return [chunks[i] for i in selected]
+
+
+def pack_context(chunks: List[Dict], budget: int, formatter: Callable[[Dict], str] = None,
+                 separator: str = "\n") -> str:
+    """选取文本块并拼接为提示词中的证据文本"""
+    formatter = formatter or (lambda chunk: chunk.get("text", ""))
+    return separator.join(formatter(chunk) for chunk in pack_chunks(chunks, budget, formatter))
+
+
+def format_with_similarity(chunk: Dict) -> str:
+    """带相关度的证据写法（结构检查使用）"""
+    return f"相关度{chunk.get('similarity', 0.0):.3f}: {chunk.get('text', '')}"
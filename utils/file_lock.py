@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+跨进程文件锁
+多个 worker 进程共享同一缓存目录时，用于保护文件的“读取-修改-写回”。
+基于 fcntl.flock，同一进程内的不同线程各自打开锁文件，同样互斥；
+没有 fcntl 的平台（Windows）只在进程内加锁
+"""
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# 没有 fcntl 时的进程内锁：锁文件路径 -> 锁
+_local_locks = {}
+_local_locks_lock = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: str):
+    """
+    持有 path 上的排他锁（锁文件不存在时创建，用完不删除）
+    不可重入：持有期间不要再次获取同一把锁
+    """
+    if fcntl is None:
+        with _local_locks_lock:
+            lock = _local_locks.setdefault(path, threading.Lock())
+        with lock:
+            yield
+        return
+
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+延迟导入
+faiss、python-docx、requests 等较重的模块在首次使用时才导入，缩短应用和命令行工具的启动时间
+"""
+import importlib
+import threading
+import types
+
+
+class LazyModule(types.ModuleType):
+    """模块代理：首次访问属性时导入真实模块"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """返回模块代理，模块已导入时直接返回模块本身"""
+    module = importlib.sys.modules.get(name)
+    return module if module is not None else LazyModule(name)
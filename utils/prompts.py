@@ -4,6 +4,7 @@
 Prompt模板文件
 存放所有用于LLM交互的prompt模板
 """
+from config.settings import PROMPT_CONFIG
 
 # ========== 系统角色定义 ==========
 
@@ -39,6 +40,59 @@ def get_batch_check_prompt(check_scenario, category, context):
 - 置信度反映你对判断结果的确信程度
 """
 
+# ========== 前缀缓存友好的批量检查模板 ==========
+# 同一方案的所有检查项共用“系统提示 + 方案概要 + 回答要求”作为前缀，检查项和证据放在最后，
+# 模型服务（vLLM/Ollama 等）的前缀缓存可以复用前缀部分，只需计算每项不同的尾部
+
+BATCH_CHECK_INSTRUCTIONS = """请按以下格式回答：
+1. 合规性判断：[合规/不合规]
+2. 置信度：[0.1-1.0之间的数值]
+3. 判断依据：[详细说明分析过程和依据]
+
+注意：
+- 如果方案中有相关的规定或措施来避免该缺陷，则判断为"合规"
+- 如果方案中明显缺失相关内容或存在问题，则判断为"不合规"
+- 置信度反映你对判断结果的确信程度"""
+
+
+def get_plan_preamble(plan_digest):
+    """同一方案所有检查共用的系统提示（前缀）"""
+    return f"""{CONSTRUCTION_EXPERT_SYSTEM}
+
+【施工方案概要】:
+{plan_digest}
+
+接下来每次会给出一个缺陷情形和检索到的方案相关内容。
+{BATCH_CHECK_INSTRUCTIONS}"""
+
+
+def get_batch_check_suffix(check_scenario, category, context):
+    """前缀布局中每个检查项不同的部分"""
+    return f"""【检查项分类】: {category}
+【缺陷情形】: {check_scenario}
+
+【施工方案相关内容】:
+{context}
+
+请判断方案是否存在"{check_scenario}"的缺陷情形，并按要求的格式回答。"""
+
+
+def get_batch_check_messages(check_scenario, category, context, plan_digest=None, layout=None):
+    """
+    获取批量检查的消息列表
+    layout 为 prefix 且提供了方案概要时使用前缀布局，否则为原有布局；默认取 PROMPT_CONFIG.layout
+    """
+    layout = layout or PROMPT_CONFIG.layout
+    if layout == "prefix" and plan_digest:
+        return [
+            {"role": "system", "content": get_plan_preamble(plan_digest)},
+            {"role": "user", "content": get_batch_check_suffix(check_scenario, category, context)}
+        ]
+    return [
+        {"role": "system", "content": CONSTRUCTION_EXPERT_SYSTEM},
+        {"role": "user", "content": get_batch_check_prompt(check_scenario, category, context)}
+    ]
+
 # ========== 分类场景检查相关模板 ==========
 
 def get_category_check_prompt(category, scenario, context):
@@ -134,6 +188,34 @@ def get_query_prompt(question, context):
 4. 提供相关的补充信息或建议
 """
 
+def get_plan_query_messages(query, context):
+    """方案查询（/ra_check/query 流式输出）的消息"""
+    return [
+        {"role": "system", "content": "你是一个专业的施工方案审核助手。请基于提供的施工方案内容，回答用户的问题。请严格基于提供的施工方案内容进行回答，如果方案中没有相关信息，请明确说明。"},
+        {"role": "user", "content": f"施工方案内容：\n{context}\n\n用户问题：{query}\n\n请基于上述施工方案内容回答用户问题："}
+    ]
+
+def get_stream_query_messages(query, context):
+    """流式RAG查询（/ra_check/stream_query）的消息"""
+    system_prompt = """你是一个专业的施工方案审核助手。请基于提供的施工方案内容，回答用户的问题。
+
+注意事项：
+1. 请严格基于提供的施工方案内容进行回答
+2. 如果方案中没有相关信息，请明确说明
+3. 回答要专业、准确、具体
+4. 可以适当引用方案中的具体条文或数据"""
+
+    user_prompt = f"""施工方案内容：
+{context}
+
+用户问题：{query}
+
+请基于上述施工方案内容回答用户问题："""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
 # ========== 全面审计相关模板 ==========
 
 def get_full_audit_prompt(checklist_items, document_content):
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+异步检查结果的精简回调和分页查询
+summary 回调只携带汇总、结果地址和 ETag，接收方按需通过结果接口分页获取明细；
+结果接口返回 ETag，带 If-None-Match 请求且结果未变化时返回 304
+"""
+import json
+import hashlib
+from typing import Dict, Optional
+
+from flask import jsonify, request
+
+from config.settings import CALLBACK_CONFIG
+
+CALLBACK_MODES = ("full", "summary")
+
+
+def get_callback_mode(value: str = None) -> str:
+    """解析请求中的 callback_mode，未指定或无效时使用 CALLBACK_MODE"""
+    value = (value or "").strip().lower()
+    return value if value in CALLBACK_MODES else CALLBACK_CONFIG.mode
+
+
+def result_etag(result: Dict) -> str:
+    """结果内容的摘要（与结果接口返回的 ETag 一致）"""
+    data = json.dumps(result, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def result_url(path: str) -> str:
+    return f"{CALLBACK_CONFIG.result_base_url}{path}"
+
+
+def compact_result(result: Dict, list_key: str, path: str) -> Dict:
+    """
+    把数据库中保存的检查结果精简为回调数据：保留汇总和标量字段，
+    明细列表替换为项数、结果地址和 ETag
+    """
+    compact = {k: v for k, v in result.items() if k != list_key and not isinstance(v, (list, dict))}
+    compact['summary'] = result.get('summary', {})
+    compact[f'{list_key}_count'] = len(result.get(list_key) or [])
+    compact['result_url'] = result_url(path)
+    compact['etag'] = result_etag(result)
+    compact['page_size'] = CALLBACK_CONFIG.result_page_size
+    return compact
+
+
+def _page_args() -> Optional[tuple]:
+    """请求中的 page/page_size（未指定 page 时返回 None，即不分页）"""
+    page = request.args.get('page', type=int)
+    if page is None:
+        return None
+    page_size = request.args.get('page_size', CALLBACK_CONFIG.result_page_size, type=int)
+    return max(1, page), max(1, min(page_size, CALLBACK_CONFIG.max_result_page_size))
+
+
+def result_response(result: Dict, list_key: str):
+    """
+    结果接口的响应：设置 ETag 并处理 If-None-Match；
+    请求带 page 时只返回该页的明细和分页信息，ETag 始终对应完整结果
+    """
+    data = result
+    page_args = _page_args()
+    if page_args:
+        page, page_size = page_args
+        items = result.get(list_key) or []
+        data = dict(result)
+        data[list_key] = items[(page - 1) * page_size:page * page_size]
+        data['pagination'] = {
+            'page': page,
+            'page_size': page_size,
+            'total': len(items),
+            'pages': (len(items) + page_size - 1) // page_size
+        }
+
+    response = jsonify({
+        'code': 200,
+        'message': 'success',
+        'data': data
+    })
+    response.set_etag(result_etag(result))
+    return response.make_conditional(request)
+
+
+def read_callback_json() -> Optional[Dict]:
+    """读取回调请求的 JSON（支持 gzip 压缩的请求体）"""
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        import gzip
+        try:
+            return json.loads(gzip.decompress(request.get_data()))
+        except (OSError, ValueError):
+            return None
+    return request.get_json(silent=True)
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+流式接口（SSE）输出
+接口的生成器只产出事件字典，由这里统一编码为 SSE 帧。
+coalesced 模式下连续的 token 事件合并后按时间间隔或字节数发送，减少每个 token 一帧的编码和写出开销；
+token 模式保持每个 token 一帧的原有输出
+"""
+import json
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+
+from flask import Response
+
+from config.settings import SSE_CONFIG
+
+STREAM_MODES = ("coalesced", "token")
+
+
+def get_stream_mode(value: str = None) -> str:
+    """解析请求中的 stream_mode，未指定或无效时使用配置的默认模式"""
+    value = (value or "").strip().lower()
+    return value if value in STREAM_MODES else SSE_CONFIG.mode
+
+
+def is_compact(mode: str) -> bool:
+    """coalesced 模式下结束帧只包含前面未发送过的内容（已流式输出的文本不再重复）"""
+    return mode == "coalesced"
+
+
+def get_parallel_items(value=None) -> int:
+    """解析请求中的并行项数，未指定时使用 SSE_PARALLEL_ITEMS，不超过 SSE_MAX_PARALLEL_ITEMS"""
+    try:
+        parallel = int(value) if value not in (None, "") else SSE_CONFIG.parallel_items
+    except (TypeError, ValueError):
+        parallel = SSE_CONFIG.parallel_items
+    return max(1, min(parallel, SSE_CONFIG.max_parallel_items))
+
+
+def format_event(event: Dict, compact: bool = True) -> bytes:
+    """编码一个 SSE 帧；compact 时中文不转义并使用紧凑分隔符，否则与原有的 json.dumps 输出相同"""
+    if compact:
+        data = json.dumps(event, ensure_ascii=False, separators=(",", ":"))
+    else:
+        data = json.dumps(event)
+    return b"data: " + data.encode("utf-8") + b"\n\n"
+
+
+def _token_key(event: Dict):
+    """可以合并的 token 事件：除 content 外其余字段相同"""
+    return tuple(sorted((k, v) for k, v in event.items() if k != "content"))
+
+
+class _Coalescer:
+    """
+    合并 token 事件：距上次发送超过 interval_ms 或某一路累计超过 max_bytes 时发送；
+    其他事件到来前先发送已合并的内容。不同来源（item_index 等字段不同）的 token 分别合并，
+    并行检查交错输出的 token 也能合并，同一来源内顺序不变。
+    调用方按 timeout() 等待下一个事件，超时后调用 flush()，模型停顿期间已合并的内容也按时发送
+    """
+
+    def __init__(self, interval_ms: float = None, max_bytes: int = None):
+        self.interval = (SSE_CONFIG.coalesce_ms if interval_ms is None else interval_ms) / 1000
+        self.max_bytes = SSE_CONFIG.coalesce_bytes if max_bytes is None else max_bytes
+        # 来源 -> [首个事件, 内容片段, 字节数]，按首次出现顺序发送
+        self.pending = {}
+        self.last_flush = time.monotonic()
+
+    def _merged(self, key) -> Dict:
+        event, parts, _ = self.pending.pop(key)
+        merged = dict(event)
+        merged["content"] = "".join(parts)
+        return merged
+
+    def _flush_all(self) -> List[Dict]:
+        out = [self._merged(key) for key in list(self.pending)]
+        self.last_flush = time.monotonic()
+        return out
+
+    def add(self, event: Dict) -> List[Dict]:
+        """加入一个事件，返回现在应发送的事件"""
+        if event.get("type") == "token" and isinstance(event.get("content"), str):
+            key = _token_key(event)
+            entry = self.pending.setdefault(key, [event, [], 0])
+            entry[1].append(event["content"])
+            entry[2] += len(event["content"].encode("utf-8"))
+            if time.monotonic() - self.last_flush >= self.interval:
+                return self._flush_all()
+            if entry[2] >= self.max_bytes:
+                return [self._merged(key)]
+            return []
+        return self._flush_all() + [event]
+
+    def timeout(self) -> Optional[float]:
+        """等待下一个事件的最长秒数，没有待发送内容时为 None（一直等待）"""
+        if not self.pending:
+            return None
+        return max(0.0, self.last_flush + self.interval - time.monotonic())
+
+    def flush(self) -> List[Dict]:
+        """等待超时：发送已合并的内容"""
+        return self._flush_all()
+
+    def finish(self) -> List[Dict]:
+        return self._flush_all()
+
+
+# 后台线程读取的事件流中表示生成器结束
+_STREAM_DONE = object()
+
+
+class _StreamFailure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+# 合并时后台线程读取的事件队列长度，写满时读取线程等待
+COALESCE_QUEUE_SIZE = 256
+
+
+def coalesce_events(events: Iterable[Dict], interval_ms: float = None, max_bytes: int = None) -> Iterator[Dict]:
+    """
+    合并事件流中连续的 token 事件
+    源生成器在后台线程中运行，这里按合并间隔限时等待队列，模型停顿时也能按时发送已合并的内容
+    """
+    coalescer = _Coalescer(interval_ms, max_bytes)
+    source = queue.Queue(maxsize=COALESCE_QUEUE_SIZE)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                source.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        iterator = iter(events)
+        try:
+            for event in iterator:
+                if not put(event):
+                    break
+        except BaseException as e:
+            put(_StreamFailure(e))
+        finally:
+            # 提前停止时关闭源生成器，释放其占用的模型调用名额
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+            put(_STREAM_DONE)
+
+    threading.Thread(target=read, name="sse-coalesce", daemon=True).start()
+    try:
+        while True:
+            try:
+                event = source.get(timeout=coalescer.timeout())
+            except queue.Empty:
+                yield from coalescer.flush()
+                continue
+            if event is _STREAM_DONE:
+                break
+            if isinstance(event, _StreamFailure):
+                yield from coalescer.finish()
+                raise event.error
+            yield from coalescer.add(event)
+        yield from coalescer.finish()
+    finally:
+        stop.set()
+
+
+async def acoalesce_events(events: AsyncIterable[Dict], interval_ms: float = None,
+                           max_bytes: int = None) -> AsyncIterator[Dict]:
+    """coalesce_events 的异步生成器版本（ASGI 模式），限时等待下一个事件而不取消它"""
+    coalescer = _Coalescer(interval_ms, max_bytes)
+    iterator = events.__aiter__()
+    next_event = None
+    try:
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({next_event}, timeout=coalescer.timeout())
+            if not done:
+                for out in coalescer.flush():
+                    yield out
+                continue
+            task, next_event = next_event, None
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                break
+            for out in coalescer.add(event):
+                yield out
+        for out in coalescer.finish():
+            yield out
+    finally:
+        # 客户端断开时取消尚未返回的读取，源生成器随之结束
+        if next_event is not None:
+            next_event.cancel()
+
+
+def sse_stream(events: Iterable[Dict], mode: str = None) -> Iterator[bytes]:
+    """把事件生成器编码为 SSE 字节流"""
+    mode = get_stream_mode(mode)
+    if mode == "coalesced" and SSE_CONFIG.coalesce_ms > 0:
+        events = coalesce_events(events)
+    for event in events:
+        yield format_event(event, is_compact(mode))
+
+
+def interleave_events(streams: List[Callable[[], Iterable[Dict]]], workers: int) -> Iterator[Dict]:
+    """
+    在 workers 个线程中同时运行多个事件生成器，按产生的先后交错输出。
+    生成器异常时在此重新抛出；本生成器被关闭（客户端断开）时通知各线程在下一个事件处停止
+    """
+    events = queue.Queue()
+    stop = threading.Event()
+
+    def run(stream):
+        generator = stream()
+        try:
+            for event in generator:
+                if stop.is_set():
+                    break
+                events.put(event)
+        except BaseException as e:
+            events.put(_StreamFailure(e))
+        finally:
+            # 提前停止时关闭生成器，释放其占用的模型调用名额
+            generator.close()
+            events.put(_STREAM_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="stream-item")
+    try:
+        for stream in streams:
+            executor.submit(run, stream)
+        remaining = len(streams)
+        while remaining:
+            event = events.get()
+            if event is _STREAM_DONE:
+                remaining -= 1
+            elif isinstance(event, _StreamFailure):
+                raise event.error
+            else:
+                yield event
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 流式响应头；X-Accel-Buffering 关闭 nginx 等反向代理的缓冲，合并后的帧立即送达
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'X-Accel-Buffering': 'no',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type'
+}
+
+
+def sse_media_type(mode: str = None) -> str:
+    """token 模式保持原有的 text/plain 类型以兼容旧客户端"""
+    return 'text/event-stream' if get_stream_mode(mode) == "coalesced" else 'text/plain'
+
+
+async def asse_stream(events: AsyncIterable[Dict], mode: str = None) -> AsyncIterator[bytes]:
+    """sse_stream 的异步生成器版本（ASGI 模式）"""
+    mode = get_stream_mode(mode)
+    if mode == "coalesced" and SSE_CONFIG.coalesce_ms > 0:
+        events = acoalesce_events(events)
+    async for event in events:
+        yield format_event(event, is_compact(mode))
+
+
+def sse_response(events: Iterable[Dict], mode: str = None) -> Response:
+    """流式接口的响应"""
+    mode = get_stream_mode(mode)
+    return Response(sse_stream(events, mode), mimetype=sse_media_type(mode), headers=SSE_HEADERS)
@@ -57,6 +57,14 @@ async_structure_check_swagger = {
             'description': '回调接口基础URL，默认为本地测试回调',
             'default': 'http://127.0.0.1:5000'
         },
+        {
+            'name': 'callback_mode',
+            'in': 'formData',
+            'type': 'string',
+            'required': False,
+            'enum': ['full', 'summary'],
+            'description': '成功回调的内容：full 携带完整结果；summary 只携带汇总、result_url 和 etag，明细通过结果接口分页获取。默认由 CALLBACK_MODE 决定'
+        },
         {
             'name': 'openai_api_key',
             'in': 'formData',
@@ -96,6 +104,13 @@ async_structure_check_swagger = {
             'required': False,
             'description': '检索相关文档片段数量',
             'default': 5
+        },
+        {
+            'name': 'base_task_id',
+            'in': 'formData',
+            'type': 'string',
+            'required': False,
+            'description': '基准任务ID（差异复审）。检索证据与基准任务一致的检查项直接复用其结果，不再调用大模型'
         }
     ],
     'responses': {
@@ -231,9 +246,33 @@ get_check_result_swagger = {
             'type': 'string',
             'required': True,
             'description': '任务ID'
+        },
+        {
+            'name': 'page',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': '页码（从 1 开始），不传时返回全部明细'
+        },
+        {
+            'name': 'page_size',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': '每页项数，默认 RESULT_PAGE_SIZE（50）'
+        },
+        {
+            'name': 'If-None-Match',
+            'in': 'header',
+            'type': 'string',
+            'required': False,
+            'description': '上次返回或回调中的 etag，结果未变化时返回 304'
         }
     ],
     'responses': {
+        304: {
+            'description': '结果未变化'
+        },
         200: {
             'description': '检查结果详情',
             'schema': {
@@ -128,6 +128,21 @@ batch_check_swagger = {
             'required': False,
             'default': False,
             'description': '是否使用流式输出返回大模型生成结果'
+        },
+        {
+            'name': 'stream_mode',
+            'in': 'formData',
+            'type': 'string',
+            'enum': ['coalesced', 'token'],
+            'required': False,
+            'description': '流式输出模式：token 每个 token 一帧（原有格式，默认）；coalesced 合并 token 帧、结束帧不重复已输出内容。默认由 SSE_STREAM_MODE 配置'
+        },
+        {
+            'name': 'parallel',
+            'in': 'formData',
+            'type': 'integer',
+            'required': False,
+            'description': '流式输出时同时检查的项数，各项的 token 按 item_index 交错输出，每项完成时发送 item_complete。默认由 SSE_PARALLEL_ITEMS 配置（1 为逐项检查），上限 SSE_MAX_PARALLEL_ITEMS'
         }
     ],
     'responses': {
@@ -212,6 +227,11 @@ query_plan_swagger = {
                         'type': 'boolean',
                         'default': False,
                         'description': '是否使用流式输出返回大模型生成结果'
+                    },
+                    'stream_mode': {
+                        'type': 'string',
+                        'enum': ['coalesced', 'token'],
+                        'description': '流式输出模式：token 每个 token 一帧（原有格式，默认）；coalesced 合并 token 帧、结束帧不重复已输出内容。默认由 SSE_STREAM_MODE 配置'
                     }
                 },
                 'required': ['plan_id', 'query']
@@ -278,6 +298,11 @@ check_category_swagger = {
                         'type': 'boolean',
                         'default': False,
                         'description': '是否使用流式输出返回大模型生成结果'
+                    },
+                    'stream_mode': {
+                        'type': 'string',
+                        'enum': ['coalesced', 'token'],
+                        'description': '流式输出模式：token 每个 token 一帧（原有格式，默认）；coalesced 合并 token 帧、结束帧不重复已输出内容。默认由 SSE_STREAM_MODE 配置'
                     }
                 },
                 'required': ['plan_id', 'category', 'scenario']
@@ -327,6 +352,11 @@ full_audit_swagger = {
                         'type': 'boolean',
                         'default': False,
                         'description': '是否使用流式输出返回大模型生成结果'
+                    },
+                    'stream_mode': {
+                        'type': 'string',
+                        'enum': ['coalesced', 'token'],
+                        'description': '流式输出模式：token 每个 token 一帧（原有格式，默认）；coalesced 合并 token 帧、结束帧不重复已输出内容。默认由 SSE_STREAM_MODE 配置'
                     }
                 },
                 'required': ['plan_id']
@@ -469,6 +499,11 @@ stream_query_swagger = {
                         'type': 'string',
                         'default': 'qwen2.5:32b',
                         'description': 'Ollama模型名称'
+                    },
+                    'stream_mode': {
+                        'type': 'string',
+                        'enum': ['coalesced', 'token'],
+                        'description': '流式输出模式：token 每个 token 一帧（原有格式，默认）；coalesced 合并 token 帧、结束帧不重复已输出内容。默认由 SSE_STREAM_MODE 配置'
                     }
                 },
                 'required': ['plan_id', 'query']
@@ -689,6 +724,61 @@ cleanup_uploads_swagger = {
     }
 }
 
+# 缓存回收API文档
+cache_gc_swagger = {
+    'tags': ['文件管理'],
+    'summary': '回收方案缓存',
+    'description': '立即执行一次缓存回收：删除文件夹已丢失的映射、清理孤立目录，'
+                   '超出容量上限（CACHE_MAX_BYTES）时按最近访问时间淘汰未被任务使用的方案缓存',
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': False,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'dry_run': {
+                        'type': 'boolean',
+                        'default': False,
+                        'description': '只返回将被回收的内容，不实际删除'
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '回收完成',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'status': {'type': 'string'},
+                    'dry_run': {'type': 'boolean'},
+                    'total_bytes': {'type': 'integer'},
+                    'max_bytes': {'type': 'integer'},
+                    'freed_bytes': {'type': 'integer'},
+                    'dangling_mappings': {'type': 'array', 'items': {'type': 'string'}},
+                    'orphans': {'type': 'array', 'items': {'type': 'string'}},
+                    'evicted': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'plan_id': {'type': 'string'},
+                                'original_filename': {'type': 'string'},
+                                'last_access': {'type': 'string'},
+                                'bytes': {'type': 'integer'}
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        500: {'description': '服务器错误'}
+    }
+}
+
 # 引用检查的swagger配置
 cite_check_swagger = {
     'tags': ['施工方案审核'],
@@ -1068,4 +1158,107 @@ structure_check_swagger = {
             }
         }
     }
-} 
\ No newline at end of file
+} 
+# 全局语料检索API文档
+corpus_search_swagger = {
+    'tags': ['施工方案审核'],
+    'summary': '跨方案检索',
+    'description': '在所有已缓存方案的全局索引中检索相关文档片段，可按方案ID或schemeId过滤',
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'query': {
+                        'type': 'string',
+                        'description': '查询内容'
+                    },
+                    'top_k': {
+                        'type': 'integer',
+                        'default': 10,
+                        'description': '返回结果数量'
+                    },
+                    'plan_ids': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                        'description': '只在这些方案ID中检索（可选）'
+                    },
+                    'scheme_ids': {
+                        'type': 'array',
+                        'items': {'type': 'string'},
+                        'description': '只在这些schemeId对应的方案中检索（可选）'
+                    },
+                    'embedding_model': {
+                        'type': 'string',
+                        'default': 'nomic-embed-text:latest',
+                        'description': '嵌入模型名称，需与建索引时一致'
+                    },
+                    'openai_api_key': {
+                        'type': 'string',
+                        'default': 'ollama',
+                        'description': 'OpenAI API密钥'
+                    },
+                    'openai_api_base': {
+                        'type': 'string',
+                        'description': 'OpenAI API基础URL，不传时使用服务端配置的 Ollama 地址'
+                    }
+                },
+                'required': ['query']
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '检索成功',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'status': {'type': 'string'},
+                    'query': {'type': 'string'},
+                    'total_results': {'type': 'integer'},
+                    'results': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'plan_id': {'type': 'string'},
+                                'chunk_idx': {'type': 'integer'},
+                                'scheme_id': {'type': 'string'},
+                                'document': {'type': 'string'},
+                                'similarity': {'type': 'number'},
+                                'text': {'type': 'string'}
+                            }
+                        }
+                    }
+                }
+            }
+        },
+        400: {'description': '请求错误'},
+        500: {'description': '服务器错误'}
+    }
+}
+
+# 全局索引同步API文档
+corpus_index_sync_swagger = {
+    'tags': ['施工方案审核'],
+    'summary': '同步全局索引',
+    'description': '将全局索引与文件映射对齐：补充缺失的方案，移除已删除的方案',
+    'responses': {
+        200: {
+            'description': '同步成功',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'status': {'type': 'string'},
+                    'added': {'type': 'integer'},
+                    'removed': {'type': 'integer'},
+                    'index_stats': {'type': 'object'}
+                }
+            }
+        },
+        500: {'description': '服务器错误'}
+    }
+}
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+快速 token 数估算
+用于文本分块和提示词长度控制，不依赖具体模型的分词器
+"""
+import re
+
+# 中日韩字符（含全角标点）
+_CJK_RE = re.compile(r'[　-〿一-鿿＀-￯]')
+# 连续的英文字母或数字
+_WORD_RE = re.compile(r'[A-Za-z]+|\d+')
+# 其余非空白字符（半角标点等）
+_OTHER_RE = re.compile(r'[^\sA-Za-z\d　-〿一-鿿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+    中文字符按每字 1 个 token 计，英文单词按每 4 个字母 1 个 token 计（至少 1 个），
+    数字按每 3 位 1 个 token 计，其余标点各计 1 个。对 Qwen / GPT 类分词器偏保守
+    """
+    if not text:
+        return 0
+    count = len(_CJK_RE.findall(text))
+    for word in _WORD_RE.findall(text):
+        count += (len(word) + 2) // 3 if word.isdigit() else (len(word) + 3) // 4
+    count += len(_OTHER_RE.findall(text))
+    return count